@@ -0,0 +1,479 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Autosave journal of open documents for the recovery after a crash.
+
+Every open document has a journal file in the autosave directory. It starts
+with the document as saved (the JCAMP-DX file or the project bundle it was
+opened from or saved to, the base) and documentJournal.update appends one
+record with the changes since the last update: the changed spectra (the x
+and y values only if they were replaced), page settings, the document title
+and the order of the pages and spectra. The changes are found by the
+modified flags, so an update costs time in proportion to the changes, not
+to the size of the document. Pages not decoded so far are recorded by
+their JCAMP-DX blocks (file, offset and length), without decoding them.
+The records are written by a background thread.
+
+The journal is started again when the document is saved and removed when
+the document is closed. Journals left over by a crashed session are found
+by getJournals and replayed onto their base by recoverDocument.
+
+The autosave directory ("Autosave Directory"), the interval in seconds
+("Autosave Interval") and whether the journal is used at all ("Use
+Autosave") are read from the settings of pySpective.
+"""
+
+import os
+import json
+import uuid
+import datetime
+import concurrent.futures
+
+import numpy as np
+from PyQt6.QtCore import QSettings, QStandardPaths
+
+import spectrum
+import spectratypes
+import spectivedocument
+
+# default interval between two updates of the journals in seconds
+defaultInterval = 60
+
+journalExtension = ".journal"
+
+journalFormat = "pySpective Autosave Journal"
+
+def getSettings():
+    return QSettings('TUBAF', 'pySpective')
+
+def isEnabled():
+    return getSettings().value("Use Autosave", True, type=bool)
+
+def getInterval():
+    return int(getSettings().value("Autosave Interval", defaultInterval))
+
+def getJournalDir():
+    journalDir = getSettings().value("Autosave Directory")
+    if not journalDir:
+        journalDir = os.environ.get("XDG_DATA_HOME") or QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericDataLocation)
+        journalDir = os.path.join(journalDir, "pySpective", "autosave")
+    return journalDir
+
+def isProcessRunning(pid):
+    # only POSIX can test a process without touching it, elsewhere every journal is offered
+    if os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+class documentJournal:
+    def __init__(self, document, journalDir=None):
+        """
+        Creates the journal of a document, see start.
+
+        Parameters
+        ----------
+        document : spectiveDocument
+        journalDir : String, optional
+            The autosave directory. The default is None, see getJournalDir.
+
+        """
+        self.document = document
+        if not journalDir:
+            journalDir = getJournalDir()
+        self.fileName = os.path.join(journalDir, uuid.uuid4().hex + journalExtension)
+        self.writer = concurrent.futures.ThreadPoolExecutor(max_workers=1) # keeps the order of the records
+        self.pending = None # the last record submitted to the writer
+        self.start()
+
+    def start(self, baseType=None):
+        """
+        Starts the journal again with the document as base, e.g. after it
+        has been saved. An unmodified document with a file is the base
+        itself; of all other documents, the whole content is written by the
+        next update (pages not decoded so far by their blocks).
+
+        Parameters
+        ----------
+        baseType : String, optional
+            "JCAMP-DX" or "Bundle", the file the document has been saved to.
+            The default is None, the bundle for documents without JCAMP-DX
+            file, like the save action of the main window.
+
+        """
+        document = self.document
+        if baseType is None:
+            baseType = "Bundle" if document.bundleName and not document.fileName else "JCAMP-DX"
+        self.pageKeys = {} # id(page) -> (page, key)
+        self.spectrumKeys = {} # id(spectrum) -> (spectrum, key)
+        self.basePages = {} # id(page) -> index of the base pages whose spectra have no keys so far
+        self.written = {} # key -> what has been written of a page or spectrum
+        self.structure = None
+        self.counter = 0
+        base = None
+        if not document.isModified():
+            if baseType == "Bundle" and document.bundleName:
+                base = {"Type": "Bundle", "File Name": os.path.abspath(document.bundleName),
+                        "Identity": spectivedocument.getFileIdentity(os.path.join(document.bundleName, "document.json"))}
+            elif baseType == "JCAMP-DX" and document.fileName and document.fileName.endswith(".dx") and os.path.exists(document.fileName):
+                base = {"Type": "JCAMP-DX", "File Name": os.path.abspath(document.fileName),
+                        "Identity": spectivedocument.getFileIdentity(document.fileName)}
+        if base:
+            # the pages and spectra of the base are named by their position
+            for p, page in enumerate(document.pages):
+                self.pageKeys[id(page)] = (page, str(p))
+                if page.isLoaded():
+                    for i, s in enumerate(page._spectra):
+                        self.addBaseSpectrum(s, p, i, s.x, s.y)
+                else:
+                    self.basePages[id(page)] = p
+            base["Pages"] = len(document.pages)
+        header = {
+            "Format": journalFormat,
+            "Version": 1,
+            "Title": document.title,
+            "Time": datetime.datetime.now().isoformat(),
+            "Process": os.getpid(),
+            "Base": base}
+        self.submit(header, [], "wb")
+
+    def addBaseSpectrum(self, s, p, i, x, y):
+        # the i-th spectrum of page p of the base with the x and y values in the base
+        key = str(p) + "." + str(i)
+        self.spectrumKeys[id(s)] = (s, key)
+        self.written[key] = (x, y, None)
+
+    def newKey(self):
+        self.counter += 1
+        return "n" + str(self.counter)
+
+    def getPageKey(self, page):
+        known = self.pageKeys.get(id(page))
+        if known and known[0] is page:
+            return known[1]
+        key = self.newKey()
+        self.pageKeys[id(page)] = (page, key)
+        return key
+
+    def update(self):
+        """
+        Appends the changes since the last update to the journal. Only the
+        changes are collected here, they are written in the background.
+
+        Returns
+        -------
+        bool
+            True if there were changes to write.
+
+        """
+        document = self.document
+        if not document.isModified():
+            return False
+        spectra = []
+        pages = []
+        arrays = []
+        structure = []
+
+        def addArray(values):
+            arrays.append(values)
+            return len(arrays) - 1
+
+        # the pages and spectra not in the document any longer are forgotten
+        pageKeys = {}
+        spectrumKeys = {}
+        for page in document.pages:
+            pageKey = self.getPageKey(page)
+            pageKeys[id(page)] = (page, pageKey)
+            if id(page) in self.basePages and page.isLoaded():
+                # decoded since the start, the spectra of the base are named by their position in the file
+                p = self.basePages.pop(id(page))
+                for i, (spectrumRef, xRef, yRef) in enumerate(page.decodedSpectra):
+                    s = spectrumRef()
+                    if s is not None:
+                        self.addBaseSpectrum(s, p, i, xRef(), yRef())
+            if id(page) in self.basePages:
+                structure.append([pageKey, None]) # not decoded, as in the base
+            elif not page.isLoaded():
+                # not decoded so far (e.g. opened as page after the start), the journal refers to the blocks in their files
+                structure.append([pageKey, {"Blocks": [list(block) for block in page.pendingBlocks]}])
+            else:
+                pageSpectra = []
+                for s in page.spectra:
+                    known = self.spectrumKeys.get(id(s))
+                    if known and known[0] is s:
+                        key = known[1]
+                        if not s.modified:
+                            spectrumKeys[id(s)] = known
+                            pageSpectra.append(key)
+                            continue
+                    else:
+                        key = self.newKey()
+                    spectrumKeys[id(s)] = (s, key)
+                    attributes = {name: value for name, value in vars(s).items() if name not in ("x", "y", "modified")}
+                    try:
+                        text = json.dumps(attributes, default=spectivedocument.encodeBundleValue)
+                    except (TypeError, ValueError) as e:
+                        print("Could not autosave " + s.title + ": " + str(e))
+                        pageSpectra.append(key)
+                        continue
+                    last = self.written.get(key)
+                    if not last or last[0] is not s.x or last[1] is not s.y or last[2] != text:
+                        record = {"Key": key, "Class": type(s).__name__, "Attributes": text}
+                        if not last or last[0] is not s.x:
+                            record["X"] = addArray(s.x)
+                        if not last or last[1] is not s.y:
+                            record["Y"] = addArray(s.y)
+                        spectra.append(record)
+                        self.written[key] = (s.x, s.y, text)
+                    pageSpectra.append(key)
+                structure.append([pageKey, pageSpectra])
+            if page.modified:
+                text = json.dumps({"Title": page.title, "Figure Data": page.figureData}, default=spectivedocument.encodeBundleValue)
+                if self.written.get(pageKey) != text:
+                    pages.append({"Key": pageKey, "Page": text})
+                    self.written[pageKey] = text
+        # spectra of pages not decoded so far are kept, they get their keys when the page is decoded
+        keys = set(key for page, key in pageKeys.values()) | set(key for s, key in spectrumKeys.values()) | {""}
+        self.written = {key: value for key, value in self.written.items() if key in keys}
+        self.pageKeys = pageKeys
+        self.spectrumKeys = spectrumKeys
+        self.basePages = {key: p for key, p in self.basePages.items() if key in pageKeys}
+        record = {"Time": datetime.datetime.now().isoformat()}
+        if spectra:
+            record["Spectra"] = spectra
+        if pages:
+            record["Pages"] = pages
+        if document.modified:
+            text = json.dumps({"Title": document.title, "Compress": document.compress})
+            if self.written.get("") != text:
+                record["Document"] = text
+                self.written[""] = text
+        if structure != self.structure:
+            record["Structure"] = structure
+            self.structure = structure
+        if len(record) == 1:
+            return False
+        self.submit(record, arrays, "ab")
+        return True
+
+    def submit(self, record, arrays, mode):
+        self.pending = self.writer.submit(writeRecord, self.fileName, record, arrays, mode)
+
+    def wait(self):
+        # waits until all records are written
+        if self.pending:
+            try:
+                self.pending.result()
+            except OSError as e:
+                print("Could not write the autosave journal " + self.fileName + ": " + str(e))
+
+    def close(self):
+        """
+        Removes the journal, e.g. when the document is closed.
+        """
+        self.wait()
+        self.writer.shutdown()
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
+
+def writeRecord(fileName, record, arrays, mode):
+    """
+    Writes one record: a line of JSON with the dtype and shape of the arrays,
+    followed by the bytes of the arrays. This runs in the writer thread.
+    """
+    arrays = [np.ascontiguousarray(values) for values in arrays]
+    record["Arrays"] = [[values.dtype.str, values.shape] for values in arrays]
+    line = json.dumps(record).encode("utf-8") + b"\n"
+    os.makedirs(os.path.dirname(fileName), exist_ok=True)
+    with open(fileName, mode) as f:
+        f.write(line)
+        for values in arrays:
+            f.write(values.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+def readRecords(fileName):
+    """
+    Reads the records of a journal. A record which is not complete (the
+    session crashed while it was written) ends the journal.
+
+    Returns
+    -------
+    list
+        (record, list of arrays) for every record, the header first.
+
+    """
+    records = []
+    with open(fileName, "rb") as f:
+        while True:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+                arrays = []
+                for dtype, shape in record["Arrays"]:
+                    dtype = np.dtype(dtype)
+                    size = int(np.prod(shape)) * dtype.itemsize
+                    data = f.read(size)
+                    if len(data) < size:
+                        raise ValueError("incomplete record")
+                    arrays.append(np.frombuffer(data, dtype=dtype).reshape(shape))
+            except (ValueError, KeyError, TypeError):
+                break
+            records.append((record, arrays))
+    return records
+
+def getJournals(journalDir=None):
+    """
+    Returns the journals left over by sessions which have not been closed,
+    e.g. after a crash.
+
+    Returns
+    -------
+    list
+        (fileName, header) for every journal, the header has the title of
+        the document, the time the journal was started and its base.
+
+    """
+    if not journalDir:
+        journalDir = getJournalDir()
+    if not os.path.isdir(journalDir):
+        return []
+    journals = []
+    for entry in os.scandir(journalDir):
+        if not entry.name.endswith(journalExtension):
+            continue
+        try:
+            with open(entry.path, "rb") as f:
+                header = json.loads(f.readline())
+        except (OSError, ValueError):
+            continue
+        if header.get("Format") != journalFormat or isProcessRunning(header.get("Process", -1)):
+            continue
+        journals.append((entry.path, header))
+    return journals
+
+def openBase(base):
+    # opens the document as it was when the journal was started
+    if not base:
+        return spectivedocument.spectiveDocument()
+    if spectivedocument.getFileIdentity(base["File Name"] if base["Type"] == "JCAMP-DX" else os.path.join(base["File Name"], "document.json")) != tuple(base["Identity"]):
+        print(base["File Name"] + " has been changed since the autosave, the changes are applied to the new version")
+    if base["Type"] == "Bundle":
+        return spectivedocument.openBundle(base["File Name"])
+    fileName = base["File Name"]
+    blocks = spectrum.getJCAMPblockIndex(fileName)
+    title = os.path.basename(fileName)
+    numPages = 1
+    if len(blocks) > 1:
+        # the last block is the LINK block
+        linkTitle, offset, length = blocks.pop()
+        linkBlock = spectrum.loadJCAMPlinkBlock(spectrum.readJCAMPblock(fileName, offset, length))
+        title = linkBlock['Title']
+        numPages = linkBlock['Pages'] if 'Pages' in linkBlock else linkBlock['Blocks'] - 1
+    document = spectivedocument.spectiveDocument(title)
+    document.fileName = fileName
+    for i in range(numPages):
+        document.addPage()
+    document.addJCAMPblocks(fileName, blocks)
+    return document
+
+def recoverDocument(fileName):
+    """
+    Opens the base of a journal and applies the changes of its records.
+
+    Returns
+    -------
+    spectiveDocument or None
+        The recovered document (modified, not saved so far), None if the
+        journal or its base can not be opened.
+
+    """
+    try:
+        records = readRecords(fileName)
+        if not records or records[0][0].get("Format") != journalFormat:
+            raise ValueError("not an autosave journal")
+        header = records[0][0]
+        document = openBase(header["Base"])
+        if document is None:
+            raise ValueError("the base of the journal can not be opened")
+        basePages = list(document.pages)
+        baseSpectra = {} # index of a base page -> its spectra before any change
+        pages = {str(p): page for p, page in enumerate(basePages)}
+        spectra = {}
+
+        def getBaseSpectra(p):
+            if p not in baseSpectra:
+                baseSpectra[p] = list(basePages[p].spectra)
+            return baseSpectra[p]
+
+        def getSpectrum(key):
+            if key not in spectra:
+                p, i = key.split(".")
+                spectra[key] = getBaseSpectra(int(p))[int(i)]
+            return spectra[key]
+
+        def getPageSpectra(spectrumKeys):
+            # the spectra of a page of the structure, None for a page as in the base and the blocks of a page not decoded
+            if spectrumKeys is None or isinstance(spectrumKeys, dict):
+                return spectrumKeys
+            return [getSpectrum(key) for key in spectrumKeys]
+
+        def getPage(key):
+            if key not in pages:
+                pages[key] = spectivedocument.spectivePage()
+            return pages[key]
+
+        for record, arrays in records[1:]:
+            for spectrumData in record.get("Spectra", []):
+                key = spectrumData["Key"]
+                if key in spectra or "." in key:
+                    s = getSpectrum(key)
+                else:
+                    spectrumClass = getattr(spectratypes, spectrumData["Class"], None) or getattr(spectrum, spectrumData["Class"], None)
+                    if not isinstance(spectrumClass, type) or not issubclass(spectrumClass, spectrum.Spectrum):
+                        raise ValueError("unknown spectrum type " + spectrumData["Class"])
+                    s = spectra[key] = spectrumClass()
+                s.__dict__.update(json.loads(spectrumData["Attributes"], object_hook=spectivedocument.decodeBundleValue))
+                if "X" in spectrumData:
+                    s.x = arrays[spectrumData["X"]]
+                if "Y" in spectrumData:
+                    s.y = arrays[spectrumData["Y"]]
+            for pageData in record.get("Pages", []):
+                page = getPage(pageData["Key"])
+                data = json.loads(pageData["Page"], object_hook=spectivedocument.decodeBundleValue)
+                page.title = data["Title"]
+                page.figureData = data["Figure Data"]
+            if "Document" in record:
+                data = json.loads(record["Document"])
+                document.title = data["Title"]
+                document.compress = data["Compress"]
+            if "Structure" in record:
+                # all spectra are looked up before the pages are changed
+                structure = [(getPage(pageKey), getPageSpectra(spectrumKeys)) for pageKey, spectrumKeys in record["Structure"]]
+                document.pages = []
+                for page, pageSpectra in structure:
+                    if isinstance(pageSpectra, dict):
+                        # a page not decoded, its blocks are decoded when the page is needed
+                        page._spectra = []
+                        page.pendingBlocks = [(fileName, offset, length, tuple(identity) if identity else None, index, title) for fileName, offset, length, identity, index, title in pageSpectra["Blocks"]]
+                    elif pageSpectra is not None:
+                        page._spectra = pageSpectra
+                        if page.currentSpectrum not in pageSpectra:
+                            page.currentSpectrum = pageSpectra[0] if pageSpectra else None
+                    document.pages.append(page)
+    except (OSError, KeyError, IndexError, TypeError, ValueError) as e:
+        print("Could not recover " + fileName + ": " + str(e))
+        return None
+    if not document.pages:
+        document.addPage()
+    document.currentPage = document.pages[0]
+    document.currentPage.loadSpectra()
+    document.setModified(True)
+    return document
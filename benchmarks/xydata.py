@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing of the ##XYDATA decoding of Spectrum.openJCAMPDXfromString.
+
+A synthetic IR block (AFFN, 10 y values per line) is parsed with and without
+##NPOINTS= and the points decoded per second of the whole block parse are
+printed. To compare with another version of the parser, give the path of its
+spectrum.py, e.g. the version before the vectorized decoding:
+
+    git show 08b34ed:spectrum.py > /tmp/spectrum_old.py
+    python benchmarks/xydata.py /tmp/spectrum_old.py
+"""
+
+import os
+import sys
+import time
+import importlib.util
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def loadSpectrumModule(path=None):
+    if path is None:
+        import spectrum
+        return spectrum
+    spec = importlib.util.spec_from_file_location("spectrum_compared", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def makeBlock(npoints, withNPoints=True, valuesPerLine=10):
+    x = np.linspace(4000, 400, npoints)
+    y = np.round(np.random.default_rng(0).random(npoints) * 10000)
+    lines = ["##TITLE=benchmark", "##JCAMP-DX=4.24", "##DATA TYPE=INFRARED SPECTRUM", "##XUNITS=1/CM", "##YUNITS=TRANSMITTANCE",
+             "##DATE=23/04/08", "##TIME=11:13:34", "##XFACTOR=1", "##YFACTOR=0.0001", "##FIRSTX=" + str(x[0]), "##LASTX=" + str(x[-1])]
+    if withNPoints:
+        lines.append("##NPOINTS=" + str(npoints))
+    lines.append("##XYDATA=(X++(Y..Y))")
+    for i in range(0, npoints, valuesPerLine):
+        lines.append("%.6f " % x[i] + " ".join("%d" % v for v in y[i:i+valuesPerLine]))
+    lines.append("##END=")
+    return "\n".join(lines) + "\n"
+
+def timeParse(module, s, repeat=3):
+    best = None
+    for i in range(repeat):
+        sp = module.Spectrum()
+        start = time.perf_counter()
+        sp.openJCAMPDXfromString(s)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+if __name__ == "__main__":
+    modules = [("current", loadSpectrumModule())]
+    if len(sys.argv) > 1:
+        modules.insert(0, (sys.argv[1], loadSpectrumModule(sys.argv[1])))
+    for withNPoints in (True, False):
+        for npoints in (50000, 500000):
+            s = makeBlock(npoints, withNPoints)
+            rates = ["%.2f" % (npoints / timeParse(module, s) / 1e6) for name, module in modules]
+            print("NPOINTS %s, %d points: %s Mpts/s" % ("given" if withNPoints else "missing", npoints, " -> ".join(rates)))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Background import of files, so large text files do not block the window.
+
+The file is opened by readers.openFile in a worker thread. Readers with
+progress (the text reader) read the file in chunks and report the
+characters read and the points parsed after every chunk; the thread sends
+them to the window with the progressChanged signal. The import is cancelled
+at the next chunk after cancel is called.
+"""
+
+import os
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+import readers
+import sourcefile
+
+class importThread(QThread):
+    # done, total (0 if unknown, e.g. for compressed files), points
+    progressChanged = pyqtSignal("qint64", "qint64", "qint64")
+
+    def __init__(self, fileName, fileType=None, options=None, parent=None):
+        super().__init__(parent)
+        self.fileName = fileName
+        self.fileType = fileType
+        self.options = options
+        self.spectra = []
+        self.cancelled = False
+        # the characters read are compared with the size of the file, only known for uncompressed files
+        self.total = 0
+        if sourcefile.isPlainFile(fileName):
+            self.total = os.path.getsize(fileName)
+
+    def run(self):
+        self.spectra = readers.openFile(self.fileName, self.fileType, self.options, self.progress)
+
+    def progress(self, done, points):
+        self.progressChanged.emit(min(done, self.total) if self.total else done, self.total, points)
+        return not self.cancelled
+
+    def cancel(self):
+        self.cancelled = True
@@ -27,6 +27,8 @@ from PyQt6.QtWidgets import (
 import json
 import os.path
 
+import readers
+
 class openDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -50,7 +52,7 @@ class openDialog(QDialog):
         self.layout.addWidget(self.openFileButton, 0, 3)
         self.layout.addWidget(QLabel(self.tr("File Type: ")), 1, 0)
         self.fileTypeCombo = QComboBox(self)
-        self.fileTypeCombo.addItems(["JCAMP-DX", "Any Text Format", "MCA - DESY XRF File Format", "pyXrfa-JSON", "AMETEK-XRF TXT-Export", "Bruker XRD RAW4"])
+        self.fileTypeCombo.addItems(["Auto Detect"] + readers.getFileTypes())
         self.fileTypeCombo.currentTextChanged.connect(self.changeFileType)
         self.layout.addWidget(self.fileTypeCombo, 1,1)
         
@@ -92,12 +94,18 @@ class openDialog(QDialog):
         self.skipRows.setValue(0)
         self.settingsLayout.addWidget(self.skipRows, 5, 1)
         
+        # files with one x column and many y columns, e.g. time series
+        self.settingsLayout.addWidget(QLabel(self.tr("Y Columns:")), 6, 0)
+        self.yColumnsCombo = QComboBox(self)
+        self.yColumnsCombo.addItems(["first", "all, one page per column", "all on one page"])
+        self.settingsLayout.addWidget(self.yColumnsCombo, 6, 1)
+        
         self.settingsSaveButton = QPushButton(self.tr("Save Config"), self)
         self.settingsSaveButton.clicked.connect(self.saveSettings)
-        self.settingsLayout.addWidget(self.settingsSaveButton, 6, 0)
+        self.settingsLayout.addWidget(self.settingsSaveButton, 7, 0)
         self.settingsLoadButton = QPushButton(self.tr("Load Config"), self)
         self.settingsLoadButton.clicked.connect(self.loadSettings)
-        self.settingsLayout.addWidget(self.settingsLoadButton, 6, 1)
+        self.settingsLayout.addWidget(self.settingsLoadButton, 7, 1)
         
         self.layout.addWidget(self.freeTextFileSettings, 2, 0, 1, 3)
         
@@ -127,6 +135,7 @@ class openDialog(QDialog):
             self.columnDelimiterCombo.setCurrentText(freeTextSettings["Column Delimiter"])
             self.decimalSeparatorCombo.setCurrentText(freeTextSettings["Decimal Separator"])
             self.skipRows.setValue(freeTextSettings["skip Rows"])
+            self.yColumnsCombo.setCurrentText(freeTextSettings.get("Y Columns", "first"))
     
     def getFileName(self):
         if self.settings.value("lastOpenDir"):
@@ -135,30 +144,15 @@ class openDialog(QDialog):
             fileName, filterType = QFileDialog.getOpenFileName(None, "Open spectrum", QDir.homePath(), self.tr("JCAMP-DX File (*.dx *jdx);; Any Type (*);;MCA - DESY XRF File Format (*.mca);;pyXrfa-JSON (*.json);; AMETEK-XRF Export (*.txt);;Bruker XRD RAW4(*.raw)"))
         if fileName:
             self.fileNameLabel.setText(fileName)
-            if filterType == "Any Type (*)":
-                self.fileTypeCombo.setCurrentText(self.tr("Any Text Format"))
-                self.freeTextFileSettings.setVisible(True)
-            elif filterType == "JCAMP-DX File (*.dx *jdx)":
-                self.fileTypeCombo.setCurrentText("JCAMP-DX")
-                self.freeTextFileSettings.setVisible(False)
-            elif filterType == "MCA - DESY XRF File Format (*.mca)":
-                self.fileTypeCombo.setCurrentText("MCA - DESY XRF File Format")
-                self.freeTextFileSettings.setVisible(False)
-            elif filterType == "pyXrfa-JSON (*.json)":
-                self.fileTypeCombo.setCurrentText("pyXrfa-JSON")
-                self.freeTextFileSettings.setVisible(False)
-            elif filterType == "AMETEK-XRF Export (*.txt)":
-                self.fileTypeCombo.setCurrentText("AMETEK-XRF TXT-Export")
-                self.freeTextFileSettings.setVisible(False)
-            elif filterType == "Bruker XRD RAW4(*.raw)":
-                self.fileTypeCombo.setCurrentText("Bruker XRD RAW4")
-                self.freeTextFileSettings.setVisible(False)
+            # the format is detected from the beginning of the file, not from the chosen filter
+            fileType = readers.detectFileType(fileName)
+            if fileType:
+                self.fileTypeCombo.setCurrentText(fileType)
+            else:
+                self.fileTypeCombo.setCurrentText("Auto Detect")
     
     def changeFileType(self, s):
-        if s == "JCAMP-DX":
-            self.freeTextFileSettings.setVisible(False)
-        elif s == "Any Text Format":
-            self.freeTextFileSettings.setVisible(True)
+        self.freeTextFileSettings.setVisible(s == "Any Text Format")
     
     def saveSettings(self):
         freeTextSettings = {}
@@ -168,6 +162,7 @@ class openDialog(QDialog):
         freeTextSettings["Column Delimiter"] = self.columnDelimiterCombo.currentText()
         freeTextSettings["Decimal Separator"] = self.decimalSeparatorCombo.currentText()
         freeTextSettings["skip Rows"] = self.skipRows.value()
+        freeTextSettings["Y Columns"] = self.yColumnsCombo.currentText()
         
         baseDir = self.settings.value("lastFreeTextSettingsDir")
         if not baseDir:
@@ -197,6 +192,7 @@ class openDialog(QDialog):
             self.columnDelimiterCombo.setCurrentText(freeTextSettings["Column Delimiter"])
             self.decimalSeparatorCombo.setCurrentText(freeTextSettings["Decimal Separator"])
             self.skipRows.setValue(freeTextSettings["skip Rows"])
+            self.yColumnsCombo.setCurrentText(freeTextSettings.get("Y Columns", "first"))
     
     def setOpenOptions(self, cDoc, cPage):
         self.openAsPageRadio.setEnabled(False)
@@ -218,6 +214,7 @@ class openDialog(QDialog):
         freeTextSettings["Column Delimiter"] = self.columnDelimiterCombo.currentText()
         freeTextSettings["Decimal Separator"] = self.decimalSeparatorCombo.currentText()
         freeTextSettings["skip Rows"] = self.skipRows.value()
+        freeTextSettings["Y Columns"] = self.yColumnsCombo.currentText()
         
         data['Free Text Settings'] = freeTextSettings
         
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Drawing of pages into matplotlib figures, used by the plot of the window
+(specplot) and by the export of many pages to image files.
+
+The export renders the pages with the Agg backend, without the canvas of
+the window, in a pool of worker processes: one file per page (PNG, SVG, PDF
+or any other format matplotlib supports). A multi-page PDF is written by
+one process, as the pages of one file can not be written in parallel.
+"""
+
+import os
+import json
+import concurrent.futures
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.patches import Polygon
+from PyQt6.QtCore import QSettings
+
+import spectratypes
+import processpool
+
+# size of the figures in inches, as the plot of the window
+figureSize = (10, 6)
+
+# fewer pages are exported by this process, starting the workers takes longer
+minPagesForPool = 4
+
+def getElementLines():
+    # the XRF element lines of the settings, the default lines if not set
+    elementLines = QSettings('TUBAF', 'pySpective').value("XRFElementLines")
+    if not elementLines:
+        with open("ElementLines.json") as f:
+            elementLines = json.load(f)
+    return elementLines
+
+def drawPage(figure, spectra, figureData, elementLines):
+    """
+    Draws the spectra of a page into a figure, replacing its content.
+
+    Parameters
+    ----------
+    figure : matplotlib Figure
+    spectra : list
+        The spectra of the page.
+    figureData : dict
+        The figure data of the page (limits, labels, ...).
+    elementLines : dict
+        The XRF element lines, see getElementLines.
+
+    Returns
+    -------
+    tuple
+        The axes and the second y axis (derivatives), None if not used.
+
+    """
+    figure.clear()
+    ax = figure.subplots()
+    ax2 = None
+    for spec in spectra:
+        if spec.color == '':
+            spec.color = "#0064a8"
+        if spec.yaxis > 0:
+            if ax2 is None:
+                ax2 = ax.twinx()
+                ax2.set_ylabel("derivative")
+            ax2.plot(spec.x, spec.y, spec.markerStyle + spec.lineStyle, color=spec.color, label=spec.title)
+            if len(spec.peaks) > 0:
+                ax2.plot(spec.x[spec.peaks], spec.y[spec.peaks], "+", color=spec.peakParameter['Color'], label="_Hidden")
+        else:
+            ax.plot(spec.x, spec.y, spec.markerStyle + spec.lineStyle, color=spec.color, label=spec.title)
+            if len(spec.peaks) > 0:
+                ax.plot(spec.x[spec.peaks], spec.y[spec.peaks], "+", color=spec.peakParameter['Color'], label="_Hidden")
+            for i in spec.integrals:
+                x1, x2 = spec.getIntegrationRangeByIndex(i['x1'], i['x2'])
+                poly = Polygon([*zip(spec.x[x1:x2], spec.y[x1:x2])], color=i['color'])
+                ax.add_patch(poly)
+        if type(spec).__name__ == 'powderXRD':
+            currentYlim = ax.get_ylim()
+            ymin = currentYlim[0]
+            for ref in spec.references:
+                if not ref['Display'] or ref['Display'] == "do not display":
+                    spec.ylim[0] = np.min(spec.y)
+                    ax.set_ylim(spec.ylim[0], currentYlim[1]) # remove space under the graph if no references are present
+                    figureData['fullYLim'][0] = spec.ylim[0]
+                elif ref['Display'] == 'display without intenities':
+                    if currentYlim[0] >= 0:
+                        ymin = -(spec.ylim[1] - spec.ylim[0])/10
+                        ax.set_ylim(ymin, currentYlim[1])
+                        spec.ylim[0] = ymin
+                        figureData['fullYLim'][0] = ymin
+                    ax.vlines(ref['x'], ymin, 0, colors=ref['Color'], label=ref['Title'])
+                elif ref['Display'] == 'display with intensity':
+                    # dispaly reference with intensity
+                    maxY = max(ref['y'])
+                    maxIndex = ref['y'].index(maxY)
+                    XatMaxY = ref['x'][maxIndex]
+                    measuredY = 1
+                    # suche nach dem am Messwert möglichst nahe am Theoriewert
+                    for idx in range(1, len(spec.x)):
+                        if XatMaxY > spec.x[idx - 1] and XatMaxY < spec.x[idx]:
+                            m = (spec.y[idx] - spec.y[idx-1])/(spec.x[idx] - spec.x[idx-1])
+                            n = -m * spec.x[idx] + spec.y[idx]
+                            measuredY = m * XatMaxY + n
+                            break
+                        elif XatMaxY == spec.x[idx - 1]:
+                            measuredY = spec.y[idx - 1]
+                            break
+                        elif XatMaxY == spec.x[idx]:
+                            measuredY = spec.y[idx]
+                            break
+
+                    minHeight = 0.1 * np.max(spec.y)
+                    if measuredY < minHeight:
+                        print("rescaled")
+                        measuredY = minHeight
+                    # Skalierungsfaktor berechnen
+                    factor = measuredY / maxY
+                    # Alle Linien skalieren und anzeigen
+                    ax.vlines(ref['x'], 0, np.array(ref['y']) * factor, colors=ref['Color'], label=ref['Title'])
+        elif type(spec).__name__ == 'xrfSpectrum':
+            for ref in spec.references:
+                # get maximum counts at most intens line in spectrum range
+                # lines are sorted in reference list by intensity, so the first line inside the spectrum range is the most intens.
+                maxIntens = 0
+                linesX = []
+                linesYmax = []
+                for line in elementLines[ref]['Lines']:
+                    if line['Energy'] < figureData['fullXLim'][1] * 1000 and line['Energy'] > figureData['fullXLim'][0] * 1000:
+                        if line['rel. Intensity'] > maxIntens:
+                            maxIntens = line['rel. Intensity']
+                            for i in range(1, len(spec.x)):
+                                if spec.x[i-1] * 1000 < line['Energy'] and spec.x[i] * 1000 > line['Energy']:
+                                    m = (spec.y[i] - spec.y[i-1])/(spec.x[i] - spec.x[i-1]) / 1000
+                                    n = -m * spec.x[i] * 1000 + spec.y[i]
+                                    countsAtEnergy = m * line['Energy'] + n
+                                    break
+                                elif spec.x[i-1] * 1000 == line['Energy']:
+                                    countsAtEnergy = spec.y[i-1]
+                                    break
+                                elif spec.x[i] * 1000 == line['Energy']:
+                                    countsAtEnergy = spec.y[i]
+                                    break
+                            if countsAtEnergy < 0.1 * np.max(spec.y):
+                                countsAtEnergy = 0.1 * np.max(spec.y)
+                        linesX.append(line['Energy'] / 1000)
+                        linesYmax.append(line['rel. Intensity'] * countsAtEnergy / maxIntens)
+                ax.vlines(x=linesX, ymin=0, ymax=linesYmax, color=elementLines[ref]['Display Color'], label=ref)
+
+
+    ax.set_xlim(figureData['XLim'])
+    ax.set_ylim(figureData['YLim'])
+    ax.set_xlabel(figureData['XLabel'])
+    ax.set_ylabel(figureData['YLabel'])
+    if figureData['PlotTitle'] != "":
+        figure.suptitle(figureData['PlotTitle'])
+    if figureData['Legend'] != "":
+        ax.legend(loc=figureData['Legend'])
+    return ax, ax2
+
+def createFigure():
+    figure = Figure(figsize=figureSize, dpi=100, layout="constrained")
+    FigureCanvasAgg(figure)
+    return figure
+
+def renderPage(payloads, figureData, elementLines, fileName, dpi):
+    # draws a page, given by the payloads of its spectra (see spectratypes.packSpectrum), and saves it, this is the job of the worker processes in exportPages
+    figure = createFigure()
+    drawPage(figure, [spectratypes.unpackSpectrum(payload) for payload in payloads], figureData, elementLines)
+    figure.savefig(fileName, dpi=dpi)
+    return fileName
+
+def getPageFileNames(fileName, numPages):
+    """
+    Returns the file names of the pages: the page number is appended to
+    the name, e.g. report_001.png, report_002.png, ...
+    """
+    root, extension = os.path.splitext(fileName)
+    width = max(3, len(str(numPages)))
+    return [root + "_" + str(i + 1).zfill(width) + extension for i in range(numPages)]
+
+def exportPages(pages, fileName, dpi=300, singleFile=False, progress=None, workers=None):
+    """
+    Exports pages to image files.
+
+    Parameters
+    ----------
+    pages : list
+        The pages (spectivePage) to export.
+    fileName : String
+        The image file, its extension gives the format. Without singleFile,
+        the page numbers are appended, see getPageFileNames.
+    dpi : int, optional
+        Resolution of raster images. The default is 300.
+    singleFile : bool, optional
+        Write all pages to one PDF file. The default is False.
+    progress : function, optional
+        progress(done, total) is called after every page and while waiting
+        for the workers, e.g. to update a progress bar.
+    workers : int, optional
+        Number of worker processes. The default is the number of CPU cores.
+
+    Returns
+    -------
+    bool
+        True if all pages are exported.
+
+    """
+    elementLines = getElementLines()
+    try:
+        if singleFile:
+            with PdfPages(fileName) as pdf:
+                figure = createFigure()
+                for i, page in enumerate(pages):
+                    drawPage(figure, page.spectra, page.figureData, elementLines)
+                    pdf.savefig(figure, dpi=dpi)
+                    if progress:
+                        progress(i + 1, len(pages))
+            return True
+        fileNames = getPageFileNames(fileName, len(pages))
+        if not workers:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(pages))
+        if workers < 2 or len(pages) < minPagesForPool:
+            for i, page in enumerate(pages):
+                renderPage([spectratypes.packSpectrum(s) for s in page.spectra], page.figureData, elementLines, fileNames[i], dpi)
+                if progress:
+                    progress(i + 1, len(pages))
+            return True
+        with processpool.createPool(workers) as pool:
+            futures = []
+            queue = iter(enumerate(pages))
+
+            def submitNext():
+                # the spectra of a page not decoded so far are decoded here while the workers draw the pages before
+                item = next(queue, None)
+                if item is not None:
+                    i, page = item
+                    futures.append(pool.submit(renderPage, [spectratypes.packSpectrum(s) for s in page.spectra], page.figureData, elementLines, fileNames[i], dpi))
+
+            # only a window of pages is sent ahead, so the spectra of only these pages are pickled and queued
+            for j in range(2 * workers):
+                submitNext()
+            try:
+                for i in range(len(pages)):
+                    future = futures.pop(0)
+                    while True:
+                        try:
+                            future.result(timeout=0.1)
+                            break
+                        except concurrent.futures.TimeoutError:
+                            if progress:
+                                progress(i, len(pages))
+                    submitNext()
+                    if progress:
+                        progress(i + 1, len(pages))
+            finally:
+                pool.shutdown(cancel_futures=True)
+    except (OSError, ValueError, KeyError, IndexError, concurrent.futures.BrokenExecutor) as e:
+        # e.g. an XRF reference not in the element lines or a worker killed
+        print("Could not export " + fileName + ": " + str(e))
+        return False
+    return True
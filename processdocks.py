@@ -151,6 +151,7 @@ class peakpickingDock(QDockWidget):
             return
         self.spectrum.peaks = []
         self.spectrum.peakString = ""
+        self.spectrum.modified = True
         self.resultField.setPlainText("")
         self.peaksChanged.emit()
     
@@ -241,6 +242,7 @@ class integralDock(QDockWidget):
                 self.editIntegral(row)
             elif action == deleteAction:
                 del self.spectrum.integrals[row]
+                self.spectrum.modified = True
                 self.integralsChanged.emit()
                 
     def editIntegral(self, row):
@@ -380,6 +382,7 @@ class XrdDock(QDockWidget):
                 ref['Title'] = data['Title']
                 ref['Display'] = data['Display']
                 self.spectrum.references.append(ref)
+                self.spectrum.modified = True
                 self.referenceChanged.emit()
                 
                 pix = QPixmap(QSize(32,32))
@@ -397,6 +400,7 @@ class XrdDock(QDockWidget):
             self.spectrum.references[index]['Color'] = data['Color']
             self.spectrum.references[index]['Title'] = data['Title']
             self.spectrum.references[index]['Display'] = data['Display']
+            self.spectrum.modified = True
             self.referenceChanged.emit()
             pix = QPixmap(QSize(32,32))
             pix.fill(QColor.fromString(data['Color']))
@@ -418,6 +422,7 @@ class XrdDock(QDockWidget):
                 self.updateReference(item)
             elif action == deleteAction:
                 del self.spectrum.references[row]
+                self.spectrum.modified = True
                 self.referenceList.takeItem(row)
                 self.referenceChanged.emit()
             
@@ -580,6 +585,7 @@ class XrfDock(QDockWidget):
         else: 
             btn.setStyleSheet("background-color: " + self.ElementLines[element]['Display Color'])
             self.spectrum.references.append(element)
+        self.spectrum.modified = True
         
         self.referenceChanged.emit()
     
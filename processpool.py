@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pools of worker processes for the parallel parts of pySpective: decoding and
+formatting JCAMP-DX blocks, reading mca files and exporting pages.
+
+The workers are started by a fork server (spawned on systems without one)
+and never forked from the window, as a forked copy of a process with
+running threads (Qt, the autosave journal, the import thread) may inherit
+locks held by these threads. Spectra are sent to and from the workers as
+compact payloads, see spectratypes.packSpectrum.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# modules with the jobs of the workers
+preloadModules = ["__main__", "spectratypes", "spectivedocument", "pageplot"]
+
+def getStartMethod():
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return "forkserver"
+    return "spawn"
+
+def createPool(workers):
+    """
+    Returns a ProcessPoolExecutor with workers processes, which are not
+    forked from this process.
+    """
+    context = multiprocessing.get_context(getStartMethod())
+    if context.get_start_method() == "forkserver":
+        # the fork server imports the modules of the jobs once, the workers are forked from it
+        context.set_forkserver_preload(preloadModules)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
@@ -30,12 +30,15 @@ from PyQt6.QtWidgets import (
     QAbstractScrollArea,
     QInputDialog,
     QLineEdit,
-    QGridLayout
+    QGridLayout,
+    QProgressDialog,
+    QMessageBox
 )
 
 import spectivedocument
 import spectrum
 import spectratypes
+import readers
 import specplot
 import opendialog
 import metadatadock
@@ -44,6 +47,31 @@ import pagedialog
 import spectiveview
 import spectrumdialog
 import processdocks
+import tableexport
+import pageplot
+import autosave
+import importthread
+
+# the file filters of the save dialogs, the second one writes the data ASDF compressed
+jcampFilter = "JCAMP-DX File (*.dx)"
+jcampCompressedFilter = "Compressed JCAMP-DX File (*.dx)"
+jcampSaveFilters = jcampFilter + ";;" + jcampCompressedFilter
+
+# the file filters of the export of all pages: filter -> (extension, all pages in one file)
+imageFilters = {
+    "Portable Network Graphic, one file per page (*.png)": (".png", False),
+    "Scalable Vector Graphic, one file per page (*.svg)": (".svg", False),
+    "PDF, one file per page (*.pdf)": (".pdf", False),
+    "PDF, all pages in one file (*.pdf)": (".pdf", True),
+}
+
+# the file filters of the table export: filter -> (layout, extension)
+tableFilters = {
+    "Wide Table, Comma Separated (*.csv)": ("wide", ".csv"),
+    "Wide Table, Tab Separated (*.tsv)": ("wide", ".tsv"),
+    "Long Table, Comma Separated (*.csv)": ("long", ".csv"),
+    "Long Table, Tab Separated (*.tsv)": ("long", ".tsv"),
+}
 
 class ApplicationWindow(QMainWindow):
     def __init__(self):
@@ -77,10 +105,21 @@ class ApplicationWindow(QMainWindow):
         self.metadataDockAction.setChecked(not self.metadataDock.isHidden())
         self.pageDockAction.setChecked(not self.pageDock.isHidden())
         self.spectraDockAction.setChecked(not self.spectraDock.isHidden())
+        
+        # autosave journals of the open documents: id(document) -> journal
+        self.journals = {}
+        self.autosaveTimer = QtCore.QTimer(self)
+        self.autosaveTimer.timeout.connect(self.autosave)
+        if autosave.isEnabled():
+            self.autosaveTimer.start(autosave.getInterval() * 1000)
     
     def closeEvent(self, evt):
         self.settings.setValue("geometry", QtCore.QVariant(self.saveGeometry()))
         self.settings.setValue("windowState", QtCore.QVariant(self.saveState()))
+        # closed normally, nothing to recover
+        for journal in self.journals.values():
+            journal.close()
+        self.journals = {}
         super(ApplicationWindow, self).closeEvent(evt)
         self.close()
         
@@ -187,6 +226,10 @@ class ApplicationWindow(QMainWindow):
         self.saveImageAction.triggered.connect(self.saveImage)
         self.saveImageAction.setEnabled(False)
         
+        self.saveAllImagesAction = QAction(self.tr('Export All Pages to Image Files'))
+        self.saveAllImagesAction.triggered.connect(self.saveAllImages)
+        self.saveAllImagesAction.setEnabled(False)
+        
         self.metadataDockAction = QAction(self.tr('Show and Edit Metadata'))
         self.metadataDockAction.setIcon(QIcon("icons/Metadata.png"))
         self.metadataDockAction.setCheckable(True)
@@ -244,6 +287,21 @@ class ApplicationWindow(QMainWindow):
         self.saveDocumentAction.setEnabled(False)
         self.saveDocumentAction.triggered.connect(self.saveFile)
         
+        self.openBundleAction = QAction(self.tr('Open Project Bundle'))
+        self.openBundleAction.triggered.connect(self.openBundle)
+        
+        self.saveBundleAction = QAction(self.tr('Save Document as Project Bundle'))
+        self.saveBundleAction.setEnabled(False)
+        self.saveBundleAction.triggered.connect(self.saveBundle)
+        
+        self.exportPageTableAction = QAction(self.tr('Export Current Page as Table'))
+        self.exportPageTableAction.setEnabled(False)
+        self.exportPageTableAction.triggered.connect(lambda: self.exportTable(False))
+        
+        self.exportDocumentTableAction = QAction(self.tr('Export Document as Table'))
+        self.exportDocumentTableAction.setEnabled(False)
+        self.exportDocumentTableAction.triggered.connect(lambda: self.exportTable(True))
+        
         self.calculateDerivativeAction = QAction(self.tr("Calculate Derivative"))
         self.calculateDerivativeAction.setIcon(QIcon("icons/Derivative.png"))
         self.calculateDerivativeAction.triggered.connect(self.calculateDerivative)
@@ -261,7 +319,12 @@ class ApplicationWindow(QMainWindow):
         
         # create file menu
         self.fileMenu.addAction(self.openAction)
+        self.fileMenu.addAction(self.openBundleAction)
         self.fileMenu.addAction(self.saveDocumentAction)
+        self.fileMenu.addAction(self.saveBundleAction)
+        self.fileMenu.addSeparator()
+        self.fileMenu.addAction(self.exportPageTableAction)
+        self.fileMenu.addAction(self.exportDocumentTableAction)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.closeAction)
         
@@ -273,6 +336,7 @@ class ApplicationWindow(QMainWindow):
         self.documentMenu.addAction(self.savePageAction)
         self.documentMenu.addAction(self.saveSpectrumAction)
         self.documentMenu.addAction(self.saveImageAction)
+        self.documentMenu.addAction(self.saveAllImagesAction)
         
         # create view menu
         self.viewMenu.addAction(self.metadataDockAction)
@@ -293,7 +357,11 @@ class ApplicationWindow(QMainWindow):
     def enableDocumentActions(self, enabled):
         self.pageEditAction.setEnabled(enabled)
         self.saveDocumentAction.setEnabled(enabled)
+        self.saveBundleAction.setEnabled(enabled)
+        self.exportPageTableAction.setEnabled(enabled)
+        self.exportDocumentTableAction.setEnabled(enabled)
         self.saveImageAction.setEnabled(enabled)
+        self.saveAllImagesAction.setEnabled(enabled)
         self.documentTitleAction.setEnabled(enabled)
         self.savePageAction.setEnabled(enabled)
         self.saveSpectrumAction.setEnabled(enabled)
@@ -307,70 +375,30 @@ class ApplicationWindow(QMainWindow):
             if not os.path.exists(data["File Name"]):
                 return
             self.settings.setValue("lastOpenDir", os.path.dirname(data["File Name"]))
-            if data["File Type"] == "Any Text Format" or data["File Type"] == "MCA - DESY XRF File Format" or data["File Type"] == "pyXrfa-JSON" or data["File Type"] == "AMETEK-XRF TXT-Export" or data['File Type'] == "Bruker XRD RAW4":
-                print(data['File Name'])
-                if data["File Type"] == "Any Text Format":
-                    if data["Free Text Settings"]["Spectrum Type"] == self.tr("Raman"):
-                        newSpectrum = spectratypes.ramanSpectrum()
-                        print("Raman")
-                    elif data["Free Text Settings"]["Spectrum Type"] == self.tr("Infrared"):
-                        newSpectrum = spectratypes.infraredSpectrum()
-                        print("infrared")
-                    elif data["Free Text Settings"]["Spectrum Type"] == self.tr("UV/VIS"):
-                        newSpectrum = spectratypes.ultravioletSpectrum()
-                        print("ultraviolett")
-                    elif data["Free Text Settings"]["Spectrum Type"] == self.tr("Powder XRD"):
-                        newSpectrum = spectratypes.powderXRD()
-                        self.xrdDock.setSpectrum(newSpectrum)
-                        print("Powder XRD")
-                    elif data["Free Text Settings"]["Spectrum Type"] == self.tr("XRF"):
-                        newSpectrum = spectratypes.xrfSpectrum()
-                        self.xrfDock.setSpectrum(newSpectrum)
-                        print("XRF")
-                    else:
-                        print("Spectrum type not implemented, yet.")
-                    if not newSpectrum:
-                        return
-                    
-                    print(newSpectrum.openFreeText(data["File Name"], data["Free Text Settings"]))
-                elif data["File Type"] == "MCA - DESY XRF File Format":
-                    newSpectrum = spectratypes.xrfSpectrum()
-                    print("XRF - MCA")
-                    print(newSpectrum.openMCA(data['File Name']))
-                    self.xrfDock.setSpectrum(newSpectrum)
-                elif data["File Type"] == "pyXrfa-JSON":
-                    newSpectrum = spectratypes.xrfSpectrum()
-                    print("XRF - pyXrfa-JSON")
-                    print(newSpectrum.openPyXrfaJSON(data['File Name']))
-                    self.xrfDock.setSpectrum(newSpectrum)
-                elif data["File Type"] == "AMETEK-XRF TXT-Export":
-                    print("AMETEK-XRF TXT-Export")
-                    newSpectrum = []
-                    with open(data['File Name']) as f:
-                        lines = f.readlines()
-                        kalib1 = [float(z.replace(",", ".")) for z in lines[0].split("\t")[1:-1]]
-                        kalib2 = [float(z.replace(",", ".")) for z in lines[1].split("\t")[1:-1]]
-                        x = [[] for i in range(4)]
-                        y = [[] for i in range(4)]
-                        
-                        for i in range(7, len(lines)):
-                            p = lines[i].split("\t")
-                            for s in range(1, 5):
-                                if (i-6) < 2049 or s == 2:
-                                    x[s-1].append(kalib1[s-1] + kalib2[s-1] * (i-6))
-                                    y[s-1].append(float(p[s]))
-                        for i in range(4):
-                            ns = spectratypes.xrfSpectrum()
-                            ns.openAndSetXY(np.array(x[i]), np.array(y[i]))
-                            ns.title = "Spectrum with filter " + str(i+1)
-                            ns.metadata["Core Data"]["Title"] = "Spectrum with filter " + str(i+1)
-                            newSpectrum.append(ns)
-                elif data["File Type"] == "Bruker XRD RAW4":
-                    newSpectrum = spectratypes.powderXRD()
-                    print("Bruker XRD RAW4")
-                    print(newSpectrum.openBrukerRaw4(data['File Name']))
-                    self.xrdDock.setSpectrum(newSpectrum)
-                    
+            if data["File Type"] == "Auto Detect":
+                data["File Type"] = readers.detectFileType(data["File Name"])
+            elif data["File Type"] == "JCAMP-DX" and readers.detectFileType(data["File Name"]) == "JCAMP-DX NTUPLES":
+                data["File Type"] = "JCAMP-DX NTUPLES"
+            if data["File Type"] != "JCAMP-DX":
+                # JCAMP-DX documents are opened page by page below, all other formats by the reader registry
+                if data["File Type"] == "ZIP Archive":
+                    # every file of the archive is opened as one page
+                    pages = [(member, spectra) for member, spectra in readers.openZipArchive(data["File Name"], data["Free Text Settings"]) if spectra]
+                elif data["File Type"] == "Any Text Format" and data["Free Text Settings"].get("Y Columns") == "all on one page":
+                    # all y columns of a text file on one page
+                    spectra = self.readFile(data["File Name"], data["File Type"], data["Free Text Settings"])
+                    pages = [("", spectra)] if spectra else []
+                else:
+                    # one page per spectrum, e.g. for the spectra of all filters of an AMETEK export or all y columns of a text file
+                    pages = [("", [ns]) for ns in self.readFile(data["File Name"], data["File Type"], data["Free Text Settings"])]
+                if not pages:
+                    return
+                for title, spectra in pages:
+                    for ns in spectra:
+                        if isinstance(ns, spectratypes.xrfSpectrum):
+                            self.xrfDock.setSpectrum(ns)
+                        elif isinstance(ns, spectratypes.powderXRD):
+                            self.xrdDock.setSpectrum(ns)
                 
                 if data['open as'] == "document":
                     document = spectivedocument.spectiveDocument(os.path.basename(data["File Name"]))
@@ -384,23 +412,32 @@ class ApplicationWindow(QMainWindow):
                     self._mainWidget.currentChanged.connect(self.documentChanged)
                     self.documents.append(document)
                     self.currentDocument = self.documents[-1]
-                    if type(newSpectrum) == list:
-                        for ns in newSpectrum:
-                            self.currentPage = document.addPage()
-                            self.currentSpectrum = self.currentPage.addSpectrum(ns)
-                        if type(ns).__name__ == "xrfSpectrum":
-                            self.xrfDock.setSpectrum(ns)
-                    else:
+                    for title, spectra in pages:
                         self.currentPage = document.addPage()
-                        self.currentSpectrum = self.currentPage.addSpectrum(newSpectrum)
+                        self.currentPage.figureData['PageTitle'] = title
+                        for ns in spectra:
+                            self.currentSpectrum = self.currentPage.addSpectrum(ns)
                     
                 elif data['open as'] == "page":
-                    self.currentPage = self.currentDocument.addPage()
-                    self.currentSpectrum = self.currentPage.addSpectrum(newSpectrum)
+                    if data["File Type"] != "ZIP Archive":
+                        # all spectra of the file on one new page
+                        pages = [("", [ns for title, spectra in pages for ns in spectra])]
+                    for title, spectra in pages:
+                        self.currentPage = self.currentDocument.addPage()
+                        self.currentPage.figureData['PageTitle'] = title
+                        for ns in spectra:
+                            self.currentSpectrum = self.currentPage.addSpectrum(ns)
                 else:
-                    self.currentSpectrum = self.currentPage.addSpectrum(newSpectrum)
-            elif data["File Type"] == "JCAMP-DX":
-                blocks = spectrum.getJCAMPblockFromFile(data["File Name"])
+                    for title, spectra in pages:
+                        for ns in spectra:
+                            self.currentSpectrum = self.currentPage.addSpectrum(ns)
+            else:
+                try:
+                    blocks = spectrum.getJCAMPblockIndex(data["File Name"])
+                except (OSError, ValueError) as e:
+                    # e.g. a zip archive with several files
+                    QMessageBox.warning(self, self.tr("Open File"), self.tr("Could not open {0}: {1}").format(data["File Name"], str(e)))
+                    return
                 linkBlock = {}
                 linkBlock['Title'] = os.path.basename(data["File Name"])
                 linkBlock['Pages'] = 1
@@ -408,8 +445,8 @@ class ApplicationWindow(QMainWindow):
                 if len(blocks) > 1:
                     # there are more then one spectrum in this file.
                     #the last block will always be the LINK block!
-                    linkBlock = spectrum.loadJCAMPlinkBlock(blocks[-1])
-                    blocks.pop()
+                    title, offset, length = blocks.pop()
+                    linkBlock = spectrum.loadJCAMPlinkBlock(spectrum.readJCAMPblock(data["File Name"], offset, length))
                 pageOffset = 0
                 numPages = 0
                 if 'Pages' in linkBlock:
@@ -430,37 +467,30 @@ class ApplicationWindow(QMainWindow):
                     self.currentDocument = self.documents[-1]
                     for i in range(numPages):
                         self.currentPage = document.addPage()
-                    for i in range(len(blocks)):
-                        s = self.openSpectrum(blocks[i])
-                        if not s:
-                            continue
-                        if s.displayData['Page']:
-                            self.currentSpectrum = document.pages[s.displayData['Page'] - 1].addSpectrum(s)
-                        else:
-                            self.currentSpectrum = document.pages[i-1].addSpectrum(s)
+                    # the spectra are decoded when a page is shown for the first time
+                    document.addJCAMPblocks(data["File Name"], blocks)
+                    self.currentPage.loadSpectra()
+                    self.currentSpectrum = self.currentPage.currentSpectrum
+                    document.setModified(False) # as read from the file
                 elif data['open as'] == "page":
                     pageOffset = len(self.currentDocument.pages)
                     for i in range(numPages):
                         self.currentPage = self.currentDocument.addPage()
-                    for i in range(len(blocks)):
-                        s = self.openSpectrum(blocks[i])
-                        if not s:
-                            continue
-                        if s.displayData['Page']:
-                            self.currentSpectrum = self.currentDocument.pages[pageOffset + s.displayData['Page'] - 1].addSpectrum(s)
-                        else:
-                            self.currentSpectrum = self.currentDocument.pages[pageOffset + i-1].addSpectrum(s)
+                    self.currentDocument.addJCAMPblocks(data["File Name"], blocks, pageOffset)
                     self.currentPage = self.currentDocument.currentPage
+                    self.currentPage.loadSpectra()
                     self.currentSpectrum = self.currentPage.currentSpectrum
                 else:
-                    for i in range(len(blocks)):
-                        s = self.openSpectrum(blocks[i])
+                    # decode all blocks in parallel, the spectra are returned in the order of the file
+                    spectra = spectratypes.openJCAMPDXblocks([(data["File Name"], offset, length) for title, offset, length in blocks])
+                    for s in spectra:
                         if not s:
                             continue
                         self.currentSpectrum = self.currentPage.addSpectrum(s)
-            for p in self.currentDocument.pages:
-                self._mainWidget.currentWidget().setPage(p)
-                p.icon = self._mainWidget.currentWidget().getIcon()
+            if data['open as'] == "document":
+                self.startJournal(self.currentDocument)
+            self._mainWidget.currentWidget().setPage(self.currentPage)
+            self.currentPage.icon = self._mainWidget.currentWidget().getIcon()
             self.enableDocumentActions(True)
             self.showPagesInDock()
             self.pageView.setCurrentRow(self.currentDocument.getCurrentPageIndex())
@@ -481,29 +511,7 @@ class ApplicationWindow(QMainWindow):
         None.
 
         """
-        if "INFRARED SPECTRUM" in block.upper():
-            # it is an infrared spectrum!
-            newSpectrum = spectratypes.infraredSpectrum()
-            print("infrared")
-        elif "RAMAN SPECTRUM" in block.upper():
-            # it is a Raman Spectrum!
-            print("raman")
-            newSpectrum = spectratypes.ramanSpectrum()
-        elif "ULTRAVIOLET SPECTRUM" in block.upper():
-            # it is an UV-VIS spectrum!
-            newSpectrum = spectratypes.ultravioletSpectrum()
-            print("ultraviolet")
-        elif "POWDER X-RAY DIFFRACTION" in block.upper():
-            # it is a powder XRD spectrum!
-            newSpectrum = spectratypes.powderXRD()
-            print("pXRD")
-        elif "X-RAY FLUORESCENCE SPECTRUM" in block.upper():
-            # it is a powder XRF spectrum!
-            newSpectrum = spectratypes.xrfSpectrum()
-            print("XRF")
-        if newSpectrum.openJCAMPDXfromString(block):
-            return newSpectrum
-        return False
+        return spectratypes.openJCAMPDXblock(block)
     
     def saveImage(self):
         dgl = exportdialog.exportDialog()
@@ -519,6 +527,23 @@ class ApplicationWindow(QMainWindow):
                 self.settings.setValue("lastImageSavePath", os.path.dirname(fileName))
                 self._mainWidget.currentWidget().saveAsImage(fileName, data['dpi'])
     
+    def saveAllImages(self):
+        dgl = exportdialog.exportDialog()
+        if dgl.exec():
+            data = dgl.getData()
+            if self.settings.value("lastImageSavePath"):
+                fileName, filterType = QFileDialog.getSaveFileName(None, "Export All Pages", self.settings.value("lastImageSavePath"), ";;".join(imageFilters))
+            else:
+                fileName, filterType = QFileDialog.getSaveFileName(None, "Export All Pages", QDir.homePath(), ";;".join(imageFilters))
+            if fileName:
+                extension, singleFile = imageFilters.get(filterType, (".png", False))
+                if not fileName.endswith(extension):
+                    fileName += extension
+                self.settings.setValue("lastImageSavePath", os.path.dirname(fileName))
+                progress = self.createProgressDialog(self.tr("Exporting pages ..."))
+                pageplot.exportPages(self.currentDocument.pages, fileName, data['dpi'], singleFile, lambda done, total: self.showProgress(progress, done, total))
+                progress.close()
+    
     def changeMode(self, a):
         if a == self.zoomAction:
             self.currentMode = "ZoomMode"
@@ -600,11 +625,18 @@ class ApplicationWindow(QMainWindow):
             self.xrfDock.setEnabled(False)
         
     def saveFile(self):
+        if self.currentDocument.bundleName and not self.currentDocument.fileName:
+            # opened from a project bundle
+            if self.currentDocument.saveBundle():
+                self.restartJournal(self.currentDocument, "Bundle")
+            return
+        compress = None
         if not self.currentDocument.fileName:
             if self.settings.value("LastSaveDir"):
-                fileName, _ = QFileDialog.getSaveFileName(self, "Save File", self.settings.value("LastSaveDir"), "JCAMP-DX File (*.dx)")
+                fileName, fileFilter = QFileDialog.getSaveFileName(self, "Save File", self.settings.value("LastSaveDir"), jcampSaveFilters)
             else:
-                fileName, _ = QFileDialog.getSaveFileName(self, "Save File", QDir.homePath(), "JCAMP-DX File (*.dx)")
+                fileName, fileFilter = QFileDialog.getSaveFileName(self, "Save File", QDir.homePath(), jcampSaveFilters)
+            compress = fileFilter == jcampCompressedFilter
         else:
             fileName = self.currentDocument.fileName
         if fileName:
@@ -612,7 +644,128 @@ class ApplicationWindow(QMainWindow):
             if not fileName.endswith(".dx"):
                 fileName += ".dx"
             self.currentDocument.fileName = fileName
-            self.currentDocument.saveDocument()
+            progress = self.createProgressDialog(self.tr("Saving document ..."))
+            saved = self.currentDocument.saveDocument(compress=compress, progress=lambda done, total: self.showProgress(progress, done, total))
+            progress.close()
+            if saved:
+                self.restartJournal(self.currentDocument, "JCAMP-DX")
+    
+    def readFile(self, fileName, fileType, options):
+        # read in a background thread, so the window stays responsive and the import can be cancelled
+        thread = importthread.importThread(fileName, fileType, options, self)
+        dgl = QProgressDialog(self.tr("Reading ") + os.path.basename(fileName) + " ...", self.tr("Cancel"), 0, 0, self)
+        dgl.setWindowModality(Qt.WindowModality.WindowModal)
+        dgl.setMinimumDuration(500)
+        dgl.canceled.connect(thread.cancel)
+        thread.progressChanged.connect(lambda done, total, points: self.showImportProgress(dgl, fileName, done, total, points))
+        loop = QtCore.QEventLoop()
+        thread.finished.connect(loop.quit)
+        thread.start()
+        if thread.isRunning():
+            loop.exec()
+        thread.wait()
+        dgl.close()
+        return thread.spectra
+    
+    def showImportProgress(self, dgl, fileName, done, total, points):
+        if total:
+            # per mille, the number of characters may be too large for the progress dialog
+            dgl.setMaximum(1000)
+            dgl.setValue(int(1000 * done / total))
+        dgl.setLabelText(self.tr("Reading ") + os.path.basename(fileName) + " ... " + str(points) + self.tr(" points"))
+    
+    def createProgressDialog(self, text):
+        # modal, so the document can not be changed while the events are processed
+        dgl = QProgressDialog(text, None, 0, 0, self)
+        dgl.setWindowModality(Qt.WindowModality.WindowModal)
+        dgl.setMinimumDuration(500)
+        return dgl
+    
+    def showProgress(self, dgl, done, total):
+        dgl.setMaximum(total)
+        dgl.setValue(done)
+        QApplication.processEvents() # keep the window responsive
+    
+    def openBundle(self):
+        if self.settings.value("lastOpenDir"):
+            bundleName = QFileDialog.getExistingDirectory(self, "Open Project Bundle", self.settings.value("lastOpenDir"))
+        else:
+            bundleName = QFileDialog.getExistingDirectory(self, "Open Project Bundle", QDir.homePath())
+        if not bundleName:
+            return
+        document = spectivedocument.openBundle(bundleName)
+        if not document or not document.pages:
+            return
+        self.settings.setValue("lastOpenDir", os.path.dirname(bundleName))
+        self.showDocument(document)
+        self.startJournal(document)
+    
+    def showDocument(self, document):
+        # adds a document with all its pages in a new tab, e.g. a project bundle
+        self._mainWidget.currentChanged.disconnect()
+        plotWidget = specplot.specplot()
+        plotWidget.positionChanged.connect(self.showPositionInStatusBar)
+        plotWidget.plotChanged.connect(self.showPagesInDock)
+        self._mainWidget.addTab(plotWidget, document.title)
+        self._mainWidget.setCurrentIndex(len(self.documents))
+        self._mainWidget.currentChanged.connect(self.documentChanged)
+        self.documents.append(document)
+        self.currentDocument = self.documents[-1]
+        self.currentPage = document.currentPage or document.pages[0]
+        self.currentSpectrum = self.currentPage.currentSpectrum
+        self._mainWidget.currentWidget().setPage(self.currentPage)
+        self.currentPage.icon = self._mainWidget.currentWidget().getIcon()
+        self.enableDocumentActions(True)
+        self.showPagesInDock()
+        self.pageView.setCurrentRow(self.currentDocument.getCurrentPageIndex())
+        self.showSpectraInDock()
+        self.enableDocks()
+    
+    def saveBundle(self):
+        if self.settings.value("LastSaveDir"):
+            bundleName, _ = QFileDialog.getSaveFileName(self, "Save Project Bundle", self.settings.value("LastSaveDir"), "pySpective Project Bundle (*" + spectivedocument.bundleExtension + ")")
+        else:
+            bundleName, _ = QFileDialog.getSaveFileName(self, "Save Project Bundle", QDir.homePath(), "pySpective Project Bundle (*" + spectivedocument.bundleExtension + ")")
+        if bundleName:
+            self.settings.setValue("LastSaveDir", os.path.dirname(bundleName))
+            if self.currentDocument.saveBundle(bundleName):
+                self.restartJournal(self.currentDocument, "Bundle")
+    
+    def startJournal(self, document):
+        if autosave.isEnabled():
+            self.journals[id(document)] = autosave.documentJournal(document)
+    
+    def restartJournal(self, document, baseType):
+        # the saved document is the new base of the journal
+        journal = self.journals.get(id(document))
+        if journal:
+            journal.start(baseType)
+    
+    def autosave(self):
+        for journal in self.journals.values():
+            journal.update()
+    
+    def recoverDocuments(self):
+        """
+        Offers to recover the documents of journals left over by a crashed 
+        session.
+        """
+        for fileName, header in autosave.getJournals():
+            answer = QMessageBox.question(self, self.tr("Recover Document"), self.tr("pySpective has not been closed properly. Recover the unsaved changes of \"{0}\" (autosaved since {1})?").format(header["Title"], header["Time"][:16].replace("T", " ")))
+            if answer == QMessageBox.StandardButton.Yes:
+                document = autosave.recoverDocument(fileName)
+                if not document:
+                    continue
+                self.showDocument(document)
+                self.startJournal(document)
+                # the old journal is removed after the recovered document is in the new one
+                if id(document) in self.journals:
+                    self.journals[id(document)].update()
+                    self.journals[id(document)].wait()
+            try:
+                os.remove(fileName)
+            except OSError as e:
+                print("Could not remove " + fileName + ": " + str(e))
     
     def showPagesInDock(self):
         self.pageView.currentRowChanged.disconnect()
@@ -662,7 +815,7 @@ class ApplicationWindow(QMainWindow):
         self.enableDocks()
     
     def pageChanged(self, index):
-        self.currentPage = self.currentDocument.goToPage(index)
+        self.currentPage = self.currentDocument.goToPage(index) # decodes the spectra of the page, if not done yet
         self.currentSpectrum = self.currentPage.currentSpectrum
         self._mainWidget.currentWidget().setPage(self.currentPage)
         self.currentPage.icon = self._mainWidget.currentWidget().getIcon()
@@ -677,6 +830,9 @@ class ApplicationWindow(QMainWindow):
             self.spectraList.clear()
             self.xrdDock.setEnabled(False)
             self.xrfDock.setEnabled(False)
+        journal = self.journals.pop(id(self.documents[index]), None)
+        if journal:
+            journal.close()
         del self.documents[index]
         self._mainWidget.removeTab(index)
         if self._mainWidget.currentIndex() < 0:
@@ -689,31 +845,50 @@ class ApplicationWindow(QMainWindow):
         title, ok = QInputDialog.getText(self, self.tr("Set Document Title"), self.tr("New Document Title"), QLineEdit.EchoMode.Normal, self.currentDocument.title)
         if ok and  title != "":
             self.currentDocument.title = title
+            self.currentDocument.modified = True
             self._mainWidget.setTabText(self._mainWidget.currentIndex(), title)
     
     def saveSpectrum(self):
         if self.settings.value("LastSaveDir"):
-            fileName, _ = QFileDialog.getSaveFileName(self, "Save File", self.settings.value("LastSaveDir"), "JCAMP-DX File (*.dx)")
+            fileName, fileFilter = QFileDialog.getSaveFileName(self, "Save File", self.settings.value("LastSaveDir"), jcampSaveFilters)
         else:
-            fileName, _ = QFileDialog.getSaveFileName(self, "Save File", QDir.homePath(), "JCAMP-DX File (*.dx)")
+            fileName, fileFilter = QFileDialog.getSaveFileName(self, "Save File", QDir.homePath(), jcampSaveFilters)
         
         if fileName:
             self.settings.setValue("LastSaveDir", os.path.dirname(fileName))
             if not fileName.endswith(".dx"):
                 fileName += ".dx"
-            self.currentDocument.saveSpectrum(self.currentSpectrumIndex, fileName)
+            self.currentDocument.saveSpectrum(self.currentSpectrumIndex, fileName, fileFilter == jcampCompressedFilter)
             
     def savePage(self):
         if self.settings.value("LastSaveDir"):
-            fileName, _ = QFileDialog.getSaveFileName(self, "Save File", self.settings.value("LastSaveDir"), "JCAMP-DX File (*.dx)")
+            fileName, fileFilter = QFileDialog.getSaveFileName(self, "Save File", self.settings.value("LastSaveDir"), jcampSaveFilters)
         else:
-            fileName, _ = QFileDialog.getSaveFileName(self, "Save File", QDir.homePath(), "JCAMP-DX File (*.dx)")
+            fileName, fileFilter = QFileDialog.getSaveFileName(self, "Save File", QDir.homePath(), jcampSaveFilters)
         
         if fileName:
             self.settings.setValue("LastSaveDir", os.path.dirname(fileName))
             if not fileName.endswith(".dx"):
                 fileName += ".dx"
-            self.currentDocument.savePage(fileName)
+            progress = self.createProgressDialog(self.tr("Saving page ..."))
+            self.currentDocument.savePage(fileName, fileFilter == jcampCompressedFilter, lambda done, total: self.showProgress(progress, done, total))
+            progress.close()
+    
+    def exportTable(self, wholeDocument):
+        if self.settings.value("LastSaveDir"):
+            fileName, fileFilter = QFileDialog.getSaveFileName(self, "Export Table", self.settings.value("LastSaveDir"), ";;".join(tableFilters))
+        else:
+            fileName, fileFilter = QFileDialog.getSaveFileName(self, "Export Table", QDir.homePath(), ";;".join(tableFilters))
+        
+        if fileName:
+            self.settings.setValue("LastSaveDir", os.path.dirname(fileName))
+            layout, extension = tableFilters.get(fileFilter, ("wide", ".csv"))
+            if not fileName.endswith(extension):
+                fileName += extension
+            if wholeDocument:
+                tableexport.exportDocument(self.currentDocument, fileName, layout)
+            else:
+                tableexport.exportPage(self.currentPage, fileName, layout)
     
     def pageEdit(self, row = -1):
         if row == -1 or not row:
@@ -736,6 +911,7 @@ class ApplicationWindow(QMainWindow):
         if row < 1:
             return
         self.currentDocument.pages[row], self.currentDocument.pages[row - 1] = self.currentDocument.pages[row - 1], self.currentDocument.pages[row]
+        self.currentDocument.modified = True
         self.currentPage = self.currentDocument.pages[self.currentDocument.pages.index(self.currentPage) - 1]
         self.showPagesInDock()
     
@@ -744,6 +920,7 @@ class ApplicationWindow(QMainWindow):
         if row > maxRow - 1:
             return
         self.currentDocument.pages[row], self.currentDocument.pages[row + 1] = self.currentDocument.pages[row + 1], self.currentDocument.pages[row]
+        self.currentDocument.modified = True
         self.currentPage = self.currentDocument.pages[self.currentDocument.pages.index(self.currentPage) + 1]
         self.showPagesInDock()
     
@@ -795,6 +972,7 @@ class ApplicationWindow(QMainWindow):
     def updateMetadata(self, data):
         self.currentSpectrum.metadata = data
         self.currentSpectrum.title = data["Core Data"]["Title"]
+        self.currentSpectrum.modified = True
         self.showSpectraInDock()
     
     def updatePlot(self):
@@ -899,4 +1077,5 @@ if __name__ == "__main__":
     app.show()
     app.activateWindow()
     app.raise_()
+    app.recoverDocuments()
     sys.exit(qapp.exec())
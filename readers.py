@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registry of the file formats pySpective can open.
+
+Every reader recognizes its file format from the first few KB of a file
+(magic bytes, ##DATA TYPE=, MCA markers, ...). Files compressed with gzip,
+bz2, xz or zip are decompressed while they are read (see sourcefile). So the file type has not to be
+chosen for every file and whole directories can be imported unattended.
+New formats are added with registerReader.
+"""
+
+import re
+import json
+
+import spectrum
+import spectratypes
+import spectrumcache
+import sourcefile
+
+# amount of bytes read from the beginning of a file to detect its format
+headSize = 4096
+
+# the readers in the order of detection, the first matching reader is used
+readers = []
+
+def registerReader(name, sniff, read, position=None, cache=True, progress=False):
+    """
+    Adds a file format to the registry.
+
+    Parameters
+    ----------
+    name : String
+        The file type as shown in the open dialog.
+    sniff : function
+        sniff(head, fileName) returns True if head (the first headSize bytes
+        of the file) belongs to this format.
+    read : function
+        read(fileName, options) returns a list of spectra or a String
+        describing the error.
+    position : int, optional
+        Position in the order of detection. The default is the end, before
+        the free text reader.
+    cache : bool, optional
+        Keep the spectra read in the spectrum cache. The default is True.
+    progress : bool, optional
+        read(fileName, options, progress) reports its progress, see 
+        openFile. The default is False.
+
+    """
+    reader = {"Name": name, "Sniff": sniff, "Read": read, "Cache": cache, "Progress": progress}
+    if position is None:
+        position = len(readers)
+        if readers and readers[-1]["Name"] == "Any Text Format":
+            position -= 1
+    readers.insert(position, reader)
+
+def getReader(name):
+    for reader in readers:
+        if reader["Name"] == name:
+            return reader
+    return None
+
+def getFileTypes():
+    return [reader["Name"] for reader in readers]
+
+def readHead(source):
+    """
+    Returns the first headSize bytes of a file (path or file object) after
+    decompression. File objects are set back to their position.
+    """
+    if sourcefile.isFileObject(source):
+        position = source.tell()
+        head = sourcefile.openSource(source).read(headSize)
+        source.seek(position)
+        return head
+    try:
+        with sourcefile.openSource(source) as f:
+            return f.read(headSize)
+    except ValueError:
+        # a zip archive with several files
+        return sourcefile.peek(source, headSize)
+
+def detectFileType(fileName, head=None):
+    """
+    Detects the format of a file by its first bytes.
+
+    Returns
+    -------
+    String or None
+        The name of the reader, None for unknown formats.
+
+    """
+    if head is None:
+        head = readHead(fileName)
+    for reader in readers:
+        if reader["Sniff"](head, sourcefile.getSourceName(fileName)):
+            return reader["Name"]
+    return None
+
+def openFile(fileName, fileType=None, options=None, progress=None):
+    """
+    Opens all spectra of a file.
+
+    Parameters
+    ----------
+    fileName : String
+        The path to the file.
+    fileType : String, optional
+        Name of the reader. The default is None, which detects the format.
+    options : dict, optional
+        Settings of the reader, e.g. the free text settings of the open dialog.
+    progress : function, optional
+        progress(done, points) is called by readers with progress while the 
+        file is read: number of characters read and of points parsed. The 
+        reader is cancelled if it returns False.
+
+    Returns
+    -------
+    list
+        The spectra of the file, empty if the file could not be opened.
+
+    """
+    if not fileType:
+        fileType = detectFileType(fileName)
+    reader = getReader(fileType)
+    if not reader:
+        print("Unknown file format: " + sourcefile.getSourceName(fileName))
+        return []
+    tag = fileType + " " + json.dumps(options, sort_keys=True)
+    cache = reader["Cache"] and not sourcefile.isFileObject(fileName)
+    if cache:
+        spectra = spectrumcache.load(fileName, tag)
+        if spectra is not None:
+            return spectra
+    if progress and reader["Progress"]:
+        spectra = reader["Read"](fileName, options, progress)
+    else:
+        spectra = reader["Read"](fileName, options)
+    if isinstance(spectra, str):
+        print(sourcefile.getSourceName(fileName) + ": " + spectra)
+        return []
+    if cache and spectra:
+        spectrumcache.store(fileName, spectra, tag)
+    return spectra
+
+def openFiles(fileNames, options=None):
+    """
+    Opens many files with detection of their format, e.g. a directory of
+    measurements. Files which cannot be opened are skipped.
+
+    Returns
+    -------
+    list
+        (fileName, list of spectra) for every file.
+
+    """
+    return [(fileName, openFile(fileName, None, options)) for fileName in fileNames]
+
+def openZipArchive(fileName, options=None):
+    """
+    Opens every file of a zip archive with detection of its format, without
+    unpacking the archive.
+
+    Returns
+    -------
+    list
+        (member name, list of spectra) for every file in the archive.
+
+    """
+    res = []
+    for member in sourcefile.getZipMembers(fileName):
+        with sourcefile.openZipMember(fileName, member) as f:
+            res.append((member, openFile(f, None, options)))
+    return res
+
+# The sniffers of the file formats
+
+jcampPattern = re.compile(rb"^\s*##(TITLE|DATA\s?TYPE|JCAMP-DX)=", re.MULTILINE | re.IGNORECASE)
+
+ntuplesPattern = re.compile(rb"^\s*##NTUPLES=", re.MULTILINE | re.IGNORECASE)
+
+def sniffJCAMPDX(head, fileName):
+    return jcampPattern.search(head) is not None
+
+def sniffZipArchive(head, fileName):
+    # only archives with several files, single files are decompressed by readHead
+    return head.startswith(b"PK\x03\x04")
+
+def sniffJCAMPNTuples(head, fileName):
+    return sniffJCAMPDX(head, fileName) and ntuplesPattern.search(head) is not None
+
+def sniffBrukerRaw4(head, fileName):
+    return head.startswith(b"RAW4")
+
+def sniffMCA(head, fileName):
+    return b"<<PMCA SPECTRUM>>" in head or b"<<CALIBRATION>>" in head or b"<<DATA>>" in head
+
+def sniffPyXrfaJSON(head, fileName):
+    return head.lstrip().startswith(b"{") and (b'"energies"' in head or b'"elementsAndColor"' in head or fileName.lower().endswith(".json"))
+
+def sniffAMETEK(head, fileName):
+    # two lines with a label and the calibration values of one or more filters (decimal comma) ahead of the data, as read by spectratypes.openAMETEK
+    lines = head.split(b"\n")
+    if len(lines) < 8:
+        return False
+    counts = []
+    for line in lines[:2]:
+        fields = line.rstrip(b"\r").rstrip(b"\t").split(b"\t")
+        if len(fields) < 2 or isNumber(fields[0]) or not all(isNumber(v) for v in fields[1:]):
+            return False
+        counts.append(len(fields))
+    return counts[0] == counts[1]
+
+def isNumber(value):
+    try:
+        float(value.replace(b",", b"."))
+    except ValueError:
+        return False
+    return True
+
+def sniffText(head, fileName):
+    return b"\x00" not in head
+
+# The readers
+
+def readZipArchive(fileName, options=None):
+    return [s for member, spectra in openZipArchive(fileName, options) for s in spectra]
+
+def readJCAMPDX(fileName, options=None):
+    if sourcefile.isFileObject(fileName):
+        data = sourcefile.readSource(fileName)
+        blocks = spectrum.indexJCAMPblocks(data)
+        if len(blocks) > 1:
+            blocks.pop() # the LINK block
+        spectra = [spectratypes.openJCAMPDXblock(data[offset:offset + length].decode("utf-8", "replace")) for title, offset, length in blocks]
+        return [s for s in spectra if s]
+    blocks = spectrum.getJCAMPblockIndex(fileName)
+    if len(blocks) > 1:
+        blocks.pop() # the LINK block
+    spectra = spectratypes.openJCAMPDXblocks([(fileName, offset, length) for title, offset, length in blocks])
+    return [s for s in spectra if s]
+
+def readJCAMPNTuples(fileName, options=None):
+    try:
+        return spectratypes.openJCAMPNTuples(fileName)
+    except ValueError as e:
+        return str(e)
+
+def readText(fileName, options=None, progress=None):
+    if not options:
+        # e.g. openFiles without settings: the column delimiter and the decimal separator are guessed
+        options = spectrum.sniffFreeTextOptions(readHead(fileName).decode("utf-8", "replace"))
+    if options.get("Y Columns", "first") != "first":
+        # one spectrum per y column
+        return spectratypes.openFreeTextColumns(fileName, options, progress)
+    if options.get("Spectrum Type") in spectratypes.freeTextTypes:
+        newSpectrum = spectratypes.freeTextTypes[options["Spectrum Type"]]()
+    elif options.get("Spectrum Type") == "undefined":
+        newSpectrum = spectrum.Spectrum()
+    else:
+        return "Spectrum type not implemented, yet."
+    res = newSpectrum.openFreeText(fileName, options, progress=progress)
+    if res is not True:
+        return res
+    return [newSpectrum]
+
+def readMCA(fileName, options=None):
+    newSpectrum = spectratypes.xrfSpectrum()
+    if not newSpectrum.openMCA(fileName):
+        return "Could not open MCA file"
+    return [newSpectrum]
+
+def readPyXrfaJSON(fileName, options=None):
+    newSpectrum = spectratypes.xrfSpectrum()
+    if not newSpectrum.openPyXrfaJSON(fileName):
+        return "Could not open pyXrfa-JSON file"
+    return [newSpectrum]
+
+def readAMETEK(fileName, options=None):
+    # one spectrum per filter
+    spectra = spectratypes.openAMETEK(fileName)
+    if not spectra:
+        return "Could not open AMETEK file"
+    return spectra
+
+def readBrukerRaw4(fileName, options=None):
+    # one spectrum per measured range
+    spectra = spectratypes.openBrukerRaw4(fileName)
+    if not spectra:
+        return "Could not open Bruker RAW4 file"
+    return spectra
+
+registerReader("ZIP Archive", sniffZipArchive, readZipArchive)
+registerReader("JCAMP-DX NTUPLES", sniffJCAMPNTuples, readJCAMPNTuples)
+registerReader("JCAMP-DX", sniffJCAMPDX, readJCAMPDX, cache=False) # the blocks are cached by spectratypes.openJCAMPDXblocks
+registerReader("Bruker XRD RAW4", sniffBrukerRaw4, readBrukerRaw4)
+registerReader("MCA - DESY XRF File Format", sniffMCA, readMCA)
+registerReader("pyXrfa-JSON", sniffPyXrfaJSON, readPyXrfaJSON)
+registerReader("AMETEK-XRF TXT-Export", sniffAMETEK, readAMETEK)
+registerReader("Any Text Format", sniffText, readText, progress=True)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Opens the input of the readers: a path or a file object, plain or
+compressed with gzip, bz2, xz or zip.
+
+The compression is detected from the first bytes of the data, not from the
+file extension, and the data is decompressed while it is read. So archived
+spectra (e.g. .dx.gz, .csv.xz or zipped instrument exports) can be opened
+without unpacking them to temporary files.
+"""
+
+import io
+import os
+import bz2
+import gzip
+import lzma
+import zipfile
+
+# magic bytes of the supported compressions
+compressionMagic = {
+    b"\x1f\x8b": "gzip",
+    b"BZh": "bz2",
+    b"\xfd7zXZ\x00": "xz",
+    b"PK\x03\x04": "zip",
+}
+
+# the data of the last compressed file read completely: [identity, bytes]
+lastData = [None, b""]
+
+def isFileObject(source):
+    return hasattr(source, "read")
+
+def getSourceName(source):
+    """
+    Returns the file name of a source, the member name for a member of a
+    zip archive and "" for file objects without name.
+    """
+    if isFileObject(source):
+        name = getattr(source, "name", "")
+        return name if isinstance(name, str) else ""
+    return source
+
+def peek(source, size=6):
+    if isFileObject(source):
+        position = source.tell()
+        head = source.read(size)
+        source.seek(position)
+        return head
+    with open(source, "rb") as f:
+        return f.read(size)
+
+def getCompression(source):
+    """
+    Returns the compression of a source ("gzip", "bz2", "xz" or "zip") or
+    None for uncompressed data.
+    """
+    head = peek(source)
+    for magic, compression in compressionMagic.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+def getZipMembers(source):
+    """
+    Returns the names of the files in a zip archive, without directories.
+    """
+    with zipfile.ZipFile(source) as archive:
+        return [info.filename for info in archive.infolist() if not info.is_dir()]
+
+def openSource(source, mode="rb", encoding="utf-8", errors="strict"):
+    """
+    Opens a source for reading, decompressing it if necessary. A zip archive
+    must contain exactly one file, use openZipMember for the members of
+    larger archives.
+
+    Parameters
+    ----------
+    source : String or file object
+        The path to the file or a binary file object.
+    mode : String, optional
+        "rb" for bytes or "r" for text. The default is "rb".
+    encoding, errors : String, optional
+        Used to decode the text in mode "r".
+
+    Raises
+    ------
+    ValueError
+        If source is a zip archive with more than one file.
+
+    Returns
+    -------
+    file object
+        To be closed by the caller, e.g. in a with statement.
+
+    """
+    compression = getCompression(source)
+    if compression == "gzip":
+        f = gzip.open(source)
+    elif compression == "bz2":
+        f = bz2.open(source)
+    elif compression == "xz":
+        f = lzma.open(source)
+    elif compression == "zip":
+        archive = zipfile.ZipFile(source)
+        members = [info.filename for info in archive.infolist() if not info.is_dir()]
+        if len(members) != 1:
+            archive.close()
+            raise ValueError(getSourceName(source) + " is a zip archive with " + str(len(members)) + " files")
+        f = archive.open(members[0])
+        archive.close() # the file is closed with the member
+    elif isFileObject(source):
+        f = source
+    else:
+        f = open(source, "rb")
+    if mode == "r":
+        return io.TextIOWrapper(f, encoding=encoding, errors=errors)
+    return f
+
+def openZipMember(fileName, member):
+    """
+    Opens one file of a zip archive for reading (bytes), decompressing it if
+    it is compressed itself. The name of the file object is the member name.
+    """
+    archive = zipfile.ZipFile(fileName)
+    f = archive.open(member)
+    archive.close() # the file is closed with the member
+    return openSource(f)
+
+def readSource(source):
+    """
+    Reads all (decompressed) bytes of a source. The data of the last
+    compressed file is kept, so blocks of one file can be read one after
+    another without decompressing the file again.
+    """
+    if isFileObject(source):
+        with openSource(source) as f:
+            return f.read()
+    stat = os.stat(source)
+    identity = (os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+    if lastData[0] != identity:
+        with openSource(source) as f:
+            lastData[1] = f.read()
+        lastData[0] = identity
+    return lastData[1]
+
+def isPlainFile(source):
+    """
+    True for paths to uncompressed files, which can be memory mapped and
+    read by offset directly.
+    """
+    return not isFileObject(source) and getCompression(source) is None
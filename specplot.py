@@ -16,11 +16,13 @@ matplotlib.use('QtAgg')
 from matplotlib.backends.backend_qtagg import FigureCanvas
 from matplotlib.figure import Figure
 from matplotlib.backend_bases import MouseButton
-from matplotlib.patches import Rectangle, Polygon
+from matplotlib.patches import Rectangle
 
 import numpy as np
 import json
 
+import pageplot
+
 class specplot(FigureCanvas):
     #Signals
     positionChanged = pyqtSignal(float, float)
@@ -196,110 +198,12 @@ class specplot(FigureCanvas):
         return QIcon(QPixmap(im))
     
     def updatePlot(self):
-        self.ax.figure.clear()
         if hasattr(self, 'ax2'):
             del self.ax2
-        self.ax = self.canvas.figure.subplots()
-        for spec in self.page.spectra:
-            if spec.color == '':
-                spec.color = "#0064a8"
-            if spec.yaxis > 0:
-                if not hasattr(self, 'ax2'):
-                    self.ax2 = self.ax.twinx()
-                    self.ax2.set_ylabel("derivative")
-                self.ax2.plot(spec.x, spec.y, spec.markerStyle + spec.lineStyle, color=spec.color, label=spec.title)
-                if len(spec.peaks) > 0:
-                    self.ax2.plot(spec.x[spec.peaks], spec.y[spec.peaks], "+", color=spec.peakParameter['Color'], label="_Hidden")
-            else:
-                self.ax.plot(spec.x, spec.y, spec.markerStyle + spec.lineStyle, color=spec.color, label=spec.title)
-                if len(spec.peaks) > 0:
-                    self.ax.plot(spec.x[spec.peaks], spec.y[spec.peaks], "+", color=spec.peakParameter['Color'], label="_Hidden")
-                for i in spec.integrals:
-                    x1, x2 = spec.getIntegrationRangeByIndex(i['x1'], i['x2'])
-                    poly = Polygon([*zip(spec.x[x1:x2], spec.y[x1:x2])], color=i['color'])
-                    self.ax.add_patch(poly)
-            if type(spec).__name__ == 'powderXRD':
-                currentYlim = self.ax.get_ylim()
-                ymin = currentYlim[0]
-                for ref in spec.references:
-                    if not ref['Display'] or ref['Display'] == "do not display":
-                        spec.ylim[0] = np.min(spec.y)
-                        self.ax.set_ylim(spec.ylim[0], currentYlim[1]) # remove space under the graph if no references are present
-                        self.figureData['fullYLim'][0] = spec.ylim[0]
-                    elif ref['Display'] == 'display without intenities':
-                        if currentYlim[0] >= 0:
-                            ymin = -(spec.ylim[1] - spec.ylim[0])/10
-                            self.ax.set_ylim(ymin, currentYlim[1])
-                            spec.ylim[0] = ymin
-                            self.figureData['fullYLim'][0] = ymin
-                        self.ax.vlines(ref['x'], ymin, 0, colors=ref['Color'], label=ref['Title'])
-                    elif ref['Display'] == 'display with intensity':
-                        # dispaly reference with intensity
-                        maxY = max(ref['y'])
-                        maxIndex = ref['y'].index(maxY)
-                        XatMaxY = ref['x'][maxIndex]
-                        measuredY = 1
-                        # suche nach dem am Messwert möglichst nahe am Theoriewert
-                        for idx in range(1, len(spec.x)):
-                            if XatMaxY > spec.x[idx - 1] and XatMaxY < spec.x[idx]:
-                                m = (spec.y[idx] - spec.y[idx-1])/(spec.x[idx] - spec.x[idx-1])
-                                n = -m * spec.x[idx] + spec.y[idx]
-                                measuredY = m * XatMaxY + n
-                                break
-                            elif XatMaxY == spec.x[idx - 1]:
-                                measuredY = spec.y[idx - 1]
-                                break
-                            elif XatMaxY == spec.x[idx]:
-                                measuredY = spec.y[idx]
-                                break
-                            
-                        minHeight = 0.1 * np.max(spec.y)
-                        if measuredY < minHeight:
-                            print("rescaled")
-                            measuredY = minHeight
-                        # Skalierungsfaktor berechnen
-                        factor = measuredY / maxY
-                        # Alle Linien skalieren und anzeigen
-                        self.ax.vlines(ref['x'], 0, np.array(ref['y']) * factor, colors=ref['Color'], label=ref['Title'])
-            elif type(spec).__name__ == 'xrfSpectrum':
-                self.ElementLines = self.settings.value("XRFElementLines")
-                for ref in spec.references:
-                    # get maximum counts at most intens line in spectrum range
-                    # lines are sorted in reference list by intensity, so the first line inside the spectrum range is the most intens.
-                    maxIntens = 0
-                    linesX = []
-                    linesYmax = []
-                    for line in self.ElementLines[ref]['Lines']:
-                        if line['Energy'] < self.figureData['fullXLim'][1] * 1000 and line['Energy'] > self.figureData['fullXLim'][0] * 1000:
-                            if line['rel. Intensity'] > maxIntens:
-                                maxIntens = line['rel. Intensity']
-                                for i in range(1, len(spec.x)):
-                                    if spec.x[i-1] * 1000 < line['Energy'] and spec.x[i] * 1000 > line['Energy']:
-                                        m = (spec.y[i] - spec.y[i-1])/(spec.x[i] - spec.x[i-1]) / 1000
-                                        n = -m * spec.x[i] * 1000 + spec.y[i]
-                                        countsAtEnergy = m * line['Energy'] + n
-                                        break
-                                    elif spec.x[i-1] * 1000 == line['Energy']:
-                                        countsAtEnergy = spec.y[i-1]
-                                        break
-                                    elif spec.x[i] * 1000 == line['Energy']:
-                                        countsAtEnergy = spec.y[i]
-                                        break
-                                if countsAtEnergy < 0.1 * np.max(spec.y):
-                                    countsAtEnergy = 0.1 * np.max(spec.y)
-                            linesX.append(line['Energy'] / 1000)
-                            linesYmax.append(line['rel. Intensity'] * countsAtEnergy / maxIntens)
-                    self.ax.vlines(x=linesX, ymin=0, ymax=linesYmax, color=self.ElementLines[ref]['Display Color'], label=ref)
-
-        
-        self.ax.set_xlim(self.figureData['XLim'])
-        self.ax.set_ylim(self.figureData['YLim'])
-        self.ax.set_xlabel(self.figureData['XLabel'])
-        self.ax.set_ylabel(self.figureData['YLabel'])
-        if self.figureData['PlotTitle'] != "":
-            self.ax.figure.suptitle(self.figureData['PlotTitle'])
-        if self.figureData['Legend'] != "":
-            self.ax.legend(loc=self.figureData['Legend'])
+        self.ElementLines = self.settings.value("XRFElementLines")
+        self.ax, ax2 = pageplot.drawPage(self.canvas.figure, self.page.spectra, self.figureData, self.ElementLines)
+        if ax2 is not None:
+            self.ax2 = ax2
         self.ax.figure.canvas.draw()
         self.plotChanged.emit()
     
@@ -6,9 +6,20 @@ Created on Thu Aug  3 13:42:51 2023
 @author: marcus
 """
 
+import io
+import os
 import json
+import uuid
+import weakref
+import datetime
+import tempfile
+import contextlib
+import concurrent.futures
 import numpy as np
 
+import spectrum
+import spectratypes
+import processpool
 from spectrum import checkLength
 
 class spectiveDocument:
@@ -17,8 +28,27 @@ class spectiveDocument:
         self.currentPage = None
         self.fileName = None
         self.title = title
+        self.compress = False # write the data ASDF compressed
+        self.modified = True # changed since the last save, see isModified
+        self.savedFile = None # identity of the file written by the last save
+        self.savedBlocks = {} # position of the blocks of the spectra in the saved file
+        self.bundleName = None # the project bundle the document is saved in, see saveBundle
+        self.bundleArrays = {} # the x and y arrays stored in the bundle: id -> (array, file name)
         
+    def isModified(self):
+        """
+        True if the document, one of its pages or a (loaded) spectrum has 
+        been changed since the document was saved or opened.
+        """
+        return self.modified or any(page.isModified() for page in self.pages)
+    
+    def setModified(self, modified):
+        self.modified = modified
+        for page in self.pages:
+            page.setModified(modified)
+    
     def addPage(self):
+        self.modified = True
         self.pages.append(spectivePage())
         self.pages[-1].title = "Page " + str(len(self.pages))
         self.currentPage = self.pages[-1]
@@ -26,9 +56,57 @@ class spectiveDocument:
     
     def goToPage(self, index):
         self.currentPage = self.pages[index]
+        self.currentPage.loadSpectra()
         return self.currentPage
     
+    def addJCAMPblocks(self, fileName, blocks, pageOffset=0):
+        """
+        Assigns the blocks of a JCAMP-DX file to the pages given by their 
+        $ON PAGE label. Only the header of every block is read here, the 
+        spectra are decoded when the page is needed.
+
+        Parameters
+        ----------
+        fileName : String
+            The JCAMP-DX file.
+        blocks : list
+            (title, offset, length) of the blocks, see spectrum.getJCAMPblockIndex
+        pageOffset : int
+            Index of the page for $ON PAGE=1.
+
+        """
+        identity = getFileIdentity(fileName)
+        for i, (title, offset, length) in enumerate(blocks):
+            header = spectrum.readJCAMPheader(fileName, offset, length)
+            if header.get("$ON PAGE"):
+                page = self.pages[pageOffset + int(header["$ON PAGE"]) - 1]
+            else:
+                # one block per page
+                page = self.pages[min(pageOffset + i, len(self.pages) - 1)]
+            if header.get("$PAGE TITLE"):
+                page.figureData['PageTitle'] = header["$PAGE TITLE"]
+            page.addJCAMPblock(fileName, offset, length, identity, i, title)
+    
+    def loadAllPages(self):
+        """
+        Decodes the pending JCAMP-DX blocks of all pages at once, using all 
+        CPU cores.
+        """
+        pages = [page for page in self.pages if not page.isLoaded()]
+        pageBlocks = []
+        for page in pages:
+            pageBlocks.append(getPendingBlocks(page.pendingBlocks))
+            page.pendingBlocks = []
+        spectra = spectratypes.openJCAMPDXblocks([block for blocks in pageBlocks for block in blocks])
+        # the results are in the order of the blocks, distribute them to the pages
+        start = 0
+        for page, blocks in zip(pages, pageBlocks):
+            end = start + len(blocks)
+            page.addDecodedSpectra(spectra[start:end])
+            start = end
+    
     def deletePage(self, row):
+        self.modified = True
         deletedPage = self.pages.pop(row)
         if len(self.pages) == 0: # no page left, return 0
             return None
@@ -39,58 +117,194 @@ class spectiveDocument:
         return self.currentPage # return the current page as pointer
         
         
-    def saveDocument(self, fileName = None):
+    def saveDocument(self, fileName = None, compress = None, progress = None):
+        """
+        Saves the document as JCAMP-DX file. The file is written to a 
+        temporary file first, which replaces the old file at the end. The 
+        data of spectra saved before with unchanged x and y values is copied 
+        from the old file instead of formatting it again. The file is 
+        always written, as not every change of a page or a spectrum is 
+        tracked by isModified. The other blocks are formatted in parallel, 
+        see writeJCAMPDXblocks.
+
+        Returns
+        -------
+        bool
+            True if the document is saved.
+
+        """
         if not fileName:
             fileName = self.fileName
+        if compress is not None and compress != self.compress:
+            self.compress = compress
+            self.modified = True
         if fileName:
             if not fileName.endswith(".dx"):
                 fileName += ".dx"
             self.fileName = fileName
+            self.loadAllPages()
             # save spectra here
             # get number of spectra
             numOfSpectra = 0
             for i in self.pages:
                 numOfSpectra += len(i.spectra)
-            with open(fileName, "w") as f:
-                if self.title=="":
-                    self.title = "untitled"
-                f.write(checkLength("##TITLE=" + self.title))
-                f.write(checkLength("\r\n##JCAMP-DX=5.01"))
-                f.write(checkLength("\r\n##DATA TYPE=LINK"))
-                f.write(checkLength("\r\n##BLOCKS=" + str(numOfSpectra + 1)))
-                f.write(checkLength("\r\n##$PAGES=" + str(len(self.pages))))
-                f.write(checkLength("\r\n##SAMPLE DESCRIPTION="))
-                f.write("\r\n")
-                for p in range(len(self.pages)):
-                    pageInfoSet = False
-                    for s in self.pages[p].spectra:
-                        f.write("\r\n")
-                        c = "##$ON PAGE=" + str(p+1)
-                        if not pageInfoSet:
-                            c += "\r\n##$PAGE TITLE=" + self.pages[p].figureData['PageTitle']
-                            c += "\r\n##$PLOT TITLE=" + self.pages[p].figureData['PageTitle']
-                            c += "\r\n##$XLABEL=" + self.pages[p].figureData['XLabel']
-                            c += "\r\n##$YLABEL=" + self.pages[p].figureData['YLabel']
-                            c += "\r\n##$XLIM=" + json.dumps(self.pages[p].figureData['XLim'])
-                            c += "\r\n##$YLIM=" + json.dumps(self.pages[p].figureData['YLim'])
-                            c += "\r\n##$LEGEND=" + self.pages[p].figureData['Legend']
-                            pageInfoSet = True
-                        f.write(s.getAsJCAMPDX(c))
+            oldFile = None
+            if self.savedFile and self.savedFile == getFileIdentity(self.savedFile[0]):
+                oldFile = open(self.savedFile[0], "rb")
+            savedBlocks = {}
+            try:
+                with atomicWrite(fileName) as f:
+                    if self.title=="":
+                        self.title = "untitled"
+                    f.write(checkLength("##TITLE=" + self.title))
+                    f.write(checkLength("\r\n##JCAMP-DX=5.01"))
+                    f.write(checkLength("\r\n##DATA TYPE=LINK"))
+                    f.write(checkLength("\r\n##BLOCKS=" + str(numOfSpectra + 1)))
+                    f.write(checkLength("\r\n##$PAGES=" + str(len(self.pages))))
+                    f.write(checkLength("\r\n##SAMPLE DESCRIPTION="))
+                    f.write("\r\n")
+                    blocks = []
+                    for p in range(len(self.pages)):
+                        pageInfoSet = False
+                        for s in self.pages[p].spectra:
+                            c = "##$ON PAGE=" + str(p+1)
+                            if not pageInfoSet:
+                                c += "\r\n##$PAGE TITLE=" + self.pages[p].figureData['PageTitle']
+                                c += "\r\n##$PLOT TITLE=" + self.pages[p].figureData['PageTitle']
+                                c += "\r\n##$XLABEL=" + self.pages[p].figureData['XLabel']
+                                c += "\r\n##$YLABEL=" + self.pages[p].figureData['YLabel']
+                                c += "\r\n##$XLIM=" + json.dumps(self.pages[p].figureData['XLim'])
+                                c += "\r\n##$YLIM=" + json.dumps(self.pages[p].figureData['YLim'])
+                                c += "\r\n##$LEGEND=" + self.pages[p].figureData['Legend']
+                                pageInfoSet = True
+                            blocks.append((s, c))
+                    positions = self.writeJCAMPDXblocks(f, blocks, self.compress, oldFile, progress)
+                    for (s, c), (offset, length) in zip(blocks, positions):
+                        savedBlocks[id(s)] = (s, offset, length, s.x, s.y, self.compress)
+                    f.write("\r\n")
+                    f.write(checkLength("\r\n##END= $$" + self.title))
+            except OSError as e:
+                print("Could not save " + fileName + ": " + str(e))
+                return False
+            finally:
+                if oldFile:
+                    oldFile.close()
+            self.savedBlocks = savedBlocks
+            self.savedFile = getFileIdentity(fileName)
+            self.setModified(False)
+            return True
+        return False
+    
+    def writeJCAMPDXblocks(self, f, blocks, compress, oldFile = None, progress = None, workers = None):
+        """
+        Writes the JCAMP-DX blocks of many spectra, each after an empty line.
+        The blocks are formatted in a pool of worker processes and written 
+        in their order as soon as they are done. At most two blocks per 
+        worker are formatted ahead of the writing. Blocks with data from the 
+        old file are written by this process.
+
+        Parameters
+        ----------
+        f : file object
+            Opened for writing text.
+        blocks : list
+            (spectrum, insert) for every block, see Spectrum.writeJCAMPDX.
+        compress : bool
+            Write the data ASDF compressed.
+        oldFile : file object, optional
+            The file of the last save, opened for reading bytes.
+        progress : function, optional
+            progress(done, total) is called after every block and while 
+            waiting for the workers, e.g. to update a progress bar.
+        workers : int, optional
+            Number of worker processes. The default is the number of CPU cores.
+
+        Returns
+        -------
+        list
+            (offset, length) of the blocks in f.
+
+        """
+        formatted = [i for i, (s, insert) in enumerate(blocks) if not (oldFile and self.isSaved(s, compress))]
+        if not workers:
+            workers = os.cpu_count() or 1
+        workers = min(workers, len(formatted))
+        pool = None
+        futures = {}
+        queue = iter(formatted)
+        
+        def submitNext():
+            i = next(queue, None)
+            if i is not None:
+                futures[i] = pool.submit(formatJCAMPDXblock, spectratypes.packSpectrum(blocks[i][0]), blocks[i][1], compress)
+        
+        if workers > 1 and len(formatted) >= spectratypes.minBlocksForPool:
+            pool = processpool.createPool(workers)
+            # only a window of blocks is formatted ahead of the writing, so only their spectra are sent and their text is kept
+            for j in range(2 * workers):
+                submitNext()
+        positions = []
+        try:
+            for i, (s, insert) in enumerate(blocks):
                 f.write("\r\n")
-                f.write(checkLength("\r\n##END= $$" + self.title))
+                offset = f.tell()
+                if i in futures:
+                    while True:
+                        try:
+                            text = futures[i].result(timeout=0.1)
+                            break
+                        except concurrent.futures.TimeoutError:
+                            if progress:
+                                progress(i, len(blocks))
+                    del futures[i]
+                    submitNext()
+                    f.write(text)
+                else:
+                    s.writeJCAMPDX(f, insert, compress=compress, data=self.readSavedData(s, oldFile, compress))
+                positions.append((offset, f.tell() - offset))
+                if progress:
+                    progress(i + 1, len(blocks))
+        finally:
+            if pool:
+                pool.shutdown(cancel_futures=True)
+        return positions
+    
+    def isSaved(self, s, compress):
+        # True if the data of spectrum s is in the file of the last save
+        saved = self.savedBlocks.get(id(s))
+        if not saved:
+            return False
+        spec, offset, length, x, y, savedCompress = saved
+        return spec is s and x is s.x and y is s.y and savedCompress == compress
+    
+    def readSavedData(self, s, oldFile, compress):
+        """
+        Returns the data section of spectrum s in the file of the last save, 
+        if its x and y values and the compression are unchanged, otherwise None.
+        """
+        if not oldFile or not self.isSaved(s, compress):
+            return None
+        spec, offset, length, x, y, savedCompress = self.savedBlocks[id(s)]
+        oldFile.seek(offset)
+        block = oldFile.read(length)
+        start = block.rfind(b"\r\n##XYDATA=")
+        end = block.rfind(b"\r\n##END=")
+        if start < 0 or end < start:
+            return None
+        return block[start:end].decode("utf-8")
         
-    def saveSpectrum(self, spectrumIndex, fileName):
+    def saveSpectrum(self, spectrumIndex, fileName, compress = False):
         if fileName:
             if not fileName.endswith(".dx"):
                 fileName += ".dx"
-            with open(fileName, "w") as f:
-                f.write(self.currentPage.currentSpectrum.getAsJCAMPDX())
+            with atomicWrite(fileName) as f:
+                self.currentPage.currentSpectrum.writeJCAMPDX(f, compress=compress)
     
-    def savePage(self, fileName):
+    def savePage(self, fileName, compress = False, progress = None):
         if fileName:
             if not fileName.endswith(".dx"):
                 fileName += ".dx"
-            with open(fileName, "w") as f:
+            with atomicWrite(fileName) as f:
                 page = self.currentPage
                 if page.title=="":
                     page.title = "untitled"
@@ -100,12 +314,87 @@ class spectiveDocument:
                 f.write(checkLength("\r\n##BLOCKS=" + str(len(page.spectra) + 1)))
                 f.write(checkLength("\r\n##SAMPLE DESCRIPTION="))
                 f.write("\r\n")
-                for s in page.spectra:
-                    f.write("\r\n")
-                    f.write(s.getAsJCAMPDX())
+                self.writeJCAMPDXblocks(f, [(s, None) for s in page.spectra], compress, progress=progress)
                 f.write("\r\n")
                 f.write(checkLength("\r\n##END= $$" + page.figureData['PageTitle']))
         
+    def saveBundle(self, bundleName = None):
+        """
+        Saves the document as project bundle: a directory with one .npy file
+        per x and y array and document.json with everything else. Arrays 
+        which are stored in the bundle already are not written again, so 
+        the time of a save depends on the changed spectra only.
+
+        Returns
+        -------
+        bool
+            True if the document is saved.
+
+        """
+        if not bundleName:
+            bundleName = self.bundleName
+        if not bundleName:
+            return False
+        if not bundleName.endswith(bundleExtension):
+            bundleName += bundleExtension
+        if not self.bundleName or os.path.abspath(bundleName) != os.path.abspath(self.bundleName):
+            # another bundle, all arrays are written
+            self.bundleArrays = {}
+        arrayDir = os.path.join(bundleName, "arrays")
+        bundleArrays = {}
+        
+        def writeArray(values):
+            saved = self.bundleArrays.get(id(values))
+            if saved and saved[0] is values and os.path.exists(os.path.join(arrayDir, saved[1])):
+                name = saved[1]
+            else:
+                values = np.asarray(values)
+                name = uuid.uuid4().hex + ".npy"
+                np.save(os.path.join(arrayDir, name), values)
+            bundleArrays[id(values)] = (values, name)
+            return {"$npy": name}
+        
+        pages = []
+        try:
+            os.makedirs(arrayDir, exist_ok=True)
+            for page in self.pages:
+                spectra = []
+                for s in page.spectra:
+                    attributes = {key: value for key, value in vars(s).items() if key not in ("x", "y", "modified")}
+                    attributes["x"] = writeArray(s.x)
+                    attributes["y"] = writeArray(s.y)
+                    spectra.append({"Class": type(s).__name__, "Attributes": attributes})
+                pages.append({
+                    "Title": page.title,
+                    "Figure Data": page.figureData,
+                    "Current Spectrum": page.spectra.index(page.currentSpectrum) if page.currentSpectrum in page.spectra else None,
+                    "Spectra": spectra})
+            data = {
+                "Format": "pySpective Project Bundle",
+                "Version": 1,
+                "Title": self.title,
+                "Compress": self.compress,
+                "Current Page": self.pages.index(self.currentPage) if self.currentPage in self.pages else None,
+                "Pages": pages}
+            # the new arrays are not used before document.json is replaced, so an interrupted save keeps the old state
+            with atomicWrite(os.path.join(bundleName, "document.json")) as f:
+                json.dump(data, f, default=encodeBundleValue)
+        except (OSError, TypeError, ValueError) as e:
+            print("Could not save " + bundleName + ": " + str(e))
+            return False
+        # remove the arrays of the previous save which are not used any longer
+        used = set(name for values, name in bundleArrays.values())
+        for entry in os.scandir(arrayDir):
+            if entry.name not in used:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass # e.g. still mapped on Windows, removed by the next save
+        self.bundleName = bundleName
+        self.bundleArrays = bundleArrays
+        self.setModified(False)
+        return True
+    
     def getFigureData(self):
         return self.currentPage.getFigureData()
     
@@ -119,7 +408,8 @@ class spectiveDocument:
 
 class spectivePage:
     def __init__(self):
-        self.spectra = []
+        self._spectra = []
+        self.pendingBlocks = [] # JCAMP-DX blocks not decoded so far, see addJCAMPblock
         self.figureData = {}
         self.figureData['PageTitle'] = ""
         self.figureData['PlotTitle'] = ""
@@ -134,7 +424,56 @@ class spectivePage:
         self.figureData['fullYLim'] = [0,0]
         self.icon = None
         self.currentSpectrum = None
+        self.modified = True # changed since the last save, see isModified
+        self.decodedSpectra = [] # (weak) references to the spectra decoded from the blocks and their x and y values, in the order of the blocks, see getReference
         
+    @property
+    def spectra(self):
+        if self.pendingBlocks:
+            self.loadSpectra()
+        return self._spectra
+    
+    def addJCAMPblock(self, fileName, offset, length, identity=None, index=None, title=None):
+        """
+        Adds a block of a JCAMP-DX file, which is decoded when the spectra 
+        of the page are needed. The identity of the file (see 
+        getFileIdentity), the index and the title of the block in 
+        spectrum.getJCAMPblockIndex are used to find the block again, if 
+        the file is changed before.
+        """
+        if identity is None:
+            identity = getFileIdentity(fileName)
+        self.pendingBlocks.append((fileName, offset, length, identity, index, title))
+    
+    def isLoaded(self):
+        return len(self.pendingBlocks) == 0
+    
+    def isModified(self):
+        # spectra not decoded so far are unchanged
+        return self.modified or any(s.modified for s in self._spectra)
+    
+    def setModified(self, modified):
+        self.modified = modified
+        for s in self._spectra:
+            s.modified = modified
+    
+    def loadSpectra(self):
+        """
+        Decodes the pending JCAMP-DX blocks of this page.
+        """
+        blocks, self.pendingBlocks = self.pendingBlocks, []
+        self.addDecodedSpectra(spectratypes.openJCAMPDXblocks(getPendingBlocks(blocks)))
+    
+    def addDecodedSpectra(self, spectra):
+        # decoding does not change the page
+        modified = self.modified
+        for s in spectra:
+            if s:
+                s.modified = False
+                self.addSpectrum(s)
+                self.decodedSpectra.append((weakref.ref(s), getReference(s.x), getReference(s.y)))
+        self.modified = modified
+    
     def _calculateFullLim(self):
         # reset xlim and ylim
         self.figureData['fullXLim'] = [0,0]
@@ -185,6 +524,7 @@ class spectivePage:
                         self.figureData['fullYLim'][1] = spectrum.ylim[1]
         
     def addSpectrum(self, spectrum):
+        self.modified = True
         self.spectra.append(spectrum)
         self._calculateFullLim()
         if len(self.spectra) == 1:
@@ -217,14 +557,17 @@ class spectivePage:
         return self.currentSpectrum
     
     def spectrumDown(self, row):
+        self.modified = True
         self.spectra[row], self.spectra[row + 1] = self.spectra[row + 1], self.spectra[row]
         return self.spectra[row+1]
     
     def spectrumUp(self, row):
+        self.modified = True
         self.spectra[row], self.spectra[row - 1] = self.spectra[row - 1], self.spectra[row]
         return self.spectra[row-1]
     
     def deleteSpectrum(self, row):
+        self.modified = True
         deletedSpectrum = self.spectra.pop(row)
         self._calculateFullLim()
         if len(self.spectra) == 0:
@@ -246,6 +589,7 @@ class spectivePage:
         return self.spectra.index(self.currentSpectrum)
     
     def setFigureData(self, data):
+        self.modified = True
         if data['invertX']:
             for s in self.spectra:
                 s.x = np.flip(s.x)
@@ -261,3 +605,154 @@ class spectivePage:
         self.figureData['PlotTitle'] = data["PlotTitle"]
         self.figureData['PageTitle'] = data["PageTitle"]
         self.figureData['Legend'] = data['Legend']
+
+def getReference(values):
+    # a weak reference to an array; other values (e.g. the empty list of a block without data) can not be referenced weakly and are kept
+    if isinstance(values, np.ndarray):
+        return weakref.ref(values)
+    return lambda: values
+
+def getPendingBlocks(pendingBlocks):
+    """
+    Returns the (fileName, offset, length) of pending JCAMP-DX blocks (see 
+    spectivePage.addJCAMPblock) to decode them. If a file has been changed 
+    since its blocks were added, it is indexed again and a block is taken 
+    from the same position in the file, if its title is unchanged. Blocks, 
+    which can not be found any longer, are left out.
+    """
+    blocks = []
+    indexes = {} # the new index of the changed files
+    for fileName, offset, length, identity, index, title in pendingBlocks:
+        if getFileIdentity(fileName) != identity:
+            if fileName not in indexes:
+                try:
+                    indexes[fileName] = spectrum.getJCAMPblockIndex(fileName)
+                except (OSError, ValueError) as e:
+                    print(fileName + " can not be read again: " + str(e))
+                    indexes[fileName] = []
+            blockIndex = indexes[fileName]
+            if index is None or index >= len(blockIndex) or blockIndex[index][0] != title:
+                print(fileName + " has been changed, the block " + str(title) + " is not found any longer")
+                continue
+            title, offset, length = blockIndex[index]
+        blocks.append((fileName, offset, length))
+    return blocks
+
+def formatJCAMPDXblock(payload, insert, compress):
+    """
+    Returns the JCAMP-DX block of a spectrum, given by its payload (see 
+    spectratypes.packSpectrum), as String. This is the job of the worker 
+    processes in spectiveDocument.writeJCAMPDXblocks.
+    """
+    f = io.StringIO()
+    spectratypes.unpackSpectrum(payload).writeJCAMPDX(f, insert, compress=compress)
+    return f.getvalue()
+
+# directories with this extension are project bundles, see spectiveDocument.saveBundle
+bundleExtension = ".spective"
+
+def encodeBundleValue(value):
+    # the values json can not write itself
+    if isinstance(value, np.ndarray):
+        return {"$array": value.tolist(), "dtype": value.dtype.str}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime.datetime):
+        return {"$datetime": value.isoformat()}
+    raise TypeError("Can not save values of type " + type(value).__name__)
+
+def decodeBundleValue(obj):
+    # the values written by encodeBundleValue
+    if "$array" in obj:
+        return np.array(obj["$array"], dtype=obj["dtype"])
+    if "$datetime" in obj:
+        return datetime.datetime.fromisoformat(obj["$datetime"])
+    return obj
+
+def openBundle(bundleName):
+    """
+    Opens a project bundle written by spectiveDocument.saveBundle. The x and
+    y arrays are memory mapped read-only, so they are read from the disk 
+    only when they are used. saveBundle does not write them again as long 
+    as they are the same objects, so they must be replaced (e.g. s.y = 
+    s.y * 2) instead of changed in place, which raises a ValueError.
+
+    Returns
+    -------
+    spectiveDocument or None
+        None if the bundle can not be opened.
+
+    """
+    document = spectiveDocument()
+    arrayDir = os.path.join(bundleName, "arrays")
+    
+    def decodeValue(obj):
+        if "$npy" in obj:
+            values = np.load(os.path.join(arrayDir, obj["$npy"]), mmap_mode="r")
+            document.bundleArrays[id(values)] = (values, obj["$npy"])
+            return values
+        return decodeBundleValue(obj)
+    
+    try:
+        with open(os.path.join(bundleName, "document.json"), encoding="utf-8") as f:
+            data = json.load(f, object_hook=decodeValue)
+        if data.get("Format") != "pySpective Project Bundle":
+            raise ValueError("not a project bundle")
+        document.title = data["Title"]
+        document.compress = data["Compress"]
+        for pageData in data["Pages"]:
+            page = spectivePage()
+            page.title = pageData["Title"]
+            page.figureData = pageData["Figure Data"]
+            for spectrumData in pageData["Spectra"]:
+                spectrumClass = getattr(spectratypes, spectrumData["Class"], None) or getattr(spectrum, spectrumData["Class"], None)
+                if not isinstance(spectrumClass, type) or not issubclass(spectrumClass, spectrum.Spectrum):
+                    raise ValueError("unknown spectrum type " + spectrumData["Class"])
+                s = spectrumClass()
+                s.__dict__.update(spectrumData["Attributes"])
+                page._spectra.append(s)
+            if pageData["Current Spectrum"] is not None:
+                page.currentSpectrum = page._spectra[pageData["Current Spectrum"]]
+            document.pages.append(page)
+        if data["Current Page"] is not None:
+            document.currentPage = document.pages[data["Current Page"]]
+    except (OSError, KeyError, IndexError, TypeError, ValueError) as e:
+        print("Could not open " + bundleName + ": " + str(e))
+        return None
+    document.bundleName = bundleName
+    document.setModified(False)
+    return document
+
+def getFileIdentity(fileName):
+    # path, size and modification time of a file, None if it does not exist
+    try:
+        stat = os.stat(fileName)
+    except OSError:
+        return None
+    return (fileName, stat.st_size, stat.st_mtime_ns)
+
+@contextlib.contextmanager
+def atomicWrite(fileName):
+    """
+    Opens a temporary file next to fileName for writing text. It replaces 
+    fileName when the with block is left without exception, so an 
+    interrupted save never leaves a half written file.
+    """
+    fd, tempName = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fileName)), prefix=".", suffix=".tmp")
+    try:
+        with io.TextIOWrapper(os.fdopen(fd, "wb"), encoding="utf-8", newline="") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        # the permissions of a new file as by open(), mkstemp creates private files
+        if os.path.exists(fileName):
+            os.chmod(tempName, os.stat(fileName).st_mode & 0o7777)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tempName, 0o666 & ~umask)
+        os.replace(tempName, fileName)
+    except BaseException:
+        if os.path.exists(tempName):
+            os.remove(tempName)
+        raise
@@ -7,13 +7,18 @@ Created on Sat Apr  8 11:10:47 2023
 """
 
 import spectrum
+import spectrumcache
+import sourcefile
+import processpool
+import io
 import json
+import re
 import os
 import datetime
 import struct
+import warnings
 
 import numpy as np
-from scipy import stats
 
 opticalUnitsX = ["1/CM", "MICROMETERS", "NANOMETERS"]
 opticalUnitsY = ["TRANSMITTANCE", "REFLECTANCE", "ABSORBANCE"]
@@ -149,11 +154,17 @@ class xrfSpectrum(spectrum.Spectrum):
         self.displayData["Legend"] = "best"
         
         self.references = []
-        
-    def getAsJCAMPDX(self, insert=None):
+
+    def readReferencesLDR(self, data, state):
+        self.references = json.loads(data.replace("\r\n", ""))
+
+    ldrHandlers = dict(spectrum.Spectrum.ldrHandlers)
+    ldrHandlers["$XRF REFERENCES"] = readReferencesLDR
+
+    def writeJCAMPDX(self, f, insert=None, **kwargs):
         if len(self.references) > 0:
-            insert += "\r\n##$XRF REFERENCES=" + json.dumps(self.references)
-        return super().getAsJCAMPDX(insert)
+            insert = (insert + "\r\n" if insert else "") + "##$XRF REFERENCES=" + json.dumps(self.references)
+        super().writeJCAMPDX(f, insert, **kwargs)
     
     def openMCA(self, fileName):
         """
@@ -166,101 +177,43 @@ class xrfSpectrum(spectrum.Spectrum):
             
         Returns
         -------
-        None.
+        bool
+            True if the file is opened.
 
         """
         if not fileName:
             print("No file name given. ")
             return False
-        if not os.path.exists(fileName):
+        if not sourcefile.isFileObject(fileName) and not os.path.exists(fileName):
             print("file does not exist!")
             return False
         
-        f = open(fileName, "r", encoding="iso-8859-1")
-        lines = f.readlines()
-        f.close()
-
-        counts = []
-        currentLine = 0
-        comments = ""
-        while currentLine < len(lines):
-            if lines[currentLine].strip() == "<<CALIBRATION>>": # Beide Punkte für die Energiekali auslesen
-                currentLine += 2
-                CaliLine1 = lines[currentLine]
-                CaliChannel = []
-                CaliEnergy = []
-                Number = []
-                for Z in CaliLine1:   # Das ist bissl umständlich aber passt sich an verschiedene Zahlenlängen der Kaliwerte an
-                    if Z != " ":
-                        Number.append(Z)
-                    if Z == " ":
-                        Number="".join(Number)
-                        CaliChannel.append(float(str(Number)))
-                        Number = []
-                Number="".join(Number)
-                CaliEnergy.append(float(str(Number[:-1])))
-                Number = []
-                currentLine += 1
-                CaliLine2 = lines[currentLine]
-                for Z in CaliLine2:
-                    if Z != " ":
-                        Number.append(Z)
-                    if Z == " ":
-                        Number="".join(Number)
-                        CaliChannel.append(float(str(Number)))
-                        Number = []
-                Number="".join(Number)
-                CaliEnergy.append(float(str(Number[:-1])))
-            elif lines[currentLine].strip().startswith("START_TIME"):
-                print(lines[currentLine][13:])
-                self.metadata["Notes"]["Date Time"] = datetime.datetime.strptime(lines[currentLine][13:].strip(), "%m/%d/%Y %H:%M:%S")
-                currentLine += 1
-                
-            elif lines[currentLine].strip() == "<<DATA>>":
-                currentLine += 1
-                while currentLine < len(lines):
-                    if lines[currentLine].strip() == "<<END>>":
-                        currentLine += 1
-                        break
-                    else:
-                        counts.append(int(lines[currentLine].strip()))
-                        currentLine += 1
-            else:
-                comments += lines[currentLine]
-                currentLine += 1
-                
-        # Berechnen der Kalibrierdaten
-
-        slope, intercept, r, p, std_err = stats.linregress(CaliChannel, CaliEnergy )
-        Energy = []
-
-        for i in range(len(counts)):
-            y = slope * i + intercept
-            Energy.append(y)
-
-        # die Listen zu numpy array konvertieren
-        self.x = np.array(Energy)
-        self.y = np.array(counts)
+        energy, counts, startTime, comments = readMCA(fileName)
+        self.x = energy
+        self.y = counts
+        if startTime:
+            self.metadata["Notes"]["Date Time"] = startTime
         self.metadata["Comments"] = comments
-        self.metadata["Core Data"]["Title"] = os.path.basename(fileName)
-        self.title = os.path.basename(fileName)
-        self.xlim = [min(self.x), max(self.x)]
-        self.ylim = [min(self.y), max(self.y)]
+        self.metadata["Core Data"]["Title"] = os.path.basename(sourcefile.getSourceName(fileName))
+        self.title = os.path.basename(sourcefile.getSourceName(fileName))
+        self.xlim = [np.min(self.x), np.max(self.x)]
+        self.ylim = [np.min(self.y), np.max(self.y)]
         return True
     
     def openPyXrfaJSON(self, fileName):
         if not fileName:
             print("No file name given. ")
             return False
-        if not os.path.exists(fileName):
+        if not sourcefile.isFileObject(fileName) and not os.path.exists(fileName):
             print("file does not exist!")
             return False
         
-        data = json.load(open(fileName))
+        with sourcefile.openSource(fileName, "r") as f:
+            data = json.load(f)
         self.x = np.array(data['energies'])
         self.y = np.array(data['counts'])
-        self.metadata["Core Data"]["Title"] = os.path.basename(fileName)
-        self.title = os.path.basename(fileName)
+        self.metadata["Core Data"]["Title"] = os.path.basename(sourcefile.getSourceName(fileName))
+        self.title = os.path.basename(sourcefile.getSourceName(fileName))
         self.xlim = [min(self.x), max(self.x)]
         self.ylim = [min(self.y), max(self.y)]
         self.references = []
@@ -288,455 +241,700 @@ class powderXRD(spectrum.Spectrum):
         
         self.references = []
         self.wavelength = 1.5418
-        
-    def getAsJCAMPDX(self, insert=None):
+        # header of the measured range, for spectra opened from Bruker RAW4 files
+        self.rangeHeader = {}
+
+    def readReferencesLDR(self, data, state):
+        self.references = json.loads(data.replace("\r\n", ""))
+
+    ldrHandlers = dict(spectrum.Spectrum.ldrHandlers)
+    ldrHandlers["$XRD REFERENCES"] = readReferencesLDR
+
+    def writeJCAMPDX(self, f, insert=None, **kwargs):
         if len(self.references) > 0:
-            insert += "\r\n##$XRD REFERENCES=" + json.dumps(self.references)
-        return super().getAsJCAMPDX(insert)
+            insert = (insert + "\r\n" if insert else "") + "##$XRD REFERENCES=" + json.dumps(self.references)
+        super().writeJCAMPDX(f, insert, **kwargs)
     
-    def openBrukerRaw4(self, fileName):
-        # currently reads only the last diffractogram (last range)
-        varInfo = {}
-        hwInfo = {}
-        
-        fp = open(fileName, "rb")
-        fileSize = os.path.getsize(fileName)
+    def openBrukerRaw4(self, fileName, rangeNumber=-1):
+        """
+        Opens one range of a Bruker RAW4 file, by default the last one.
+        openBrukerRaw4 (module function) opens all ranges.
+        """
+        info, ranges = readBrukerRaw4(fileName)
+        if not ranges:
+            return False
+        self.setBrukerRaw4Range(fileName, info, *ranges[rangeNumber])
+        return True
 
-        fp.seek(0)
+    def setBrukerRaw4Range(self, fileName, info, rangeHeader, x, y):
+        self.x = x
+        self.y = y
+        # the range header as dict, e.g. for the measurement conditions
+        self.rangeHeader = rangeHeader
+        self.metadata["Notes"]["Date Time"] = info["Date Time"]
+        self.metadata["Comments"] += "Bruker Version: " + info["Version"]
+        self.metadata["Comments"] += "\n\n" + json.dumps(rangeHeader, indent=2)
+        self.metadata["Comments"] += "\n\n" + json.dumps(info["Hardware"], indent=2)
+        self.metadata["Comments"] += "\n\n" + json.dumps(info["Variables"], indent=2)
+        self.metadata["Core Data"]["Title"] = os.path.basename(sourcefile.getSourceName(fileName))
+        self.title = os.path.basename(sourcefile.getSourceName(fileName))
+        if len(self.x) > 0:
+            self.xlim = [np.min(self.x), np.max(self.x)]
+            self.ylim = [np.min(self.y), np.max(self.y)]
 
-        bruker_version = str(fp.read(7).decode("iso-8859-1"))
+# The record layouts of Bruker RAW4 files. Every layout is a list of
+# (name, struct format, decode) and compiled once into one struct.Struct, so
+# a record is decoded from its slice of the file with one unpack_from.
+# decode converts the raw value (text, enum or bit flags), values it returns
+# None for (unknown enum values) are left out.
 
-        fp.seek(12)
-        bruker_date = str(fp.read(12).decode("iso-8859-1")).strip('\x00')
+def decodeText(value):
+    return value.decode("iso-8859-1").strip('\x00')
 
-        fp.seek(24)
-        bruker_time = str(fp.read(12).decode("iso-8859-1")).strip('\x00')
+def lookupEnum(names):
+    # the name of an enum value
+    return lambda value: names.get(value)
 
-        bruker_datetime = datetime.datetime.strptime(bruker_date + "H" + bruker_time, "%m/%d/%YH%H:%M:%S")
-        
-        fp.seek(40)
-        iNoOfRanges = struct.unpack('i', fp.read(4))[0]
-        fp.seek(44)
-        iNoOfMeasuredRanges = struct.unpack('i', fp.read(4))[0]
-        fp.seek(56)
-        iExtraRecordSize = struct.unpack('i', fp.read(4))[0]
-        fp.seek(60)
-        szFurther_dql_reading = int.from_bytes(struct.unpack('c', fp.read(1))[0], 'big')
-        if szFurther_dql_reading != 0:
-            fp.seek(61)
-            pos = struct.unpack('i', fp.read(4))[0]
-            pos += 61
+def lookupFlags(names):
+    # the names of the bits set, in the order of the bits
+    return lambda value: [name for bit, name in names.items() if value & (1 << bit)]
+
+def compileRecord(fields):
+    # pad bytes ("4x") have no value
+    layout = struct.Struct("<" + "".join(format for name, format, decode in fields))
+    return layout, [(name, decode) for name, format, decode in fields if not format.endswith("x")]
+
+def decodeRecord(record, buffer, offset=0):
+    layout, fields = record
+    values = {}
+    for (name, decode), value in zip(fields, layout.unpack_from(buffer, offset)):
+        if decode:
+            value = decode(value)
+            if value is None:
+                continue
+        values[name] = value
+    return values
+
+raw4FileHeader = compileRecord([
+    ("Version", "7s", lambda value: value.decode("iso-8859-1")),
+    (None, "5x", None),
+    ("Date", "12s", decodeText),
+    ("Time", "12s", decodeText),
+    (None, "4x", None),
+    ("iNoOfRanges", "i", None),
+    ("iNoOfMeasuredRanges", "i", None),
+    (None, "8x", None),
+    ("iExtraRecordSize", "i", None),
+    ("szFurther_dql_reading", "B", None),
+])
+
+raw4RecordHeader = struct.Struct("<ii") # record type and length
+
+# type 10: a variable, its value follows from byte 36 to the end of the record
+raw4VariableRecord = compileRecord([
+    (None, "8x", None),
+    ("iFlags", "i", None),
+    ("szType", "12s", decodeText),
+])
+
+# type 30: the hardware configuration
+raw4HardwareRecord = compileRecord([
+    (None, "8x", None),
+    ("iGoniomModel", "i", lookupFlags({0: "D5000_TYPE", 1: "D5005_TYPE", 2: "D8_TYPE", 3: "D500_TYPE", 4: "OTHER_TYPE", 5: "D4_TYPE", 8: "THETA_2THETA", 9: "THETA_THETA", 10: "ALPHA_THETA", 11: "MATIC", 16: "GADDS", 17: "SAXS", 18: "SMART", 19: "OTHER_SYSTEM"})),
+    ("iGoniomStage", "i", lookupEnum(dict(enumerate(["STANDARD_STAGE", "SYNCHR_ROT", "ROT_REFLECTION", "ROT_TRANSMISSION", "OPEN_CRADLE", "CLOSED_CRADLE", "QUARTER_CRADLE", "PHI_STAGE", "CHI_STAGE", "XYZ_STAGE", "LOW_TEMP", "HIGH_TEMP", "EXTERNAL_TEMP", "PHI_AT_FIXED_CHI", "FOUR_CYCLE", "SMALL_XYZ_STAGE", "LARGE_XYZ_STAGE", "UNKNOWN"])))),
+    ("iSampleChanger", "i", lookupEnum(dict(enumerate(["NONE", "FOURTY_POSITION", "Y_MATIC", "XY_MATIC", "MANUAL", "UNKNOWN"])))),
+    ("iGoniomCtrl", "i", lookupFlags({0: "DIFF_CONT", 1: "TC_SOC", 2: "FDC_SOC", 3: "TC_OTHER", 4: "FDC_OTHER", 5: "GGCS", 8: "UNKNOWN"})),
+    ("fGoniomDiameter", "f", None),
+    ("iSyncAxis", "i", lookupEnum(dict(enumerate(["NONE", "REFLECTION_PHI", "TRANSMISSION_PHI", "X_CLOSED_CRADLE"])))),
+    ("iBeamOpticsFlags", "i", lookupFlags(dict(enumerate(["DIVSLIT_SET", "NEAR_SAMPLE_SLIT_SET", "PRIM_SOLLER_SLIT_SET", "ANTISC_SLIT_SET", "DET_SLIT_SET", "SEC_SOLLER_SLIT_SET", "THINFILM_ATT_SET", "BETA_FILTER_SET", "MOT_SLIT_CHANGER_SET", "MOT_ABS_CHANGER_SET", "MOT_ROTARY_ABSORBER_SET"])))),
+    ("fDivSlit", "f", None),
+    ("fNearSampleSlit", "f", None),
+    ("fPrimSollerSlit", "f", None),
+    ("iMonochromator", "i", lookupEnum(dict(enumerate(["NONE", "TRANSMISSION_MONO", "REFLECTION_MONO", "GE220_2_BOUNCE", "GE220_4_BOUNCE", "GE440_4_BOUNCE", "FLAT_GRAPHITE_MONO", "SINGLE_GOEBEL_MIRROR", "CROSSED_GOEBEL_MIRROR", "FLAT_GERMANIUM_111", "FLAT_SILICON_111", "GE_REFLECTION", "ASYM_GE_4_BOUNCE", "UNKNOWN"])))),
+    ("fAntiScSlit", "f", None),
+    ("fDetSlit", "f", None),
+    ("fSecondSollerSlit", "f", None),
+    ("fThinFilmAtt", "f", None),
+    ("iAnalyzer", "i", lookupEnum(dict(enumerate(["NONE", "GRAPHITE_ANALYZER", "LIF_ANALYZER", "GE220_CHANNEL_CUT", "GOEBEL_MIRROR_ANALYZER", "UNKNOWN"])))),
+    ("fAlphaAverage", "d", None),
+    ("fAlpha1", "d", None),
+    ("fAlpha2", "d", None),
+    ("fBeta", "d", None),
+    ("fAlphaRatio", "d", None),
+    ("fBetaRelInt", "f", None),
+    ("szAnode", "4s", decodeText),
+    ("szWaveUnit", "4s", decodeText),
+    ("fActivateAbsorber", "f", None),
+    ("fDeactivateAbsorber", "f", None),
+    ("fAbsFactor", "f", None),
+])
+
+# the header of a range, followed by iExtraRecordSize bytes and the data
+raw4RangeHeader = compileRecord([
+    ("iDataLength", "i", None),
+    ("iNoOfMeasuredData", "i", None),
+    ("iNoOfCompletedData", "i", None),
+    ("iNoOfConfDrives", "i", None),
+    ("iMotSlitChangerIn", "i", lookupEnum(dict(enumerate(["MOT_CHANGER_OUT", "MOT_CHANGER_IN", "MOT_CHANGER_AUTO"])))),
+    ("iNoOfDetectors", "i", None),
+    ("iAdditionalDetectorFlags", "i", lookupFlags(dict(enumerate(["PSD_SET", "AD_SET", "PSD_MEASURED", "AD_MEASURED", "PSD_SAVED", "AD_SAVED", "NONE"])))),
+    ("iScanMode", "i", lookupEnum(dict(enumerate(["STEPSCAN", "CONTINUOUSSCAN", "CONTINUOUSSTEPSCAN"])))),
+    ("szScanType", "24s", decodeText),
+    ("iSynchRotation", "i", None),
+    ("fMeasDelayTime", "f", None),
+    ("iEstScanTime", "i", None),
+    ("fRangeSampleStarted", "f", None),
+    ("fStart", "d", None),
+    ("fIncrement", "d", None),
+    ("iSteps", "i", None),
+    ("fStepTime", "f", None),
+    ("fRotationSpeed", "f", None),
+    ("fGeneratorVoltage", "f", None),
+    ("fGeneratorCurrent", "f", None),
+    ("iDisplayPlaneNumber", "i", None),
+    ("fActUsedLambda", "d", None),
+    ("iNoOfVaryingParams", "i", None),
+    ("iNoCounts", "i", None),
+    ("iNoEncoderDrives", "i", None),
+    ("iExtraParamFlags", "i", lookupFlags({0: "VARIABLE_TIME_PER_STEP"})),
+    ("iDataRecordLength", "i", None),
+    ("iExtraRecordSize", "i", None),
+    ("fSmoothingWidth", "f", None),
+    ("iSimMeasCond", "i", None),
+    ("fIncrement_3", "d", None),
+])
+
+def readBrukerRaw4(fileName, readData=True):
+    """
+    Reads the header and all measured ranges of a Bruker RAW4 file. Every 
+    record is decoded from its bytes by the precompiled layouts above. The 
+    intensities of a range are read as one block with np.frombuffer from 
+    a memory map of the file (or the decompressed data), the 2 theta 
+    values are calculated from the start, increment and number of steps.
+
+    Parameters
+    ----------
+    fileName : String or file object
+    readData : bool, optional
+        If False, only the headers are read, e.g. to scan the metadata of 
+        many files, and x and y of the ranges are None. The default is True.
+
+    Returns
+    -------
+    info : dict
+        "Version", "Date Time", "Hardware" (the type 30 record) and 
+        "Variables" (the type 10 records) of the file.
+    ranges : list
+        (range header, x, y) for every measured range, y in counts per 
+        second.
+
+    """
+    if sourcefile.isPlainFile(fileName):
+        # only the pages of the file used are read, the data blocks without copies
+        buffer = np.memmap(fileName, dtype=np.uint8, mode="r")
+    else:
+        # compressed files are decompressed into memory, since the records are read by position
+        buffer = sourcefile.readSource(fileName)
+    fileSize = len(buffer)
+
+    header = decodeRecord(raw4FileHeader, buffer)
+    info = {}
+    info["Version"] = header["Version"]
+    info["Date Time"] = datetime.datetime.strptime(header["Date"] + "H" + header["Time"], "%m/%d/%YH%H:%M:%S")
+    info["Hardware"] = {}
+    info["Variables"] = {}
+
+    pos = 61
+    if header["szFurther_dql_reading"] != 0:
+        pos += struct.unpack_from("<i", buffer, 61)[0]
+    while pos < 61 + header["iExtraRecordSize"]:
+        if pos >= fileSize - 8:
+            break
+        recordType, recordLength = raw4RecordHeader.unpack_from(buffer, pos)
+        if recordType == 10:
+            variable = decodeRecord(raw4VariableRecord, buffer, pos)
+            if variable["iFlags"] == 0:
+                info["Variables"][variable["szType"]] = decodeText(bytes(buffer[pos + 36:pos + recordLength]))
+        elif recordType == 30:
+            info["Hardware"] = decodeRecord(raw4HardwareRecord, buffer, pos)
+        pos += recordLength
+
+    ranges = []
+    for r in range(min(header["iNoOfRanges"], header["iNoOfMeasuredRanges"])):
+        if pos + 160 >= fileSize:
+            break
+        rangeHeader = decodeRecord(raw4RangeHeader, buffer, pos)
+        pos += 160 + rangeHeader['iExtraRecordSize']
+
+        steps = rangeHeader['iSteps']
+        iNoCounts = rangeHeader['iNoCounts']
+        # iNoCounts values per step, a truncated range is read as far as it is stored
+        count = max(0, min(steps * iNoCounts, (fileSize - pos) // 4))
+        x = y = None
+        if readData:
+            values = np.frombuffer(buffer, dtype="<f4", count=count, offset=pos)
+            x = np.repeat(rangeHeader['fStart'] + np.arange(steps) * rangeHeader['fIncrement'], iNoCounts)[:count]
+            # the only copy of the data
+            y = np.divide(values, rangeHeader['fStepTime'], dtype=np.float64)
+        pos += 4 * count
+        ranges.append((rangeHeader, x, y))
+    return info, ranges
+
+def scanBrukerRaw4(directory):
+    """
+    Reads the metadata of all Bruker RAW4 files in a directory without 
+    their data, e.g. to find measurements by their conditions.
+
+    Returns
+    -------
+    list
+        (file name, info, list of range headers) for every RAW4 file, see 
+        readBrukerRaw4.
+
+    """
+    res = []
+    for name in sorted(os.listdir(directory)):
+        fileName = os.path.join(directory, name)
+        if not os.path.isfile(fileName):
+            continue
+        try:
+            with sourcefile.openSource(fileName) as f:
+                if f.read(4) != b"RAW4":
+                    continue
+            info, ranges = readBrukerRaw4(fileName, False)
+        except (OSError, ValueError, struct.error) as e:
+            print(fileName + ": " + str(e))
+            continue
+        res.append((fileName, info, [rangeHeader for rangeHeader, x, y in ranges]))
+    return res
+
+def openBrukerRaw4(fileName):
+    """
+    Opens every measured range of a Bruker RAW4 file as one powderXRD. 
+    The range header is kept in rangeHeader of the spectra.
+
+    Returns
+    -------
+    list
+        One powderXRD per range.
+
+    """
+    info, ranges = readBrukerRaw4(fileName)
+    spectra = []
+    for i, (rangeHeader, x, y) in enumerate(ranges):
+        newSpectrum = powderXRD()
+        newSpectrum.setBrukerRaw4Range(fileName, info, rangeHeader, x, y)
+        if len(ranges) > 1:
+            newSpectrum.title += " (range " + str(i + 1) + ")"
+            newSpectrum.metadata["Core Data"]["Title"] = newSpectrum.title
+        spectra.append(newSpectrum)
+    return spectra
+
+def parseMCACounts(text):
+    # all counts at once, the slow way only to raise the error for malformed values
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        try:
+            return np.fromstring(text, dtype=np.int64, sep=" ")
+        except (DeprecationWarning, ValueError):
+            return np.array([int(value) for value in text.split()], dtype=np.int64)
+
+def readMCA(fileName):
+    """
+    Reads an mca file (DESY file format). The counts are parsed at once, 
+    the energy of the channels is calculated from the linear regression of 
+    the calibration points.
+
+    Returns
+    -------
+    energy : numpy array
+        The energy of every channel, the channel number if there is no 
+        calibration.
+    counts : numpy array
+    startTime : datetime or None
+        START_TIME of the measurement.
+    comments : String
+        All other lines of the header.
+
+    """
+    with sourcefile.openSource(fileName, "r", "iso-8859-1") as f:
+        text = f.read()
+    # the counts from <<DATA>> to <<END>> (or the end of the file) at once, the rest is the header
+    counts = []
+    header = []
+    end = 0
+    start = text.find("<<DATA>>")
+    while start >= 0:
+        header.append(text[end:start])
+        dataStart = text.find("\n", start) + 1 or len(text)
+        dataEnd = text.find("<<END>>", dataStart)
+        if dataEnd < 0:
+            dataEnd = len(text)
+        counts.append(parseMCACounts(text[dataStart:dataEnd]))
+        end = text.find("\n", dataEnd) + 1 or len(text)
+        start = text.find("<<DATA>>", end)
+    header.append(text[end:])
+    counts = np.concatenate(counts) if counts else np.empty(0, dtype=np.int64)
+    # the header is short, it is read line by line
+    lines = "".join(header).splitlines(keepends=True)
+    calibration = []
+    startTime = None
+    comments = ""
+    currentLine = 0
+    while currentLine < len(lines):
+        line = lines[currentLine].strip()
+        if line == "<<CALIBRATION>>":
+            # a label line and the pairs of channel and energy up to the next section
+            currentLine += 2
+            while currentLine < len(lines) and len(lines[currentLine].split()) >= 2 and not lines[currentLine].strip().startswith("<<"):
+                calibration.append([float(value) for value in lines[currentLine].split()[-2:]])
+                currentLine += 1
+            continue
+        if line.startswith("START_TIME"):
+            startTime = datetime.datetime.strptime(lines[currentLine][13:].strip(), "%m/%d/%Y %H:%M:%S")
         else:
-            pos = 61
-        while pos < 61 + iExtraRecordSize:
-            if pos >= fileSize - 8:
-                break
-            fp.seek(pos)
-            iRecordType = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+4)
-            iRecordLength = struct.unpack('i', fp.read(4))[0]
-            
-            if iRecordType == 10:
-                fp.seek(pos+8)
-                iFlags = struct.unpack('i', fp.read(4))[0]
-                fp.seek(pos+12)
-                szType = str(fp.read(12).decode("iso-8859-1")).strip('\x00')
-                if iFlags == 0:
-                    fp.seek(pos+36)
-                    sz = str(fp.read(iRecordLength - 36).decode("iso-8859-1")).strip('\x00')
-                    varInfo[szType] = sz
-            elif iRecordType == 30:
-                fp.seek(pos+8)
-                iGoniomModel = struct.unpack('i', fp.read(4))[0]
-                flagsGoniomModel = [False for x in range(32)]
-                
-                lGoniomModel = []
-                for b in range(32):
-                    flagsGoniomModel[b] = bool(0 != (iGoniomModel & (1 << b)))
-                if flagsGoniomModel[0]:
-                    lGoniomModel.append("D5000_TYPE");
-                if flagsGoniomModel[1]:
-                    lGoniomModel.append("D5005_TYPE");
-                if flagsGoniomModel[2]:
-                    lGoniomModel.append("D8_TYPE");
-                if flagsGoniomModel[3]:
-                    lGoniomModel.append("D500_TYPE");
-                if flagsGoniomModel[4]:
-                    lGoniomModel.append("OTHER_TYPE");
-                if flagsGoniomModel[5]:
-                    lGoniomModel.append("D4_TYPE");
-                if flagsGoniomModel[8]:
-                    lGoniomModel.append("THETA_2THETA");
-                if flagsGoniomModel[9]:
-                    lGoniomModel.append("THETA_THETA");
-                if flagsGoniomModel[10]:
-                    lGoniomModel.append("ALPHA_THETA");
-                if flagsGoniomModel[11]:
-                    lGoniomModel.append("MATIC");
-                if flagsGoniomModel[16]:
-                    lGoniomModel.append("GADDS");
-                if flagsGoniomModel[17]:
-                    lGoniomModel.append("SAXS");
-                if flagsGoniomModel[18]:
-                    lGoniomModel.append("SMART");
-                if flagsGoniomModel[19]:
-                    lGoniomModel.append("OTHER_SYSTEM");
-                hwInfo['iGoniomModel'] = lGoniomModel
-                
-                fp.seek(pos+12)
-                iGoniomStage = struct.unpack('i', fp.read(4))[0]
-                if iGoniomStage == 0:
-                    hwInfo['iGoniomStage'] = "STANDARD_STAGE"
-                elif iGoniomStage == 1:
-                    hwInfo['iGoniomStage'] = "SYNCHR_ROT"
-                elif iGoniomStage == 2:
-                    hwInfo['iGoniomStage'] = "ROT_REFLECTION"
-                elif iGoniomStage == 3:
-                    hwInfo['iGoniomStage'] = "ROT_TRANSMISSION"
-                elif iGoniomStage == 4:
-                    hwInfo['iGoniomStage'] = "OPEN_CRADLE"
-                elif iGoniomStage == 5:
-                    hwInfo['iGoniomStage'] = "CLOSED_CRADLE"
-                elif iGoniomStage == 6:
-                    hwInfo['iGoniomStage'] = "QUARTER_CRADLE"
-                elif iGoniomStage == 7:
-                    hwInfo['iGoniomStage'] = "PHI_STAGE"
-                elif iGoniomStage == 8:
-                    hwInfo['iGoniomStage'] = "CHI_STAGE"
-                elif iGoniomStage == 9:
-                    hwInfo['iGoniomStage'] = "XYZ_STAGE"
-                elif iGoniomStage == 10:
-                    hwInfo['iGoniomStage'] = "LOW_TEMP"
-                elif iGoniomStage == 11:
-                    hwInfo['iGoniomStage'] = "HIGH_TEMP"
-                elif iGoniomStage == 12:
-                    hwInfo['iGoniomStage'] = "EXTERNAL_TEMP"
-                elif iGoniomStage == 13:
-                    hwInfo['iGoniomStage'] = "PHI_AT_FIXED_CHI"
-                elif iGoniomStage == 14:
-                    hwInfo['iGoniomStage'] = "FOUR_CYCLE"
-                elif iGoniomStage == 15:
-                    hwInfo['iGoniomStage'] = "SMALL_XYZ_STAGE"
-                elif iGoniomStage == 16:
-                    hwInfo['iGoniomStage'] = "LARGE_XYZ_STAGE"
-                elif iGoniomStage == 17:
-                    hwInfo['iGoniomStage'] = "UNKNOWN"
-                    
-                fp.seek(pos + 16)
-                iSampleChanger= struct.unpack('i', fp.read(4))[0]
-                if iSampleChanger == 0:
-                    hwInfo['iSampleChanger'] = "NONE"
-                elif iSampleChanger == 1:
-                    hwInfo['iSampleChanger'] = "FOURTY_POSITION"
-                elif iSampleChanger == 2:
-                    hwInfo['iSampleChanger'] = "Y_MATIC"
-                elif iSampleChanger == 3:
-                    hwInfo['iSampleChanger'] = "XY_MATIC"
-                elif iSampleChanger == 4:
-                    hwInfo['iSampleChanger'] = "MANUAL"
-                elif iSampleChanger == 5:
-                    hwInfo['iSampleChanger'] = "UNKNOWN"
-                
-                fp.seek(pos+20)
-                iGoniomCtrl = struct.unpack('i', fp.read(4))[0]
-                flagsGoniomCtrl = [False for x in range(32)]
-                
-                lGoniomCtrl = []
-                for b in range(32):
-                    flagsGoniomCtrl[b] = bool(0 != (iGoniomCtrl & (1 << b)))
-                if flagsGoniomCtrl[0]:
-                    lGoniomCtrl.append("DIFF_CONT");
-                if flagsGoniomCtrl[1]:
-                    lGoniomCtrl.append("TC_SOC");
-                if flagsGoniomCtrl[2]:
-                    lGoniomCtrl.append("FDC_SOC");
-                if flagsGoniomCtrl[3]:
-                    lGoniomCtrl.append("TC_OTHER");
-                if flagsGoniomCtrl[4]:
-                    lGoniomCtrl.append("FDC_OTHER");
-                if flagsGoniomCtrl[5]:
-                    lGoniomCtrl.append("GGCS");
-                if flagsGoniomCtrl[8]:
-                    lGoniomCtrl.append("UNKNOWN");
-                hwInfo['iGoniomCtrl'] = lGoniomCtrl
-                
-                fp.seek(pos+24)
-                hwInfo['fGoniomDiameter'] = struct.unpack('f', fp.read(4))[0]
-                
-                fp.seek(pos+28)
-                iSyncAxis = struct.unpack('i', fp.read(4))[0]
-                if iSyncAxis == 0:
-                    hwInfo['iSyncAxis'] = "NONE"
-                elif iSyncAxis == 1:
-                    hwInfo['iSyncAxis'] = "REFLECTION_PHI"
-                elif iSyncAxis == 2:
-                    hwInfo['iSyncAxis'] = "TRANSMISSION_PHI"
-                elif iSyncAxis == 3:
-                    hwInfo['iSyncAxis'] = "X_CLOSED_CRADLE"
-                
-                fp.seek(pos+32)
-                iBeamOpticsFlags = struct.unpack('i', fp.read(4))[0]
-                flagsBeamOpticsFlags = [False for x in range(32)]
-                
-                lBeamOpticsFlags = []
-                for b in range(32):
-                    flagsBeamOpticsFlags[b] = bool(0 != (iBeamOpticsFlags & (1 << b)))
-                if flagsBeamOpticsFlags[0]:
-                    lBeamOpticsFlags.append("DIVSLIT_SET");
-                if flagsBeamOpticsFlags[1]:
-                    lBeamOpticsFlags.append("NEAR_SAMPLE_SLIT_SET");
-                if flagsBeamOpticsFlags[2]:
-                    lBeamOpticsFlags.append("PRIM_SOLLER_SLIT_SET");
-                if flagsBeamOpticsFlags[3]:
-                    lBeamOpticsFlags.append("ANTISC_SLIT_SET");
-                if flagsBeamOpticsFlags[4]:
-                    lBeamOpticsFlags.append("DET_SLIT_SET");
-                if flagsBeamOpticsFlags[5]:
-                    lBeamOpticsFlags.append("SEC_SOLLER_SLIT_SET");
-                if flagsBeamOpticsFlags[6]:
-                    lBeamOpticsFlags.append("THINFILM_ATT_SET");
-                if flagsBeamOpticsFlags[7]:
-                    lBeamOpticsFlags.append("BETA_FILTER_SET");
-                if flagsBeamOpticsFlags[8]:
-                    lBeamOpticsFlags.append("MOT_SLIT_CHANGER_SET");
-                if flagsBeamOpticsFlags[9]:
-                    lBeamOpticsFlags.append("MOT_ABS_CHANGER_SET");
-                if flagsBeamOpticsFlags[10]:
-                    lBeamOpticsFlags.append("MOT_ROTARY_ABSORBER_SET");
-                hwInfo['iBeamOpticsFlags'] = lBeamOpticsFlags
-                
-                fp.seek(pos+36)
-                hwInfo['fDivSlit'] = struct.unpack('f', fp.read(4))[0]
-                fp.seek(pos+40)
-                hwInfo['fNearSampleSlit'] = struct.unpack('f', fp.read(4))[0]
-                fp.seek(pos+44)
-                hwInfo['fPrimSollerSlit'] = struct.unpack('f', fp.read(4))[0]
-                
-                fp.seek(pos+48)
-                iMonochromator = struct.unpack('i', fp.read(4))[0]
-                if iMonochromator == 0:
-                    hwInfo['iMonochromator'] = "NONE"
-                elif iMonochromator == 1:
-                    hwInfo['iMonochromator'] = "TRANSMISSION_MONO"
-                elif iMonochromator == 2:
-                    hwInfo['iMonochromator'] = "REFLECTION_MONO"
-                elif iMonochromator == 3:
-                    hwInfo['iMonochromator'] = "GE220_2_BOUNCE"
-                elif iMonochromator == 4:
-                    hwInfo['iMonochromator'] = "GE220_4_BOUNCE"
-                elif iMonochromator == 5:
-                    hwInfo['iMonochromator'] = "GE440_4_BOUNCE"
-                elif iMonochromator == 6:
-                    hwInfo['iMonochromator'] = "FLAT_GRAPHITE_MONO"
-                elif iMonochromator == 7:
-                    hwInfo['iMonochromator'] = "SINGLE_GOEBEL_MIRROR"
-                elif iMonochromator == 8:
-                    hwInfo['iMonochromator'] = "CROSSED_GOEBEL_MIRROR"
-                elif iMonochromator == 9:
-                    hwInfo['iMonochromator'] = "FLAT_GERMANIUM_111"
-                elif iMonochromator == 10:
-                    hwInfo['iMonochromator'] = "FLAT_SILICON_111"
-                elif iMonochromator == 11:
-                    hwInfo['iMonochromator'] = "GE_REFLECTION"
-                elif iMonochromator == 12:
-                    hwInfo['iMonochromator'] = "ASYM_GE_4_BOUNCE"
-                elif iMonochromator == 13:
-                    hwInfo['iMonochromator'] = "UNKNOWN"
-                
-                fp.seek(pos+52)
-                hwInfo['fAntiScSlit'] = struct.unpack('f', fp.read(4))[0]
-                fp.seek(pos+56)
-                hwInfo['fDetSlit'] = struct.unpack('f', fp.read(4))[0]
-                fp.seek(pos+60)
-                hwInfo['fSecondSollerSlit'] = struct.unpack('f', fp.read(4))[0]
-                fp.seek(pos+64)
-                hwInfo['fThinFilmAtt'] = struct.unpack('f', fp.read(4))[0]
-                
-                fp.seek(pos+68)
-                iAnalyzer = struct.unpack('i', fp.read(4))[0]
-                if iAnalyzer == 0:
-                    hwInfo['iAnalyzer'] = "NONE"
-                elif iAnalyzer == 1:
-                    hwInfo['iAnalyzer'] = "GRAPHITE_ANALYZER"
-                elif iAnalyzer == 2:
-                    hwInfo['iAnalyzer'] = "LIF_ANALYZER"
-                elif iAnalyzer == 3:
-                    hwInfo['iAnalyzer'] = "GE220_CHANNEL_CUT"
-                elif iAnalyzer == 4:
-                    hwInfo['iAnalyzer'] = "GOEBEL_MIRROR_ANALYZER"
-                elif iAnalyzer == 5:
-                    hwInfo['iAnalyzer'] = "UNKNOWN"
-                    
-                fp.seek(pos+72)
-                hwInfo['fAlphaAverage'] = struct.unpack('d', fp.read(8))[0]
-                fp.seek(pos+80)
-                hwInfo['fAlpha1'] = struct.unpack('d', fp.read(8))[0]
-                fp.seek(pos+88)
-                hwInfo['fAlpha2'] = struct.unpack('d', fp.read(8))[0]
-                fp.seek(pos+96)
-                hwInfo['fBeta'] = struct.unpack('d', fp.read(8))[0]
-                fp.seek(pos+104)
-                hwInfo['fAlphaRatio'] = struct.unpack('d', fp.read(8))[0]
-                fp.seek(pos+112)
-                hwInfo['fBetaRelInt'] = struct.unpack('f', fp.read(4))[0]
-                fp.seek(pos+116)
-                hwInfo['szAnode'] = str(fp.read(4).decode("iso-8859-1")).strip('\x00')
-                fp.seek(pos+120)
-                hwInfo['szWaveUnit'] = str(fp.read(4).decode("iso-8859-1")).strip('\x00')
-                fp.seek(pos+124)
-                hwInfo['fActivateAbsorber'] = struct.unpack('f', fp.read(4))[0]
-                fp.seek(pos+128)
-                hwInfo['fDeactivateAbsorber'] = struct.unpack('f', fp.read(4))[0]
-                fp.seek(pos+132)
-                hwInfo['fAbsFactor'] = struct.unpack('f', fp.read(4))[0]
-                
-            pos += iRecordLength
-        
-        if iNoOfRanges > iNoOfMeasuredRanges:
-            NumberOfRanges = iNoOfMeasuredRanges
+            comments += lines[currentLine]
+        currentLine += 1
+
+    if len(calibration) >= 2:
+        # linear regression
+        channels, energies = np.array(calibration).T
+        slope = np.mean((channels - channels.mean()) * (energies - energies.mean())) / np.mean((channels - channels.mean()) ** 2)
+        intercept = energies.mean() - slope * channels.mean()
+    else:
+        slope, intercept = 1.0, 0.0
+    energy = slope * np.arange(len(counts)) + intercept
+    return energy, counts, startTime, comments
+
+# below this number of files, starting worker processes takes longer than reading the files
+minMCAFilesForPool = 16
+
+def readMCAFiles(fileNames, workers=None):
+    """
+    Reads many mca files, e.g. all spectra of a scan, in parallel in a pool 
+    of worker processes and stacks them.
+
+    Parameters
+    ----------
+    fileNames : list of String
+    workers : int, optional
+        Number of worker processes. The default is the number of CPU cores.
+
+    Raises
+    ------
+    ValueError
+        If the files have different numbers of channels.
+
+    Returns
+    -------
+    energy : numpy array
+        The energy of the channels, one row per file.
+    counts : numpy array
+        The counts, one row per file.
+
+    """
+    if not fileNames:
+        return np.empty((0, 0)), np.empty((0, 0), dtype=np.int64)
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(fileNames))
+    if workers < 2 or len(fileNames) < minMCAFilesForPool:
+        spectra = [readMCA(fileName) for fileName in fileNames]
+    else:
+        with processpool.createPool(workers) as pool:
+            spectra = list(pool.map(readMCA, fileNames, chunksize=max(1, len(fileNames) // (4 * workers))))
+    for fileName, (energy, counts, startTime, comments) in zip(fileNames, spectra):
+        if len(counts) != len(spectra[0][1]):
+            raise ValueError(str(fileName) + " has " + str(len(counts)) + " channels, " + str(fileNames[0]) + " has " + str(len(spectra[0][1])))
+    return np.stack([s[0] for s in spectra]), np.stack([s[1] for s in spectra])
+
+def readMCADirectory(directory, workers=None):
+    """
+    Reads all mca files of a directory (e.g. a scan) in the order of their 
+    names, see readMCAFiles.
+
+    Returns
+    -------
+    fileNames : list of String
+    energy, counts : numpy array
+        One row per file.
+
+    """
+    fileNames = [os.path.join(directory, name) for name in sorted(os.listdir(directory)) if name.lower().endswith(".mca")]
+    energy, counts = readMCAFiles(fileNames, workers)
+    return fileNames, energy, counts
+
+# empty cells of the AMETEK count table, of filters with less channels
+emptyCellPattern = re.compile(r"(?<=\t)(?=\t|\r?$)", re.MULTILINE)
+
+def openAMETEK(fileName):
+    """
+    Opens a TXT export of AMETEK XRF spectrometers: two lines with the 
+    offset and the slope of the energy calibration of every filter, five 
+    more header lines and a table with the channel and the counts of every 
+    filter. The number of filters and the number of channels of every filter 
+    (the cells up to the first empty cell) are taken from the file.
+
+    Returns
+    -------
+    list
+        One xrfSpectrum per filter, empty if the file could not be opened.
+
+    """
+    with sourcefile.openSource(fileName, "r") as f:
+        text = f.read()
+    lines = text.split("\n", 7)
+    if len(lines) < 8:
+        print(sourcefile.getSourceName(fileName) + ": no AMETEK counts")
+        return []
+    try:
+        # label, one value per filter and a trailing tab
+        calibration = np.array([[float(value.replace(",", ".")) for value in line.rstrip("\r").rstrip("\t").split("\t")[1:]] for line in lines[:2]])
+        numFilters = calibration.shape[1]
+        # the whole table at once, empty cells are NaN
+        table = emptyCellPattern.sub("nan", lines[7].replace(",", "."))
+        counts = np.loadtxt(io.StringIO(table), delimiter="\t", usecols=range(1, numFilters + 1), ndmin=2, comments=None)
+    except ValueError as e:
+        print(sourcefile.getSourceName(fileName) + ": " + str(e))
+        return []
+    spectra = []
+    for i in range(numFilters):
+        y = counts[:, i]
+        empty = np.isnan(y)
+        if empty.any():
+            y = y[:np.argmax(empty)]
+        # the channels are counted from 1
+        x = calibration[0, i] + calibration[1, i] * np.arange(1, len(y) + 1)
+        ns = xrfSpectrum()
+        ns.openAndSetXY(x, np.ascontiguousarray(y))
+        ns.title = "Spectrum with filter " + str(i + 1)
+        ns.metadata["Core Data"]["Title"] = ns.title
+        spectra.append(ns)
+    return spectra
+
+# spectrum class by the ##DATA TYPE= of a JCAMP-DX block, e.g. "INFRARED SPECTRUM DERIVATIVE" is an infrared spectrum
+dataTypes = {
+    "INFRARED SPECTRUM": infraredSpectrum,
+    "RAMAN SPECTRUM": ramanSpectrum,
+    "ULTRAVIOLET SPECTRUM": ultravioletSpectrum,
+    "POWDER X-RAY DIFFRACTION": powderXRD,
+    "X-RAY FLUORESCENCE SPECTRUM": xrfSpectrum,
+}
+
+# spectrum class by the spectrum type of the free text settings
+freeTextTypes = {
+    "Raman": ramanSpectrum,
+    "Infrared": infraredSpectrum,
+    "UV/VIS": ultravioletSpectrum,
+    "Powder XRD": powderXRD,
+    "XRF": xrfSpectrum,
+}
+
+# all spectrum classes by their name, see unpackSpectrum
+spectrumClasses = {spectrumClass.__name__: spectrumClass for spectrumClass in (
+    spectrum.Spectrum, opticalSpectrum, ramanSpectrum, infraredSpectrum, ultravioletSpectrum, xrfSpectrum, powderXRD)}
+
+def packSpectrum(s):
+    """
+    Returns the compact payload of a spectrum, which is sent to or from a 
+    worker process instead of the spectrum itself: the name of its class, 
+    the x and y values and the other attributes.
+    """
+    attributes = {key: value for key, value in vars(s).items() if key not in ("x", "y")}
+    return type(s).__name__, np.asarray(s.x), np.asarray(s.y), attributes
+
+def unpackSpectrum(payload):
+    # the spectrum of a payload of packSpectrum
+    className, x, y, attributes = payload
+    s = spectrumClasses[className]()
+    s.__dict__.update(attributes)
+    s.x = x
+    s.y = y
+    return s
+
+dataTypeLDR = re.compile(r"^##DATA\s?TYPE=(.*)$", re.MULTILINE | re.IGNORECASE)
+
+def getSpectrumClass(dataType):
+    dataType = dataType.upper()
+    for key in dataTypes:
+        if key in dataType:
+            return dataTypes[key]
+    return spectrum.Spectrum
+
+def openJCAMPDXblock(block):
+    """
+    Opens a Spectrum from a JCAMP-DX Block. The type of the spectrum is taken 
+    from the ##DATA TYPE= label in the header of the block.
+
+    Parameters
+    ----------
+    block : String
+        One ##TITLE= ... ##END= block.
+
+    Returns
+    -------
+    Spectrum or False
+
+    """
+    m = dataTypeLDR.search(block)
+    newSpectrum = getSpectrumClass(m.group(1) if m else "")()
+    if newSpectrum.openJCAMPDXfromString(block):
+        return newSpectrum
+    return False
+
+def openJCAMPNTuples(fileName):
+    """
+    Opens every page of a JCAMP-DX ##NTUPLES= file (e.g. a time-resolved 
+    series) as one spectrum. The file is read page by page.
+
+    Returns
+    -------
+    list
+        One Spectrum per page.
+
+    """
+    spectra = []
+    for header, page in spectrum.iterJCAMPNTuples(fileName):
+        newSpectrum = getSpectrumClass(header.get("DATA TYPE", header.get("NTUPLES", "")))()
+        newSpectrum.x = page["x"]
+        newSpectrum.y = page["y"]
+        if len(newSpectrum.x) > 0:
+            newSpectrum.xlim = [np.min(newSpectrum.x), np.max(newSpectrum.x)]
+            newSpectrum.ylim = [np.min(newSpectrum.y), np.max(newSpectrum.y)]
+        newSpectrum.title = header.get("TITLE", os.path.basename(sourcefile.getSourceName(fileName))) + " " + page["PAGE"]
+        newSpectrum.metadata["Core Data"]["Title"] = newSpectrum.title
+        newSpectrum.metadata["Core Data"]["Origin"] = header.get("ORIGIN", "")
+        newSpectrum.metadata["Core Data"]["Owner"] = header.get("OWNER", "")
+        symbols = [symbol.upper() for symbol in header.get("SYMBOL", [])]
+        units = header.get("UNITS", [])
+        for symbol, key in zip(page["SYMBOLS"], ("X Units", "Y Units")):
+            if symbol.upper() in symbols and symbols.index(symbol.upper()) < len(units):
+                newSpectrum.metadata["Spectral Parameters"][key] = units[symbols.index(symbol.upper())]
+        spectra.append(newSpectrum)
+    return spectra
+
+def openFreeTextColumns(fileName, options, progress=None):
+    """
+    Opens every y column of a text file with one x column and many y 
+    columns (e.g. a time series) as one spectrum. All columns are parsed 
+    in one pass, the spectra share the array of the x values. The names of 
+    the columns in the header are the titles of the spectra. See 
+    spectrum.readFreeTextColumns for progress.
+
+    Returns
+    -------
+    list or String
+        One Spectrum per y column or the error message.
+
+    """
+    if options.get("Spectrum Type") not in freeTextTypes:
+        return "Spectrum type not implemented, yet."
+    spectrumClass = freeTextTypes[options["Spectrum Type"]]
+    name = os.path.basename(sourcefile.getSourceName(fileName))
+    with sourcefile.openSource(fileName, "r", options["File Encoding"]) as f:
+        columns, comments, malformed, header = spectrum.readFreeTextColumns(f, options, None, progress)
+    if columns is None:
+        return "Cancelled"
+    if malformed:
+        print(name + ": " + str(len(malformed)) + " malformed lines skipped, the first is line " + str(malformed[0][0]) + ": " + malformed[0][1])
+    if len(columns[0]) == 0:
+        if malformed:
+            return "Wrong Column Delimiter"
+        return "Could not OpenFile"
+    x = columns[0]
+    xlim = [float(np.min(x)), float(np.max(x))]
+    comments = "".join("\r\n" + line for line in comments)
+    spectra = []
+    for i, y in enumerate(columns[1:], 1):
+        newSpectrum = spectrumClass()
+        if i < len(header) and header[i]:
+            newSpectrum.title = header[i]
         else:
-            NumberOfRanges = iNoOfRanges
-        
-        for r in range(NumberOfRanges):
-            if pos + 160 >= fileSize:
-                break
-            rangeHeader = {}
-            fp.seek(pos)
-            rangeHeader['iDataLength'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos + 4)
-            rangeHeader['iNoOfMeasuredData'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos + 8)
-            rangeHeader['iNoOfCompletedData'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos + 12)
-            rangeHeader['iNoOfConfDrives'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos + 16)
-            iMotSlitChangerIn = struct.unpack('i', fp.read(4))[0]
-            if iMotSlitChangerIn == 0:
-                rangeHeader['iMotSlitChangerIn'] = "MOT_CHANGER_OUT"
-            elif iMotSlitChangerIn == 1:
-                rangeHeader['iMotSlitChangerIn'] = "MOT_CHANGER_IN"
-            elif iMotSlitChangerIn == 2:
-                rangeHeader['iMotSlitChangerIn'] = "MOT_CHANGER_AUTO"
-            fp.seek(pos + 20)
-            rangeHeader['iNoOfDetectors'] = struct.unpack('i', fp.read(4))[0]
-            
-            fp.seek(pos + 24)
-            iAdditionalDetectorFlags = struct.unpack('i', fp.read(4))[0]
-            flagsAdditionalDetectorFlags = [False for x in range(32)]
-            
-            lAdditionalDetectorFlags = []
-            for b in range(32):
-                flagsAdditionalDetectorFlags[b] = bool(0 != (iAdditionalDetectorFlags & (1 << b)))
-            if flagsAdditionalDetectorFlags[0]:
-                lAdditionalDetectorFlags.append("PSD_SET")
-            if flagsAdditionalDetectorFlags[1]:
-                lAdditionalDetectorFlags.append("AD_SET")
-            if flagsAdditionalDetectorFlags[2]:
-                lAdditionalDetectorFlags.append("PSD_MEASURED")
-            if flagsAdditionalDetectorFlags[3]:
-                lAdditionalDetectorFlags.append("AD_MEASURED")
-            if flagsAdditionalDetectorFlags[4]:
-                lAdditionalDetectorFlags.append("PSD_SAVED")
-            if flagsAdditionalDetectorFlags[5]:
-                lAdditionalDetectorFlags.append("AD_SAVED")
-            if flagsAdditionalDetectorFlags[6]:
-                lAdditionalDetectorFlags.append("NONE")
-            rangeHeader['iAdditionalDetectorFlags'] = lAdditionalDetectorFlags
-            
-            fp.seek(pos + 28)
-            iScanMode = struct.unpack('i', fp.read(4))[0]
-            if iScanMode == 0:
-                rangeHeader['iScanMode'] = "STEPSCAN"
-            elif iScanMode == 1:
-                rangeHeader['iScanMode'] = "CONTINUOUSSCAN"
-            elif iScanMode == 2:
-                rangeHeader['iScanMode'] = "CONTINUOUSSTEPSCAN"
-            
-            fp.seek(pos+32)
-            rangeHeader['szScanType'] = str(fp.read(24).decode("iso-8859-1")).strip('\x00')
-            fp.seek(pos+56)
-            rangeHeader['iSynchRotation'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+60)
-            rangeHeader['fMeasDelayTime'] = struct.unpack('f', fp.read(4))[0]
-            fp.seek(pos+64)
-            rangeHeader['iEstScanTime'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+68)
-            rangeHeader['fRangeSampleStarted'] = struct.unpack('f', fp.read(4))[0]
-            fp.seek(pos+72)
-            rangeHeader['fStart'] = struct.unpack('d', fp.read(8))[0]
-            fp.seek(pos+80)
-            rangeHeader['fIncrement'] = struct.unpack('d', fp.read(8))[0]
-            fp.seek(pos+88)
-            rangeHeader['iSteps'] =  struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+92)
-            rangeHeader['fStepTime'] = struct.unpack('f', fp.read(4))[0]
-            fp.seek(pos+96)
-            rangeHeader['fRotationSpeed'] = struct.unpack('f', fp.read(4))[0]
-            fp.seek(pos+100)
-            rangeHeader['fGeneratorVoltage'] = struct.unpack('f', fp.read(4))[0]
-            fp.seek(pos+104)
-            rangeHeader['fGeneratorCurrent'] = struct.unpack('f', fp.read(4))[0]
-            fp.seek(pos+108)
-            rangeHeader['iDisplayPlaneNumber'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+112)
-            rangeHeader['fActUsedLambda'] = struct.unpack('d', fp.read(8))[0]
-            fp.seek(pos+120)
-            rangeHeader['iNoOfVaryingParams'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+124)
-            rangeHeader['iNoCounts'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+128)
-            rangeHeader['iNoEncoderDrives'] = struct.unpack('i', fp.read(4))[0]
-            
-            fp.seek(pos+132)
-            iExtraParamFlags = struct.unpack('i', fp.read(4))[0]
-            flagsExtraParamFlags = [False for x in range(32)]
-            
-            lAdditionalDetectorFlags = []
-            for b in range(32):
-                flagsExtraParamFlags[b] = bool(0 != (iExtraParamFlags & (1 << b)))
-            lExtraParamFlags = []
-            if flagsExtraParamFlags[0]:
-                lExtraParamFlags.append("VARIABLE_TIME_PER_STEP")
-            rangeHeader['iExtraParamFlags'] = lExtraParamFlags
-            
-            fp.seek(pos+136)
-            rangeHeader['iDataRecordLength'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+140)
-            rangeHeader['iExtraRecordSize'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+144)
-            rangeHeader['fSmoothingWidth'] = struct.unpack('f', fp.read(4))[0]
-            fp.seek(pos+148)
-            rangeHeader['iSimMeasCond'] = struct.unpack('i', fp.read(4))[0]
-            fp.seek(pos+152)
-            rangeHeader['fIncrement_3'] = struct.unpack('d', fp.read(8))[0]
-            
-            pos += 160 + rangeHeader['iExtraRecordSize']
-            
-            start = rangeHeader['fStart']
-            steps = rangeHeader['iSteps']
-            increment = rangeHeader['fIncrement']
-            end = start + steps * increment
-            stepTime = rangeHeader['fStepTime']
-            iNoCounts = rangeHeader['iNoCounts']
-
-            x = []
-            y = []
-            for j in range(steps):
-                for k in range(iNoCounts):
-                    fp.seek(pos)
-                    x.append(start + (j/(steps - 1)) * (end - start))
-                    y.append(struct.unpack('f', fp.read(4))[0] / stepTime)
-                    pos += 4
-        
-        self.x = np.array(x)
-        self.y = np.array(y)
-        self.metadata["Notes"]["Date Time"] = bruker_datetime
-        self.metadata["Comments"] += "Bruker Version: " + bruker_version
-        self.metadata["Comments"] += "\n\n" + json.dumps(rangeHeader, indent=2)
-        self.metadata["Comments"] += "\n\n" + json.dumps(hwInfo, indent=2)
-        self.metadata["Comments"] += "\n\n" + json.dumps(varInfo, indent=2)
-        self.metadata["Core Data"]["Title"] = os.path.basename(fileName)
-        self.title = os.path.basename(fileName)
-        self.xlim = [min(self.x), max(self.x)]
-        self.ylim = [min(self.y), max(self.y)]
-        return True
\ No newline at end of file
+            newSpectrum.title = name + " (column " + str(i + 1) + ")"
+        newSpectrum.metadata["Core Data"]["Title"] = newSpectrum.title
+        newSpectrum.metadata["Comments"] = comments
+        newSpectrum.x = x
+        newSpectrum.y = y
+        newSpectrum.xlim = list(xlim)
+        newSpectrum.ylim = [float(np.min(y)), float(np.max(y))]
+        spectra.append(newSpectrum)
+    return spectra
+
+# below this number of blocks, starting worker processes takes longer than decoding the blocks
+minBlocksForPool = 8
+
+def openJCAMPDXfileBlock(fileName, offset, length):
+    """
+    Reads and opens one block of a JCAMP-DX file indexed by spectrum.getJCAMPblockIndex.
+    This is the job of the worker processes in openJCAMPDXblocks.
+
+    Returns
+    -------
+    Spectrum or False
+
+    """
+    return openJCAMPDXblock(spectrum.readJCAMPblock(fileName, offset, length))
+
+def decodeJCAMPDXfileBlock(fileName, offset, length, data=None):
+    # the job of the worker processes in openJCAMPDXblocks: the payload of the spectrum, see packSpectrum
+    # data is the block read by openJCAMPDXblocks from compressed files, None to read it from the file
+    if data is None:
+        s = openJCAMPDXfileBlock(fileName, offset, length)
+    else:
+        s = openJCAMPDXblock(data.decode("utf-8", "replace"))
+    return packSpectrum(s) if s else False
+
+def openJCAMPDXblocks(blocks, workers=None):
+    """
+    Opens many JCAMP-DX blocks in parallel in a pool of worker processes.
+    Each worker reads its blocks from the file itself, only the payloads of
+    the decoded spectra (see packSpectrum) are sent back. Compressed files 
+    are decompressed once by this process, which sends the blocks. Decoded blocks are kept in the spectrum cache.
+
+    Parameters
+    ----------
+    blocks : list
+        (fileName, offset, length) of the blocks.
+    workers : int, optional
+        Number of worker processes. The default is the number of CPU cores.
+
+    Returns
+    -------
+    list
+        Spectrum or False for every block, in the order of blocks.
+
+    """
+    # blocks decoded before are taken from the cache
+    spectra = [None] * len(blocks)
+    missing = []
+    for i, (fileName, offset, length) in enumerate(blocks):
+        cached = spectrumcache.load(fileName, getBlockTag(offset, length))
+        if cached:
+            spectra[i] = cached[0]
+        else:
+            missing.append(i)
+    if not missing:
+        return spectra
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(missing))
+    if workers < 2 or len(missing) < minBlocksForPool:
+        decoded = [openJCAMPDXfileBlock(*blocks[i]) for i in missing]
+    else:
+        fileNames, offsets, lengths = zip(*[blocks[i] for i in missing])
+        # compressed files are decompressed here once, the workers get the blocks
+        sources = {fileName: None if sourcefile.isPlainFile(fileName) else sourcefile.readSource(fileName) for fileName in set(fileNames)}
+        datas = [None if sources[fileName] is None else sources[fileName][offset:offset + length] for fileName, offset, length in zip(fileNames, offsets, lengths)]
+        del sources
+        with processpool.createPool(workers) as pool:
+            payloads = pool.map(decodeJCAMPDXfileBlock, fileNames, offsets, lengths, datas, chunksize=max(1, len(missing) // (4 * workers)))
+            decoded = [unpackSpectrum(payload) if payload else False for payload in payloads]
+    for i, s in zip(missing, decoded):
+        spectra[i] = s
+        if s:
+            fileName, offset, length = blocks[i]
+            spectrumcache.store(fileName, [s], getBlockTag(offset, length))
+    return spectra
+
+def getBlockTag(offset, length):
+    return "JCAMP-DX block " + str(offset) + " " + str(length)
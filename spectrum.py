@@ -10,8 +10,11 @@ It is the base calss of all other spectra types.
 """
 
 import re
+import io
 import os
+import mmap
 import datetime
+from itertools import chain
 
 from PyQt6.QtCore import QDir
 from PyQt6.QtWidgets import (
@@ -22,10 +25,13 @@ import numpy as np
 import json
 from scipy.signal import find_peaks
 
+import sourcefile
+
 class Spectrum:
     def __init__(self, xlim = [0,0], ylim = [0,0]):
-        self.xlim = xlim
-        self.ylim = ylim
+        # copies, since the limits are changed in place while reading a file
+        self.xlim = list(xlim)
+        self.ylim = list(ylim)
         self.ylabel = ""
         self.xlabel = ""
         self.fileName = ""
@@ -94,8 +100,9 @@ class Spectrum:
         self.displayData["xlim"] = None
         self.displayData["ylim"] = None
         self.displayData["Legend"] = ""
+        self.modified = True # changed since the last save, set by the methods changing the spectrum
     
-    def openFreeText(self, fileName=None, options=None, baseDir=QDir.homePath()):
+    def openFreeText(self, fileName=None, options=None, baseDir=QDir.homePath(), progress=None):
         if not options:
             options = {}
             options["Spectrum Type"] = "undefined"
@@ -109,363 +116,328 @@ class Spectrum:
             fileName, _ = QFileDialog.getOpenFileName(None, "Open new spectrum", baseDir, "all Files (*.*)")
         if not fileName:
             return "Not File Name Given"
-        with open(fileName, encoding=options["File Encoding"]) as f:
-            lines = f.readlines()
-            linenumber = 0
-            comments = ""
-            for line in lines:
-                line = line.strip()
-                if linenumber < options["skip Rows"]:
-                    comments += "\r\n" + line
-                    linenumber += 1
-                    continue
-                if line.startswith(options['Comment Character']):
-                    comments += "\r\n" + line
-                    continue
-                if options["Column Delimiter"] == "any whitespace":
-                    columns = line.split()
-                else :
-                    columns = line.split(options["Column Delimiter"])
-                if len(columns) > 1:
-                    try:
-                        if not options["Decimal Separator"] == ".":
-                            self.x.append(float(columns[0].replace(options["Decimal Separator"], ".")))
-                            self.y.append(float(columns[1].replace(options["Decimal Separator"], ".")))
-                        else:
-                            self.x.append(float(columns[0]))
-                            self.y.append(float(columns[1]))
-                    except:
-                        return "Wrong Column Delimiter"
-            self.metadata["Comments"] = comments
-            self.metadata["Core Data"]["Title"] = os.path.basename(fileName)
-            self.title = os.path.basename(fileName)
-            if len(self.x) > 0:
-                self.xlim = [min(self.x), max(self.x)]
-                self.ylim = [min(self.y), max(self.y)]
-                self.x = np.array(self.x)
-                self.y = np.array(self.y)
-                return True
+        name = os.path.basename(sourcefile.getSourceName(fileName))
+        with sourcefile.openSource(fileName, "r", options["File Encoding"]) as f:
+            columns, comments, malformed, header = readFreeTextColumns(f, options, progress=progress)
+        if columns is None:
+            return "Cancelled"
+        if malformed:
+            print(name + ": " + str(len(malformed)) + " malformed lines skipped, the first is line " + str(malformed[0][0]) + ": " + malformed[0][1])
+        self.metadata["Comments"] = "".join("\r\n" + line for line in comments)
+        self.metadata["Core Data"]["Title"] = name
+        self.title = name
+        if len(columns[0]) > 0:
+            self.x, self.y = columns
+            self.xlim = [float(np.min(self.x)), float(np.max(self.x))]
+            self.ylim = [float(np.min(self.y)), float(np.max(self.y))]
+            return True
+        if malformed:
+            return "Wrong Column Delimiter"
         return "Could not OpenFile"
     
     def openJCAMPDXfromString(self, s):
-        ldr = re.compile("##([\$\w\s/-]*)=(.*)$", re.IGNORECASE)
-        lines = s.splitlines()
         # Definition of Factors and Delta for reading data block, may change due to file content
-        xFactor = 1
-        yFactor = 1
-        deltaX = None
-        npoints = 0
-        i = 0
-        while i < len(lines):
-            line = lines[i].strip()
-            if line.startswith("##"):
-                # It is an Labeled Data Record (LDR), which stops at the next LDR!
-                m = ldr.match(line)
-                if m:
-                    label = m.group(1).upper()
-                    data = m.group(2).strip()
-                    if label != "XYDATA" and label != "END":
-                        while not lines[i+1].startswith("##"):
-                            data += "\r\n" + lines[i+1].strip()
-                            i += 1
-                    if label == "TITLE":
-                        self.metadata["Core Data"]["Title"] = data
-                        self.title = data
-                    elif label == "JCAMP-DX":
-                        pass # no nothing with the JCAMP-DX version...
-                    elif label == "DATA TYPE" or label == "DATATYPE":
-                        self.metadata["Core Data"]["Data Type"] = data
-                    elif label == "BLOCKS":
-                        pass # do nothing with the amount of blocks
-                    elif label == "XUNITS":
-                        self.metadata["Spectral Parameters"]["X Units"] = data
-                        self.xlabel = data
-                    elif label == "YUNITS":
-                        self.metadata["Spectral Parameters"]["Y Units"] = data
-                        self.ylabel = data
-                    elif label == "FIRSTX":
-                        firstx = float(data)
-                        self.xlim[0] = float(data)
-                    elif label == "LASTX":
-                        lastx = float(data)
-                        self.xlim[1] = float(data)
-                    elif label == "FIRSTY":
-                        pass # do nothing with the first Y value
-                    elif label == "MAXX":
-                        self.xlim[1] = float(data)
-                    elif label == "MINX":
-                        self.xlim[0] = float(data)
-                    elif label == "MAXY":
-                        self.ylim[1] = float(data)
-                    elif label == "MINY":
-                        self.ylim[0] = float(data)
-                    elif label == "XFACTOR":
-                        xFactor = float(data)
-                    elif label == "YFACTOR":
-                        yFactor = float(data)
-                    elif label == "NPOINTS":
-                        npoints = int(data)
-                    elif label == "RESOLUTION":
-                        self.metadata["Spectral Parameters"]["Resolution"] = data
-                    elif label == "DELTAX":
-                        deltaX = float(data)
-                        self.metadata["Spectral Parameters"]["Delta X"] = data
-                    elif label == "CLASS":
-                        pass # do nothing with the COBLETZ Class of Sepctrum
-                    elif label == "ORIGIN":
-                        self.metadata["Core Data"]["Origin"] = data
-                    elif label == "OWNER":
-                        self.metadata["Core Data"]["Owner"] = data
-                    elif label == "DATE":
-                        date = datetime.datetime.strptime(data, "%y/%m/%d")
-                    elif label == "TIME":
-                        time = datetime.datetime.strptime(data, "%H:%M:%S")
-                    elif label == "LONGDATE":
-                        if len(data) < 11:
-                            date = datetime.datetime.strptime(data, "%Y/%m/%d")
-                        elif len(data) < 17:
-                            date = datetime.datetime.strptime(data, "%Y/%m/%d %H:%M")
-                        elif len(data) < 25:
-                            date = datetime.datetime.strptime(data, "%Y/%m/%d %H:%M:%S")
-                            date = date.replace(microsecond=int(data[20:25].lstrip("0")))
-                        else:
-                            date = datetime.datetime.strptime(data, "%Y/%m/%d %H:%M:%S.%f%z")
-                    elif label == "SOURCE REFERENCE":
-                        self.metadata["Notes"]["Source Reference"] = data
-                    elif label == "CROSS REFERENCE":
-                        self.metadata["Notes"]["Cross Reference"] = data
-                    elif label == "SAMPLE DESCRIPTION":
-                        self.metadata["Sample Information"]["Sample Description"] = data
-                    elif label == "CAS NAME":
-                        self.metadata["Sample Information"]["CAS Name"] = data
-                    elif label == "IUPAC NAME":
-                        self.metadata["Sample Information"]["IUPAC Name"] = data
-                    elif label == "NAMES":
-                        self.metadata["Sample Information"]["Names"] = data
-                    elif label == "MOLFORM":
-                        self.metadata["Sample Information"]["Molform"] = data
-                    elif label == "CAS REGISTRY NO":
-                        self.metadata["Sample Information"]["CAS Registry No"] = data
-                    elif label == "WISWESSER":
-                        self.metadata["Sample Information"]["Wiswesser"] = data
-                    elif label == "BEILSTEIN LAWSON NO":
-                        self.metadata["Sample Information"]["Beilstein Lawson No"] = data
-                    elif label == "MP":
-                        self.metadata["Sample Information"]["Melting Point"] = data
-                    elif label == "BP":
-                        self.metadata["Sample Information"]["Boiling Point"] = data
-                    elif label == "REFRACTIVE INDEX":
-                        self.metadata["Sample Information"]["Refractive Index"] = data
-                    elif label == "DENSITY":
-                        self.metadata["Sample Information"]["Density"] = data
-                    elif label == "MW":
-                        self.metadata["Sample Information"]["Molecular Weight"] = data
-                    elif label == "CONCENTRATIONS":
-                        self.metadata["Sample Information"]["Concentrations"] = data
-                    elif label == "SPECTROMETER" or label == "DATA SYSTEM" or label == "SPECTROMETER/DATA SYSTEM":
-                        self.metadata["Equipment Information"]["Spectrometer"] = data
-                    elif label == "INSTRUMENTAL PARAMETERS":
-                        self.metadata["Equipment Information"]["Instrumental Parameters"] = data
-                    elif label == "SAMPLING PROCEDURE":
-                        self.metadata["Sampling Information"]["Sampling Procedure"] = data
-                    elif label == "STATE":
-                        self.metadata["Sampling Information"]["State"] = data
-                    elif label == "PATH LENGTH":
-                        self.metadata["Sampling Information"]["Path Length"] = data
-                    elif label == "PRESSURE":
-                        self.metadata["Sampling Information"]["Pressure"] = data
-                    elif label == "TEMPERATURE":
-                        self.metadata["Sampling Information"]["Temperature"] = data
-                    elif label == "DATA PROCESSING":
-                        self.metadata["Sampling Information"]["Data Processing"] = data
-                    elif label == "XYDATA":
-                        # parse the data until ##END=
-                        if not deltaX:
-                            deltaX = (lastx - firstx) / (npoints - 1)
-                        if npoints > 0:
-                            self.x = np.zeros(npoints)
-                            self.y = np.zeros(npoints)
-                            i += 1
-                            idx = 0
-                            while not lines[i].startswith("##"):
-                                values = lines[i].split()
-                                for v in range(1, len(values)):
-                                    self.x[idx] = ((float(values[0]) + (v-1)*deltaX) * xFactor)
-                                    self.y[idx] = (float(values[v]) * yFactor)
-                                    idx += 1
-                                i += 1
-                        else:
-                            # points unknown!
-                            i += 1
-                            start = i
-                            valueCount = 0
-                            while not lines[i].startswith("##"): # loop to get the number of data points
-                                values = lines[i].split()
-                                valueCount += len(values) - 1
-                                i += 1
-                            end = i
-                            # initiate data arrays
-                            self.x = np.zeros(valueCount)
-                            self.y = np.zeros(valueCount)
-                            idx = 0
-                            for lineIdx in range(start, end):
-                                values = lines[lineIdx].split()
-                                for v in range(1, len(values)):
-                                    self.x[idx] = ((float(values[0]) + (v-1)*deltaX) * xFactor)
-                                    self.y[idx] = (float(values[v]) * yFactor)
-                                    idx += 1
-                        i -= 1
-                        self.x = np.array(self.x)
-                        self.y = np.array(self.y)
-                    elif label == "END":
-                        break
-                    # Now starting display settings
-                    elif label == "$ON PAGE":
-                        self.displayData['Page'] = int(data)
-                    elif label == "$PAGE TITLE":
-                        self.displayData['Page Title'] = data
-                    elif label == "$PLOT TITLE":
-                        self.displayData['Plot Title'] = data
-                    elif label == "$XLABEL":
-                        self.xlabel = data
-                    elif label == "$YLABEL":
-                        self.ylabel = data
-                    elif label == "$XLIM":
-                        self.displayData['xlim'] = json.loads(data)
-                    elif label == "$YLIM":
-                        self.displayData['ylim'] = json.loads(data)
-                    elif label == "$LEGEND":
-                        self.displayData['Legend'] = data.replace("\r\n", "")
-                    elif label == "$COLOR":
-                        self.color = data.replace("\r\n", "")
-                    elif label == "$LINE STYLE":
-                        self.lineStyle = data.replace("\r\n", "")
-                    elif label == "$MARKER STYLE":
-                        self.markerStyle = data.replace("\r\n", "")
-                    elif label == "$PEAK LIST":
-                        self.peaks = np.array(json.loads(data.replace("\r\n", "")))
-                    elif label == "$PEAK STRING":
-                        self.peakString = data
-                    elif label == "$PEAK PARAMETER":
-                        self.peakParameter = json.loads(data.replace("\r\n", ""))
-                    elif label == "$INTEGRALS":
-                        self.integrals = json.loads(data.replace("\r\n", ""))
-                    elif label == "$XRD REFERENCES":
-                        self.references = json.loads(data.replace("\r\n", ""))
-                    elif label == "$XRF REFERENCES":
-                        self.references = json.loads(data.replace("\r\n", ""))
-                    elif label == "$YAXIS":
-                        self.yaxis = int(data)
-                    else: 
-                        self.metadata["Comments"] += "\r\n" + data
-                else:
-                    self.metadata["Comments"] += "\r\n" + line.lstrip("$")
+        state = {}
+        state["xFactor"] = 1
+        state["yFactor"] = 1
+        state["deltaX"] = None
+        state["npoints"] = 0
+        state["firstX"] = 0
+        state["lastX"] = 0
+        state["date"] = None
+        state["time"] = None
+        comments = [self.metadata["Comments"]]
+        for label, start, end in tokenizeJCAMPDX(s):
+            if label is None:
+                # text outside of a Labeled Data Record (LDR)
+                comments.extend(line.strip().lstrip("$") for line in s[start:end].splitlines())
+                continue
+            if label == "END":
+                break
+            if label in jcampDataTables:
+                data = s[start:end]
+            else:
+                data = getLDRValue(s, start, end)
+            if label in self.ldrHandlers:
+                try:
+                    self.ldrHandlers[label](self, data, state)
+                except ValueError as e:
+                    print(e)
+                    return False
+            elif label in jcampMetadataLDRs:
+                section, key = jcampMetadataLDRs[label]
+                self.metadata[section][key] = data
             else:
-                self.metadata["Comments"] += "\r\n" + line.lstrip("$")
-            i += 1
+                comments.append(data)
+        date = state["date"]
+        time = state["time"]
         if date and time:
             self.metadata["Notes"]["Date Time"] = datetime.datetime(date.year, date.month, date.day, time.hour, time.minute, time.second, time.microsecond, time.tzinfo)
         elif date:
             self.metadata["Notes"]["Date Time"] = date
-        self.metadata["Comments"] = self.metadata["Comments"].strip()
+        self.metadata["Comments"] = "\r\n".join(comments).strip()
         return True
+    
+    # Handlers of the LDRs, which are not simply stored in the metadata (see jcampMetadataLDRs).
+    # Each handler gets the spectrum, the value of the LDR and the parser state (factors, data dimensions, date and time).
+    def readTitleLDR(self, data, state):
+        self.metadata["Core Data"]["Title"] = data
+        self.title = data
+    
+    def readXUnitsLDR(self, data, state):
+        self.metadata["Spectral Parameters"]["X Units"] = data
+        self.xlabel = data
+    
+    def readYUnitsLDR(self, data, state):
+        self.metadata["Spectral Parameters"]["Y Units"] = data
+        self.ylabel = data
+    
+    def readFirstXLDR(self, data, state):
+        state["firstX"] = float(data)
+        self.xlim[0] = float(data)
+    
+    def readLastXLDR(self, data, state):
+        state["lastX"] = float(data)
+        self.xlim[1] = float(data)
+    
+    def readMinXLDR(self, data, state):
+        self.xlim[0] = float(data)
+    
+    def readMaxXLDR(self, data, state):
+        self.xlim[1] = float(data)
+    
+    def readMinYLDR(self, data, state):
+        self.ylim[0] = float(data)
+    
+    def readMaxYLDR(self, data, state):
+        self.ylim[1] = float(data)
+    
+    def readXFactorLDR(self, data, state):
+        state["xFactor"] = float(data)
+    
+    def readYFactorLDR(self, data, state):
+        state["yFactor"] = float(data)
+    
+    def readNPointsLDR(self, data, state):
+        state["npoints"] = int(data)
+    
+    def readDeltaXLDR(self, data, state):
+        state["deltaX"] = float(data)
+        self.metadata["Spectral Parameters"]["Delta X"] = data
+    
+    def readDateLDR(self, data, state):
+        state["date"] = datetime.datetime.strptime(data, "%y/%m/%d")
+    
+    def readTimeLDR(self, data, state):
+        state["time"] = datetime.datetime.strptime(data, "%H:%M:%S")
+    
+    def readLongDateLDR(self, data, state):
+        if len(data) < 11:
+            date = datetime.datetime.strptime(data, "%Y/%m/%d")
+        elif len(data) < 17:
+            date = datetime.datetime.strptime(data, "%Y/%m/%d %H:%M")
+        elif len(data) < 25:
+            date = datetime.datetime.strptime(data, "%Y/%m/%d %H:%M:%S")
+            date = date.replace(microsecond=int(data[20:25].lstrip("0")))
+        else:
+            date = datetime.datetime.strptime(data, "%Y/%m/%d %H:%M:%S.%f%z")
+        state["date"] = date
+    
+    def readXYDataLDR(self, data, state):
+        # data is the raw data table: the variable list followed by the data lines
+        lines = data.splitlines()[1:]
+        deltaX = state["deltaX"]
+        if not deltaX and state["npoints"] > 1:
+            deltaX = (state["lastX"] - state["firstX"]) / (state["npoints"] - 1)
+        self.x, self.y = decodeXYData(lines, deltaX, state["xFactor"], state["yFactor"], state["firstX"], state["lastX"])
+    
+    ldrHandlers = {
+        "TITLE": readTitleLDR,
+        "JCAMP-DX": lambda self, data, state: None, # no nothing with the JCAMP-DX version...
+        "BLOCKS": lambda self, data, state: None, # do nothing with the amount of blocks
+        "FIRSTY": lambda self, data, state: None, # do nothing with the first Y value
+        "CLASS": lambda self, data, state: None, # do nothing with the COBLETZ Class of Sepctrum
+        "XUNITS": readXUnitsLDR,
+        "YUNITS": readYUnitsLDR,
+        "FIRSTX": readFirstXLDR,
+        "LASTX": readLastXLDR,
+        "MAXX": readMaxXLDR,
+        "MINX": readMinXLDR,
+        "MAXY": readMaxYLDR,
+        "MINY": readMinYLDR,
+        "XFACTOR": readXFactorLDR,
+        "YFACTOR": readYFactorLDR,
+        "NPOINTS": readNPointsLDR,
+        "DELTAX": readDeltaXLDR,
+        "DATE": readDateLDR,
+        "TIME": readTimeLDR,
+        "LONGDATE": readLongDateLDR,
+        "XYDATA": readXYDataLDR,
+        # Now starting display settings
+        "$ON PAGE": lambda self, data, state: self.displayData.update({'Page': int(data)}),
+        "$PAGE TITLE": lambda self, data, state: self.displayData.update({'Page Title': data}),
+        "$PLOT TITLE": lambda self, data, state: self.displayData.update({'Plot Title': data}),
+        "$XLABEL": lambda self, data, state: setattr(self, "xlabel", data),
+        "$YLABEL": lambda self, data, state: setattr(self, "ylabel", data),
+        "$XLIM": lambda self, data, state: self.displayData.update({'xlim': json.loads(data)}),
+        "$YLIM": lambda self, data, state: self.displayData.update({'ylim': json.loads(data)}),
+        "$LEGEND": lambda self, data, state: self.displayData.update({'Legend': data.replace("\r\n", "")}),
+        "$COLOR": lambda self, data, state: setattr(self, "color", data.replace("\r\n", "")),
+        "$LINE STYLE": lambda self, data, state: setattr(self, "lineStyle", data.replace("\r\n", "")),
+        "$MARKER STYLE": lambda self, data, state: setattr(self, "markerStyle", data.replace("\r\n", "")),
+        "$PEAK LIST": lambda self, data, state: setattr(self, "peaks", np.array(json.loads(data.replace("\r\n", "")))),
+        "$PEAK STRING": lambda self, data, state: setattr(self, "peakString", data),
+        "$PEAK PARAMETER": lambda self, data, state: setattr(self, "peakParameter", json.loads(data.replace("\r\n", ""))),
+        "$INTEGRALS": lambda self, data, state: setattr(self, "integrals", json.loads(data.replace("\r\n", ""))),
+        "$YAXIS": lambda self, data, state: setattr(self, "yaxis", int(data)),
+    }
 
     def getAsJCAMPDX(self, insert=None):
-        c = checkLength("##TITLE=" + self.metadata["Core Data"]["Title"])
-        c += checkLength("\r\n##JCAMP-DX=5.01")
-        c += checkLength("\r\n##DATA TYPE=" + self.metadata["Core Data"]["Data Type"])
-        c += checkLength("\r\n##ORIGIN=" + self.metadata["Core Data"]["Origin"])
-        c += checkLength("\r\n##OWNER=" + self.metadata["Core Data"]["Owner"])
+        f = io.StringIO()
+        self.writeJCAMPDX(f, insert)
+        return f.getvalue()
+    
+    def writeJCAMPDX(self, f, insert=None, chunkSize=65536, compress=False, precision=6, data=None):
+        """
+        Writes the spectrum as JCAMP-DX block to an open text file. The
+        header is written LDR by LDR, the data in chunks of chunkSize points.
+
+        Parameters
+        ----------
+        f : file object
+            Opened for writing text.
+        insert : String, optional
+            LDRs written after the core data, e.g. the display settings of the page.
+        compress : bool, optional
+            Write the data as ##XYDATA=(X++(Y..Y)) in ASDF DIFDUP form with 
+            integer values scaled by XFACTOR and YFACTOR. Spectra with 
+            x values which are not equidistant are written as (XY) pairs anyway.
+            The default is False.
+        precision : int, optional
+            Significant digits kept by the compressed data, relative to the 
+            largest y value and to the x increment. The default is 6.
+        data : String, optional
+            The data section (from ##XYDATA= up to ##END=) written before 
+            with the same x and y values and settings. It is written as it 
+            is instead of formatting the values again.
+
+        """
+        factors = getJCAMPFactors(self.x, self.y, precision) if compress else None
+        f.write(checkLength("##TITLE=" + self.metadata["Core Data"]["Title"]))
+        f.write(checkLength("\r\n##JCAMP-DX=5.01"))
+        f.write(checkLength("\r\n##DATA TYPE=" + self.metadata["Core Data"]["Data Type"]))
+        f.write(checkLength("\r\n##ORIGIN=" + self.metadata["Core Data"]["Origin"]))
+        f.write(checkLength("\r\n##OWNER=" + self.metadata["Core Data"]["Owner"]))
         if insert:
-            c += checkLength("\r\n" + insert)
-        c += checkLength("\r\n##$COLOR=" + self.color)
-        c += checkLength("\r\n##$LINE STYLE=" + self.lineStyle)
-        c += checkLength("\r\n##$MARKER STYLE=" + self.markerStyle)
-        c += checkLength("\r\n##$PEAK PARAMETER=" + json.dumps(self.peakParameter))
+            f.write(checkLength("\r\n" + insert))
+        f.write(checkLength("\r\n##$COLOR=" + self.color))
+        f.write(checkLength("\r\n##$LINE STYLE=" + self.lineStyle))
+        f.write(checkLength("\r\n##$MARKER STYLE=" + self.markerStyle))
+        f.write(checkLength("\r\n##$PEAK PARAMETER=" + json.dumps(self.peakParameter)))
         if self.yaxis > 0:
-            c += checkLength("\r\n##$YAXIS=" + str(self.yaxis))
-        c += checkLength("\r\n##$PEAK STRING=" + self.peakString)
-        c += checkLength("\r\n##$PEAK LIST=" + json.dumps(list(self.peaks), default=int))
+            f.write(checkLength("\r\n##$YAXIS=" + str(self.yaxis)))
+        f.write(checkLength("\r\n##$PEAK STRING=" + self.peakString))
+        f.write(checkLength("\r\n##$PEAK LIST=" + json.dumps(list(self.peaks), default=int)))
         if len(self.integrals) > 0:
-            c += checkLength("\r\n##$INTEGRALS=" + json.dumps(list(self.integrals), default=float))
-        c += checkLength("\r\n##XUNITS=" + self.metadata["Spectral Parameters"]["X Units"])
-        c += checkLength("\r\n##YUNITS=" + self.metadata["Spectral Parameters"]["Y Units"])
-        c += checkLength("\r\n##MAXX=" + str(max(self.x)))
-        c += checkLength("\r\n##MINX=" + str(min(self.x)))
-        c += checkLength("\r\n##MAXY=" + str(max(self.y)))
-        c += checkLength("\r\n##MINY=" + str(min(self.y)))
-        c += checkLength("\r\n##FIRSTX=" + str(self.x[0]))
-        c += checkLength("\r\n##LASTX=" + str(self.x[-1]))
-        c += checkLength("\r\n##XFACTOR=1.000") # No factor, since no memory problems are present today!
-        # yFactor = max(self.y)/32000
-        c += checkLength("\r\n##YFACTOR=1.000") # No factor, since no memory problems are present today!
-        c += checkLength("\r\n##NPOINTS=" + str(len(self.y)))
-        c += checkLength("\r\n##FIRSTY=" + str(round(self.y[0])))
+            f.write(checkLength("\r\n##$INTEGRALS=" + json.dumps(list(self.integrals), default=float)))
+        f.write(checkLength("\r\n##XUNITS=" + self.metadata["Spectral Parameters"]["X Units"]))
+        f.write(checkLength("\r\n##YUNITS=" + self.metadata["Spectral Parameters"]["Y Units"]))
+        f.write(checkLength("\r\n##MAXX=" + str(np.max(self.x))))
+        f.write(checkLength("\r\n##MINX=" + str(np.min(self.x))))
+        f.write(checkLength("\r\n##MAXY=" + str(np.max(self.y))))
+        f.write(checkLength("\r\n##MINY=" + str(np.min(self.y))))
+        f.write(checkLength("\r\n##FIRSTX=" + str(self.x[0])))
+        f.write(checkLength("\r\n##LASTX=" + str(self.x[-1])))
+        if factors:
+            xFactor, yFactor, deltaX = factors
+            f.write(checkLength("\r\n##XFACTOR=" + repr(xFactor)))
+            f.write(checkLength("\r\n##YFACTOR=" + repr(yFactor)))
+        else:
+            # the (XY) pairs are written unscaled
+            f.write(checkLength("\r\n##XFACTOR=1.000"))
+            f.write(checkLength("\r\n##YFACTOR=1.000"))
+        f.write(checkLength("\r\n##NPOINTS=" + str(len(self.y))))
+        f.write(checkLength("\r\n##FIRSTY=" + str(round(self.y[0]))))
         if self.metadata["Spectral Parameters"]["Resolution"] != "":
-            c += checkLength("\r\n##RESOLUTION=" + self.metadata["Spectral Parameters"]["Resolution"])
-        if self.metadata["Spectral Parameters"]["Delta X"] != "":
-            c += checkLength("\r\n##DELTAX=" + self.metadata["Spectral Parameters"]["Delta X"])
+            f.write(checkLength("\r\n##RESOLUTION=" + self.metadata["Spectral Parameters"]["Resolution"]))
+        if factors:
+            # the x values of the compressed data are calculated by DELTAX
+            f.write(checkLength("\r\n##DELTAX=" + repr(deltaX)))
+        elif self.metadata["Spectral Parameters"]["Delta X"] != "":
+            f.write(checkLength("\r\n##DELTAX=" + self.metadata["Spectral Parameters"]["Delta X"]))
         else:
-            c += checkLength("\r\n##DELTAX=" + str(round((max(self.x) - min(self.x)) / len(self.x), 6)))
+            f.write(checkLength("\r\n##DELTAX=" + str(round((np.max(self.x) - np.min(self.x)) / len(self.x), 6))))
         if self.metadata["Notes"]["Date Time"] != "":
-            c += checkLength("\r\n##LONGDATE=" + self.metadata["Notes"]["Date Time"].strftime("%Y/%m/%d"))
-            c += checkLength("\r\n##TIME=" + self.metadata["Notes"]["Date Time"].strftime("%H:%M:%S"))
+            f.write(checkLength("\r\n##LONGDATE=" + self.metadata["Notes"]["Date Time"].strftime("%Y/%m/%d")))
+            f.write(checkLength("\r\n##TIME=" + self.metadata["Notes"]["Date Time"].strftime("%H:%M:%S")))
         if self.metadata["Notes"]["Source Reference"] != "":
-            c += checkLength("\r\n##SOURCE REFERENCE=" + self.metadata["Notes"]["Source Reference"])
+            f.write(checkLength("\r\n##SOURCE REFERENCE=" + self.metadata["Notes"]["Source Reference"]))
         if self.metadata["Notes"]["Cross Reference"] != "":
-            c += checkLength("\r\n##CROSS REFERENCE=" + self.metadata["Notes"]["Cross Reference"])
+            f.write(checkLength("\r\n##CROSS REFERENCE=" + self.metadata["Notes"]["Cross Reference"]))
         if self.metadata["Sample Information"]["Sample Description"] != "":
-            c += checkLength("\r\n##SAMPLE DESCRIPTION=" + self.metadata["Sample Information"]["Sample Description"])
+            f.write(checkLength("\r\n##SAMPLE DESCRIPTION=" + self.metadata["Sample Information"]["Sample Description"]))
         if self.metadata["Sample Information"]["CAS Name"] != "":
-            c += checkLength("\r\n##CAS NAME=" + self.metadata["Sample Information"]["CAS Name"])
+            f.write(checkLength("\r\n##CAS NAME=" + self.metadata["Sample Information"]["CAS Name"]))
         if self.metadata["Sample Information"]["IUPAC Name"] != "":
-            c += checkLength("\r\n##IUPAC NAME=" + self.metadata["Sample Information"]["IUPAC Name"])
+            f.write(checkLength("\r\n##IUPAC NAME=" + self.metadata["Sample Information"]["IUPAC Name"]))
         if self.metadata["Sample Information"]["Names"] != "":
-            c += checkLength("\r\n##NAMES=" + self.metadata["Sample Information"]["Names"])
+            f.write(checkLength("\r\n##NAMES=" + self.metadata["Sample Information"]["Names"]))
         if self.metadata["Sample Information"]["Molform"] != "":
-            c += checkLength("\r\n##MOLFORM=" + self.metadata["Sample Information"]["Molform"])
+            f.write(checkLength("\r\n##MOLFORM=" + self.metadata["Sample Information"]["Molform"]))
         if self.metadata["Sample Information"]["CAS Registry No"] != "":
-            c += checkLength("\r\n##CAS REGISTRY NO=" + self.metadata["Sample Information"]["CAS Registry No"])
+            f.write(checkLength("\r\n##CAS REGISTRY NO=" + self.metadata["Sample Information"]["CAS Registry No"]))
         if self.metadata["Sample Information"]["Wiswesser"] != "":
-            c += checkLength("\r\n##WISWESSER=" + self.metadata["Sample Information"]["Wiswesser"])
+            f.write(checkLength("\r\n##WISWESSER=" + self.metadata["Sample Information"]["Wiswesser"]))
         if self.metadata["Sample Information"]["Beilstein Lawson No"] != "":
-            c += checkLength("\r\n##BEILSTEIN LAWSON NO=" + self.metadata["Sample Information"]["Beilstein Lawson No"])
+            f.write(checkLength("\r\n##BEILSTEIN LAWSON NO=" + self.metadata["Sample Information"]["Beilstein Lawson No"]))
         if self.metadata["Sample Information"]["Melting Point"] != "":
-            c += checkLength("\r\n##MP=" + self.metadata["Sample Information"]["Melting Point"])
+            f.write(checkLength("\r\n##MP=" + self.metadata["Sample Information"]["Melting Point"]))
         if self.metadata["Sample Information"]["Boiling Point"] != "":
-            c += checkLength("\r\n##BP=" + self.metadata["Sample Information"]["Boiling Point"])
+            f.write(checkLength("\r\n##BP=" + self.metadata["Sample Information"]["Boiling Point"]))
         if self.metadata["Sample Information"]["Refractive Index"] != "":
-            c += checkLength("\r\n##REFRACTIVE INDEX=" + self.metadata["Sample Information"]["Refractive Index"])
+            f.write(checkLength("\r\n##REFRACTIVE INDEX=" + self.metadata["Sample Information"]["Refractive Index"]))
         if self.metadata["Sample Information"]["Density"] != "":
-            c += checkLength("\r\n##DENSITY=" + self.metadata["Sample Information"]["Density"])
+            f.write(checkLength("\r\n##DENSITY=" + self.metadata["Sample Information"]["Density"]))
         if self.metadata["Sample Information"]["Molecular Weight"] != "":
-            c += checkLength("\r\n##MW=" + self.metadata["Sample Information"]["Molecular Weight"])
+            f.write(checkLength("\r\n##MW=" + self.metadata["Sample Information"]["Molecular Weight"]))
         if self.metadata["Sample Information"]["Concentrations"] != "":
-            c += checkLength("\r\n##CONCENTRATIONS=" + self.metadata["Sample Information"]["Concentrations"])
+            f.write(checkLength("\r\n##CONCENTRATIONS=" + self.metadata["Sample Information"]["Concentrations"]))
         if self.metadata["Equipment Information"]["Spectrometer"] != "":
-            c += checkLength("\r\n##SPECTROMETER/DATA SYSTEM=" + self.metadata["Equipment Information"]["Spectrometer"])
+            f.write(checkLength("\r\n##SPECTROMETER/DATA SYSTEM=" + self.metadata["Equipment Information"]["Spectrometer"]))
         if self.metadata["Equipment Information"]["Instrumental Parameters"] != "":
-            c += checkLength("\r\n##INSTRUMENTAL PARAMETERS=" + self.metadata["Equipment Information"]["Instrumental Parameters"])
+            f.write(checkLength("\r\n##INSTRUMENTAL PARAMETERS=" + self.metadata["Equipment Information"]["Instrumental Parameters"]))
         if self.metadata["Sampling Information"]["Sampling Procedure"] != "":
-            c += checkLength("\r\n##SAMPLING PROCEDURE=" + self.metadata["Sampling Information"]["Sampling Procedure"])
+            f.write(checkLength("\r\n##SAMPLING PROCEDURE=" + self.metadata["Sampling Information"]["Sampling Procedure"]))
         if self.metadata["Sampling Information"]["State"] != "":
-            c += checkLength("\r\n##STATE=" + self.metadata["Sampling Information"]["State"])
+            f.write(checkLength("\r\n##STATE=" + self.metadata["Sampling Information"]["State"]))
         if self.metadata["Sampling Information"]["Path Length"] != "":
-            c += checkLength("\r\n##PATH LENGTH=" + self.metadata["Sampling Information"]["Path Length"])
+            f.write(checkLength("\r\n##PATH LENGTH=" + self.metadata["Sampling Information"]["Path Length"]))
         if self.metadata["Sampling Information"]["Pressure"] != "":
-            c += checkLength("\r\n##PRESSURE=" + self.metadata["Sampling Information"]["Pressure"])
+            f.write(checkLength("\r\n##PRESSURE=" + self.metadata["Sampling Information"]["Pressure"]))
         if self.metadata["Sampling Information"]["Temperature"] != "":
-            c += checkLength("\r\n##TEMPERATURE=" + self.metadata["Sampling Information"]["Temperature"])
+            f.write(checkLength("\r\n##TEMPERATURE=" + self.metadata["Sampling Information"]["Temperature"]))
         if self.metadata["Sampling Information"]["Data Processing"] != "":
-            c += checkLength("\r\n##DATA PROCESSING=" + self.metadata["Sampling Information"]["Data Processing"])
+            f.write(checkLength("\r\n##DATA PROCESSING=" + self.metadata["Sampling Information"]["Data Processing"]))
         if self.metadata["Comments"] != "":
-            c += checkLength("\r\n##=" + self.metadata["Comments"])
-        c += checkLength("\r\n##XYDATA=(XY)")
-        for i in range(len(self.x)):
-            c += "\r\n" + str(round(self.x[i], 6)) + " " + str(round(self.y[i], 6))
-        c += checkLength("\r\n##END= $$" + self.metadata["Core Data"]["Title"] + "\r\n")
-        
-        return c
+            f.write(checkLength("\r\n##=" + self.metadata["Comments"]))
+        if data is not None:
+            f.write(data)
+        elif factors:
+            f.write(checkLength("\r\n##XYDATA=(X++(Y..Y))"))
+            x = np.asarray(self.x) / xFactor
+            y = np.asarray(self.y) / yFactor
+            # the chunks overlap by one point, which is the y check value at the start of the next chunk
+            for start in range(0, max(len(y) - 1, 1), chunkSize):
+                lines = encodeXYData(x[start:start + chunkSize + 1], y[start:start + chunkSize + 1])
+                f.write("\r\n" + "\r\n".join(lines))
+        else:
+            f.write(checkLength("\r\n##XYDATA=(XY)"))
+            # the data lines are formatted and written in chunks
+            for start in range(0, len(self.x), chunkSize):
+                xValues = formatJCAMPValues(self.x[start:start + chunkSize])
+                yValues = formatJCAMPValues(self.y[start:start + chunkSize])
+                f.write("".join(map("\r\n{} {}".format, xValues, yValues)))
+        f.write(checkLength("\r\n##END= $$" + self.metadata["Core Data"]["Title"] + "\r\n"))
     
     def getDisplayData(self):
         data = {}
@@ -481,6 +453,7 @@ class Spectrum:
         self.color = data["Color"]
         self.lineStyle = data["Line Style"]
         self.markerStyle = data["Marker Style"]
+        self.modified = True
     
     def peakpicking(self, height=None, threshold=None, distance=None, prominence=None, width=None):
         self.peaks, _ = find_peaks(self.y, height, threshold, distance, prominence, width)
@@ -503,6 +476,7 @@ class Spectrum:
                 relHeight = "vw"
             peakStringList.append(str(round(peaksX[i], 1)) + " (" + relHeight + ")")
         self.peakString = ", ".join(peakStringList)
+        self.modified = True
         return self.peakString
     
     def integrate(self, x1, x2):
@@ -519,6 +493,7 @@ class Spectrum:
             itg['relativeArea'] = itg['area'] * self.integrals[0]['relativeArea'] / self.integrals[0]['area']
         itg['color'] = self.color
         self.integrals.append(itg)
+        self.modified = True
     
     def getIntegrationRangeByIndex(self, x1, x2):
         xx1 = np.abs(self.x - x1)
@@ -536,6 +511,7 @@ class Spectrum:
             wholeArea += i['area']
         for i in self.integrals:
             i['relativeArea'] = s*i['area']/wholeArea
+        self.modified = True
     
     def updateIntegral(self, idx, data):
         itg = self.integrals[idx]
@@ -553,52 +529,607 @@ class Spectrum:
         for i in self.integrals:
             if i != itg:
                 i['relativeArea'] = i['area'] * itg['relativeArea'] / itg['area']
+        self.modified = True
 
-def getJCAMPblockFromFile(fileName):
+# ASDF compression (JCAMP-DX 4.24): pseudo digits replace the sign and the first digit of a value
+ASDF_AFFN, ASDF_SQZ, ASDF_DIF, ASDF_DUP, ASDF_DIGIT, ASDF_DOT = 1, 2, 3, 4, 5, 6
+asdfTable = {"+": (ASDF_AFFN, 1, 0), "-": (ASDF_AFFN, -1, 0), ".": (ASDF_DOT, 1, 0)} # character: (kind, sign, digit)
+for _digit in range(10):
+    asdfTable[str(_digit)] = (ASDF_DIGIT, 1, _digit)
+    asdfTable["@ABCDEFGHI"[_digit]] = (ASDF_SQZ, 1, _digit)
+    asdfTable["%JKLMNOPQR"[_digit]] = (ASDF_DIF, 1, _digit)
+for _digit in range(1, 10):
+    asdfTable["abcdefghi"[_digit - 1]] = (ASDF_SQZ, -1, _digit)
+    asdfTable["jklmnopqr"[_digit - 1]] = (ASDF_DIF, -1, _digit)
+    asdfTable["STUVWXYZs"[_digit - 1]] = (ASDF_DUP, 1, _digit)
+# lookup tables for every byte, all other characters are separators (kind 0)
+_asdfKind = np.zeros(256, dtype=np.int8)
+_asdfSign = np.ones(256, dtype=np.int64)
+_asdfDigit = np.zeros(256, dtype=np.int64)
+for _char, (_kind, _sign, _digit) in asdfTable.items():
+    _asdfKind[ord(_char)] = _kind
+    _asdfSign[ord(_char)] = _sign
+    _asdfDigit[ord(_char)] = _digit
+# E and e are left out, since they are used as exponent in AFFN values
+asdfPattern = re.compile("[@A-DF-Za-df-s%]")
+
+def decodeXYData(lines, deltaX=None, xFactor=1, yFactor=1, firstX=0, lastX=0):
+    """
+    Decodes the data lines of a ##XYDATA=(X++(Y..Y)) table in one pass.
+    Every line starts with the x value of its first y value, the following
+    x values are calculated by deltaX. ASDF compressed data (SQZ, DIF, DUP)
+    is detected automatically.
+
+    Parameters
+    ----------
+    lines : list of String
+        The data lines between ##XYDATA= and the next LDR.
+    deltaX : float
+        The x increment between two points. If None, it is calculated from firstX, lastX and the number of points.
+    xFactor, yFactor : float
+        Factors to get the real x and y values.
+
+    Raises
+    ------
+    ValueError
+        If the data can not be decoded or a DIF y check value does not fit.
+
+    Returns
+    -------
+    x, y : numpy arrays
+
+    """
+    if any(asdfPattern.search(line) for line in lines):
+        values, kinds, lineIdx = decodeASDF(lines)
+    else:
+        rows = [line.split() for line in lines]
+        counts = np.fromiter(map(len, rows), dtype=np.intp, count=len(rows))
+        values = np.fromiter(map(float, chain.from_iterable(rows)), dtype=np.float64, count=int(counts.sum()))
+        kinds = np.full(len(values), ASDF_AFFN, dtype=np.int8)
+        lineIdx = np.repeat(np.arange(len(rows)), counts)
+    # the first value of every line is the x value
+    isX = np.ones(len(values), dtype=bool)
+    isX[1:] = lineIdx[1:] != lineIdx[:-1]
+    yValues = values[~isX]
+    yKinds = kinds[~isX]
+    yLines = lineIdx[~isX]
+    lineStart = np.ones(len(yValues), dtype=bool)
+    lineStart[1:] = yLines[1:] != yLines[:-1]
+    if len(yValues) and yKinds[0] == ASDF_DIF:
+        raise ValueError("XYDATA: the first y value must not be a DIF value")
+    # DIF values are added to the previous y value, all others are absolute values
+    isAbsolute = yKinds != ASDF_DIF
+    difSum = np.cumsum(np.where(isAbsolute, 0, yValues))
+    absIdx = np.flatnonzero(isAbsolute)
+    y = (yValues[absIdx] - difSum[absIdx])[np.cumsum(isAbsolute) - 1] + difSum
+    # after a line ending in DIF form, the first y value of the next line is the y check value
+    isCheck = np.zeros(len(y), dtype=bool)
+    isCheck[1:] = lineStart[1:] & (yKinds[:-1] == ASDF_DIF)
+    checkIdx = np.flatnonzero(isCheck)
+    failed = checkIdx[y[checkIdx] != y[checkIdx - 1]]
+    if len(failed):
+        raise ValueError("XYDATA: y check failed in data line " + str(yLines[failed[0]] + 1))
+    lineStartIdx = np.flatnonzero(lineStart)
+    k = np.arange(len(y)) - np.repeat(lineStartIdx, np.diff(np.append(lineStartIdx, len(y)))) # position of the y value inside its line
+    lineX = values[isX][np.searchsorted(lineIdx[isX], yLines)]
+    keep = ~isCheck
+    y = y[keep] * yFactor
+    if deltaX is None:
+        deltaX = (lastX - firstX) / (len(y) - 1) if len(y) > 1 else 0
+    x = lineX[keep] * xFactor + k[keep] * deltaX
+    return x, y
+
+def decodeASDF(lines):
+    """
+    Splits ASDF compressed data lines into their values with lookup tables,
+    without a Python loop over the values. DUP counts are expanded.
+
+    Returns
+    -------
+    values : numpy array
+        The values, DIF values are not yet added up.
+    kinds : numpy array
+        ASDF_AFFN, ASDF_SQZ or ASDF_DIF for every value.
+    lineIdx : numpy array
+        The index of the data line of every value.
+
+    """
+    text = "\n".join(line.split("$$")[0] for line in lines)
+    b = np.frombuffer(text.encode("ascii", "replace"), dtype=np.uint8)
+    if len(b) == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.int8), np.zeros(0, dtype=np.int64)
+    kind = _asdfKind[b]
+    isPart = kind > 0
+    # a value starts with a sign or pseudo digit, or with a digit after a separator
+    isStart = (kind >= ASDF_AFFN) & (kind <= ASDF_DUP)
+    isStart[0] = isPart[0]
+    isStart[1:] |= isPart[1:] & ~isPart[:-1]
+    starts = np.flatnonzero(isStart)
+    tokenIdx = np.cumsum(isStart) - 1
+    hasDigit = (kind >= ASDF_SQZ) & (kind <= ASDF_DIGIT)
+    digitCount = np.cumsum(hasDigit)
+    tokenDigitEnd = digitCount[np.append(starts[1:] - 1, len(b) - 1)]
+    # build the mantissa of every value as an integer, the decimal point is applied afterwards
+    digitPos = np.flatnonzero(hasDigit)
+    exponent = tokenDigitEnd[tokenIdx[digitPos]] - digitCount[digitPos]
+    mantissa = np.bincount(tokenIdx[digitPos], weights=_asdfDigit[b[digitPos]] * 10.0 ** exponent, minlength=len(starts))
+    decimals = np.zeros(len(starts), dtype=np.int64)
+    dotPos = np.flatnonzero(kind == ASDF_DOT)
+    decimals[tokenIdx[dotPos]] = tokenDigitEnd[tokenIdx[dotPos]] - digitCount[dotPos]
+    values = _asdfSign[b[starts]] * mantissa / 10.0 ** decimals
+    kinds = kind[starts]
+    kinds[kinds >= ASDF_DIGIT] = ASDF_AFFN
+    lineIdx = np.cumsum(b == 10)[starts]
+    # DUP repeats the previous value (or difference)
+    dupIdx = np.flatnonzero(kinds == ASDF_DUP)
+    if len(dupIdx):
+        if dupIdx[0] == 0:
+            raise ValueError("XYDATA: DUP without a value to repeat")
+        repeats = np.ones(len(values), dtype=np.int64)
+        repeats[dupIdx - 1] = values[dupIdx].astype(np.int64)
+        repeats[dupIdx] = 0
+        values = np.repeat(values, repeats)
+        kinds = np.repeat(kinds, repeats)
+        lineIdx = np.repeat(lineIdx, repeats)
+    return values, kinds, lineIdx
+
+# pseudo digits of the encoder for positive and negative values, indexed by the first digit
+asdfSQZ = ("@ABCDEFGHI", "-abcdefghi")
+asdfDIF = ("%JKLMNOPQR", "-jklmnopqr")
+asdfDUP = ("-STUVWXYZs",) # DUP counts are at least 2
+
+def getASDFToken(value, pseudoDigits):
+    # replaces the sign and the first digit of an integer by its pseudo digit
+    s = str(value)
+    if s[0] == "-":
+        return pseudoDigits[1][int(s[1])] + s[2:]
+    return pseudoDigits[0][int(s[0])] + s[1:]
+
+def getJCAMPFactors(x, y, precision=6):
+    """
+    Chooses XFACTOR and YFACTOR for ASDF compressed data as powers of ten,
+    so that the values are integers with precision significant digits.
+    Integer data is not scaled.
+
+    Returns
+    -------
+    tuple or None
+        (xFactor, yFactor, deltaX), None if the x values are not equidistant
+        or the data is not finite.
+
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) == 0 or len(x) != len(y) or not (np.isfinite(x).all() and np.isfinite(y).all()):
+        return None
+    deltaX = (x[-1] - x[0]) / (len(x) - 1) if len(x) > 1 else 0.0
+    factors = []
+    for values, scale in ((x, abs(deltaX) or abs(x[0])), (y, np.abs(y).max())):
+        if scale == 0 or (values == np.round(values)).all():
+            factors.append(1.0)
+        else:
+            factors.append(10.0 ** (int(np.floor(np.log10(scale))) + 1 - precision))
+    xFactor, yFactor = factors
+    if np.abs(x - (x[0] + np.arange(len(x)) * deltaX)).max() > abs(deltaX) * 10.0 ** -precision:
+        return None
+    return xFactor, yFactor, float(deltaX)
+
+def encodeXYData(x, y, lineLength=80):
+    """
+    Encodes data lines of a ##XYDATA=(X++(Y..Y)) table in ASDF DIFDUP form,
+    the inverse of decodeXYData. Every line starts with the x value and the 
+    first y value (SQZ), followed by the differences (DIF) of the next y 
+    values, repeated differences are counted (DUP). The last y value of a 
+    line is repeated at the start of the next one as y check value.
+
+    Parameters
+    ----------
+    x, y : numpy arrays
+        The values divided by XFACTOR and YFACTOR, they are rounded to integers.
+    lineLength : int, optional
+        Maximum length of a line. The default is 80.
+
+    Returns
+    -------
+    list of String
+
+    """
+    x = np.rint(x).astype(np.int64)
+    y = np.rint(y).astype(np.int64)
+    dif = np.diff(y)
+    # runs of equal differences are written as one DIF token with a DUP count
+    runStarts = np.flatnonzero(np.append(True, dif[1:] != dif[:-1])) if len(dif) else np.zeros(0, dtype=np.intp)
+    runLengths = np.diff(np.append(runStarts, len(dif))).tolist()
+    difTokens = {v: getASDFToken(v, asdfDIF) for v in set(dif[runStarts].tolist())}
+    tokens = [difTokens[v] for v in dif[runStarts].tolist()]
+    for r, n in enumerate(runLengths):
+        if n > 1:
+            tokens[r] += getASDFToken(n, asdfDUP)
+    tokenLengths = list(map(len, tokens))
+    runStarts = runStarts.tolist()
+    x = x.tolist()
+    y = y.tolist()
+    lines = []
+    r = 0
+    while True:
+        # the line starts at the point before the run, for all lines but the first one this is the y check value
+        start = runStarts[r] if r < len(tokens) else 0
+        line = str(x[start]) + getASDFToken(y[start], asdfSQZ)
+        length = len(line)
+        first = r
+        while r < len(tokens) and (length + tokenLengths[r] <= lineLength or r == first):
+            length += tokenLengths[r]
+            r += 1
+        lines.append(line + "".join(tokens[first:r]))
+        if r >= len(tokens):
+            return lines
+
+jcampBlockLDR = re.compile(rb"^##(TITLE|END)=([^\r\n]*)", re.MULTILINE)
+
+def getJCAMPblockIndex(fileName):
+    """
+    Indexes all ##TITLE= ... ##END= blocks of a JCAMP-DX file without reading
+    it into memory. The file is memory-mapped and only searched for the
+    ##TITLE= and ##END= labels.
+
+    Parameters
+    ----------
+    fileName : String
+        The path to the JCAMP-DX file.
+
+    Returns
+    -------
+    list of tuples (title, offset, length)
+        One record per block in the order the blocks end, so a LINK block
+        with nested blocks is the last record. For such a block, only the
+        part in front of its first nested block is indexed.
+
+    """
+    if not sourcefile.isPlainFile(fileName):
+        # compressed files are indexed in memory
+        return indexJCAMPblocks(sourcefile.readSource(fileName))
+    with open(fileName, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return indexJCAMPblocks(mm)
+
+def indexJCAMPblocks(buffer):
     blocks = []
-    tmpBlocks = [""]
-    with open(fileName) as f:
-        lines = f.readlines()
-        for line in lines:
-            if line.startswith("##TITLE="):
-                if "##TITLE=" in tmpBlocks[-1]:
-                    tmpBlocks.append("")
-            tmpBlocks[-1] += line
-            if line.startswith("##END="):
-                blocks.append(tmpBlocks.pop())
-    
+    openBlocks = [] # [title, offset, length] of blocks without ##END= so far
+    for m in jcampBlockLDR.finditer(buffer):
+        if m.group(1) == b"TITLE":
+            if openBlocks and openBlocks[-1][2] is None:
+                # a nested block starts, the outer block is known up to here
+                openBlocks[-1][2] = m.start() - openBlocks[-1][1]
+            openBlocks.append([m.group(2).decode("utf-8", "replace").strip(), m.start(), None])
+        elif openBlocks:
+            end = buffer.find(b"\n", m.end())
+            end = len(buffer) if end < 0 else end + 1
+            title, offset, length = openBlocks.pop()
+            if length is None:
+                length = end - offset
+            blocks.append((title, offset, length))
     return blocks
 
+def readJCAMPblock(fileName, offset, length):
+    """
+    Reads one block indexed by getJCAMPblockIndex from the file.
+    """
+    if not sourcefile.isPlainFile(fileName):
+        return sourcefile.readSource(fileName)[offset:offset + length].decode("utf-8", "replace")
+    with open(fileName, "rb") as f:
+        f.seek(offset)
+        return f.read(length).decode("utf-8", "replace")
+
+jcampDataLDR = re.compile(rb"^##(XYDATA|XYPOINTS|PEAK TABLE|DATA TABLE)=", re.MULTILINE)
+jcampHeaderLDR = re.compile(rb"^##([\$\w\s/-]*)=([^\r\n]*)", re.MULTILINE)
+
+def readJCAMPheader(fileName, offset, length, chunkSize=4096):
+    """
+    Reads the LDRs in front of the data table of a block indexed by
+    getJCAMPblockIndex, without reading the data itself.
+
+    Returns
+    -------
+    dict
+        The first line of every LDR value by its upper case label.
+
+    """
+    header = bytearray()
+    with (open(fileName, "rb") if sourcefile.isPlainFile(fileName) else io.BytesIO(sourcefile.readSource(fileName))) as f:
+        f.seek(offset)
+        while len(header) < length:
+            chunk = f.read(min(chunkSize, length - len(header)))
+            if not chunk:
+                break
+            searchFrom = max(0, len(header) - 16)
+            header += chunk
+            m = jcampDataLDR.search(header, searchFrom)
+            if m:
+                del header[m.start():]
+                break
+    labels = {}
+    for m in jcampHeaderLDR.finditer(header):
+        labels.setdefault(m.group(1).decode("utf-8", "replace").upper(), m.group(2).decode("utf-8", "replace").strip())
+    return labels
+
+ntuplesLDR = re.compile(r"##([\$\w\s/-]*)=(.*)")
+ntuplesXYData = re.compile(r"\(\s*(\w+)\s*\+\+\s*\(\s*(\w+)\s*\.\.\s*\w+\s*\)\s*\)")
+ntuplesXYPoints = re.compile(r"\(\s*(\w+)\s*,?\s*(\w+)\s*\.\.\s*\w+\s*,?\s*\w+\s*\)")
+
+def iterJCAMPNTuples(fileName, encoding="utf-8"):
+    """
+    Reads the pages of a JCAMP-DX ##NTUPLES= file one after another. The
+    file is streamed line by line, only the data table of the current page 
+    is kept in memory.
+
+    Parameters
+    ----------
+    fileName : String
+        The JCAMP-DX file.
+
+    Yields
+    ------
+    header, page : dict
+        header holds the LDRs in front of the first page, the NTUPLES 
+        attributes (SYMBOL, UNITS, FIRST, FACTOR, ...) as lists with one entry per variable.
+        page holds the LDRs of the page, the page value ("PAGE"), the 
+        symbols of the x and y variable ("SYMBOLS") and the decoded arrays 
+        "x" and "y".
+
+    """
+    header = {}
+    page = None
+    dataLines = None
+    with sourcefile.openSource(fileName, "r", encoding, "replace") as f:
+        for line in f:
+            if not line.startswith("##"):
+                if dataLines is not None:
+                    dataLines.append(line)
+                continue
+            m = ntuplesLDR.match(line)
+            if not m:
+                continue
+            label = m.group(1).strip().upper()
+            value = m.group(2).strip()
+            if dataLines is not None:
+                # the data table ends with the next LDR
+                page["x"], page["y"] = decodeNTuplesPage(header, page, dataLines)
+                dataLines = None
+                yield header, page
+                page = None
+            if label == "PAGE":
+                page = {"PAGE": value}
+            elif label == "DATA TABLE" and page is not None:
+                page["DATA TABLE"] = value
+                dataLines = []
+            elif label == "END NTUPLES":
+                break
+            elif label == "END":
+                pass
+            elif page is not None:
+                page[label] = value
+            elif label in ("VAR_NAME", "SYMBOL", "VAR_TYPE", "VAR_FORM", "VAR_DIM", "UNITS", "FIRST", "LAST", "MIN", "MAX", "FACTOR"):
+                header[label] = [v.strip() for v in value.split(",")]
+            else:
+                header.setdefault(label, value)
+        if dataLines is not None:
+            page["x"], page["y"] = decodeNTuplesPage(header, page, dataLines)
+            yield header, page
+
+def getNTuplesAttribute(header, page, label, symbol, default=None):
+    """
+    Returns the value of an NTUPLES attribute (e.g. FIRST or FACTOR) of one 
+    variable as float. Values given in the page take precedence.
+    """
+    values = page.get(label)
+    values = [v.strip() for v in values.split(",")] if values else header.get(label, [])
+    symbols = [s.upper() for s in header.get("SYMBOL", [])]
+    if symbol.upper() not in symbols:
+        return default
+    i = symbols.index(symbol.upper())
+    if i >= len(values) or values[i] == "":
+        return default
+    return float(values[i])
+
+def decodeNTuplesPage(header, page, lines):
+    """
+    Decodes the data table of an NTUPLES page, either 
+    (X++(Y..Y)) as in ##XYDATA= or (XY..XY) pairs as in ##XYPOINTS=.
+
+    Returns
+    -------
+    x, y : numpy arrays
+
+    """
+    variables = page.get("DATA TABLE", "")
+    m = ntuplesXYData.match(variables)
+    if m:
+        xSymbol, ySymbol = m.group(1), m.group(2)
+        page["SYMBOLS"] = (xSymbol, ySymbol)
+        firstX = getNTuplesAttribute(header, page, "FIRST", xSymbol)
+        lastX = getNTuplesAttribute(header, page, "LAST", xSymbol)
+        npoints = int(page["NPOINTS"]) if page.get("NPOINTS") else int(getNTuplesAttribute(header, page, "VAR_DIM", ySymbol, 0))
+        deltaX = None
+        if firstX is not None and lastX is not None and npoints > 1:
+            deltaX = (lastX - firstX) / (npoints - 1)
+        return decodeXYData(lines, deltaX, getNTuplesAttribute(header, page, "FACTOR", xSymbol, 1), getNTuplesAttribute(header, page, "FACTOR", ySymbol, 1), firstX or 0, lastX or 0)
+    m = ntuplesXYPoints.match(variables)
+    if not m:
+        raise ValueError("NTUPLES: unknown data table " + variables)
+    page["SYMBOLS"] = (m.group(1), m.group(2))
+    values = np.array(" ".join(lines).replace(",", " ").replace(";", " ").split(), dtype=np.float64).reshape(-1, 2)
+    return values[:, 0] * getNTuplesAttribute(header, page, "FACTOR", m.group(1), 1), values[:, 1] * getNTuplesAttribute(header, page, "FACTOR", m.group(2), 1)
+
+def readJCAMPNTuplesArray(fileName, out=None):
+    """
+    Reads all pages of a JCAMP-DX ##NTUPLES= file with a common x axis into
+    one 2-D array, page after page.
+
+    Parameters
+    ----------
+    fileName : String
+        The JCAMP-DX file.
+    out : numpy array, optional
+        Preallocated array (pages, points) for the y values, e.g. a 
+        numpy.memmap to keep large series out of memory. The default is 
+        allocated from the VAR_DIM of the file.
+
+    Raises
+    ------
+    ValueError
+        If the number of points of a page does not fit into the array.
+
+    Returns
+    -------
+    pages : list of String
+        The ##PAGE= value of every page.
+    x : numpy array
+        The x values of the first page.
+    out : numpy array
+        The y values, one row per page.
+
+    """
+    pages = []
+    x = None
+    grow = False
+    for header, page in iterJCAMPNTuples(fileName):
+        if out is None:
+            # the page variable is given by ##PAGE=T=..., its VAR_DIM is the number of pages
+            pageSymbol = page["PAGE"].split("=")[0] if "=" in page["PAGE"] else ""
+            nPages = int(getNTuplesAttribute(header, page, "VAR_DIM", pageSymbol, 0) or 1) if pageSymbol else 1
+            out = np.empty((nPages, len(page["y"])))
+            grow = True
+        if len(pages) >= out.shape[0]:
+            if not grow:
+                raise ValueError("NTUPLES: more than " + str(out.shape[0]) + " pages")
+            # VAR_DIM of the pages is missing or wrong
+            out = np.concatenate((out, np.empty_like(out)))
+        if len(page["y"]) != out.shape[1]:
+            raise ValueError("NTUPLES: page " + page["PAGE"] + " has " + str(len(page["y"])) + " points instead of " + str(out.shape[1]))
+        out[len(pages)] = page["y"]
+        if x is None:
+            x = page["x"]
+        pages.append(page["PAGE"])
+    if out is None:
+        return pages, np.array([]), np.empty((0, 0))
+    return pages, x, out[:len(pages)]
+
+def getJCAMPblockFromFile(fileName):
+    return [readJCAMPblock(fileName, offset, length) for title, offset, length in getJCAMPblockIndex(fileName)]
+
+jcampLDR = re.compile(r"^[ \t]*##(?:([\$\w \t/-]*)=)?", re.MULTILINE)
+jcampDataTables = ("XYDATA", "XYPOINTS", "PEAK TABLE", "DATA TABLE")
+
+# LDRs, which are stored as they are in the metadata of a spectrum: label: (section, key)
+jcampMetadataLDRs = {
+    "DATA TYPE": ("Core Data", "Data Type"),
+    "DATATYPE": ("Core Data", "Data Type"),
+    "ORIGIN": ("Core Data", "Origin"),
+    "OWNER": ("Core Data", "Owner"),
+    "RESOLUTION": ("Spectral Parameters", "Resolution"),
+    "SOURCE REFERENCE": ("Notes", "Source Reference"),
+    "CROSS REFERENCE": ("Notes", "Cross Reference"),
+    "SAMPLE DESCRIPTION": ("Sample Information", "Sample Description"),
+    "CAS NAME": ("Sample Information", "CAS Name"),
+    "IUPAC NAME": ("Sample Information", "IUPAC Name"),
+    "NAMES": ("Sample Information", "Names"),
+    "MOLFORM": ("Sample Information", "Molform"),
+    "CAS REGISTRY NO": ("Sample Information", "CAS Registry No"),
+    "WISWESSER": ("Sample Information", "Wiswesser"),
+    "BEILSTEIN LAWSON NO": ("Sample Information", "Beilstein Lawson No"),
+    "MP": ("Sample Information", "Melting Point"),
+    "BP": ("Sample Information", "Boiling Point"),
+    "REFRACTIVE INDEX": ("Sample Information", "Refractive Index"),
+    "DENSITY": ("Sample Information", "Density"),
+    "MW": ("Sample Information", "Molecular Weight"),
+    "CONCENTRATIONS": ("Sample Information", "Concentrations"),
+    "SPECTROMETER": ("Equipment Information", "Spectrometer"),
+    "DATA SYSTEM": ("Equipment Information", "Spectrometer"),
+    "SPECTROMETER/DATA SYSTEM": ("Equipment Information", "Spectrometer"),
+    "INSTRUMENTAL PARAMETERS": ("Equipment Information", "Instrumental Parameters"),
+    "SAMPLING PROCEDURE": ("Sampling Information", "Sampling Procedure"),
+    "STATE": ("Sampling Information", "State"),
+    "PATH LENGTH": ("Sampling Information", "Path Length"),
+    "PRESSURE": ("Sampling Information", "Pressure"),
+    "TEMPERATURE": ("Sampling Information", "Temperature"),
+    "DATA PROCESSING": ("Sampling Information", "Data Processing"),
+}
+
+def tokenizeJCAMPDX(s):
+    """
+    Splits a JCAMP-DX block into its Labeled Data Records (LDR) in a single pass.
+    An LDR starts with ##LABEL= at the beginning of a line and ends with the next line starting with ##.
+
+    Parameters
+    ----------
+    s : str
+        The JCAMP-DX block.
+
+    Yields
+    ------
+    tuple
+        (label, start, end): the upper case label and the span of the value in s, including its continuation lines.
+        Text outside of an LDR is yielded with the label None.
+
+    """
+    label = None
+    start = 0
+    for m in jcampLDR.finditer(s):
+        if label is not None or m.start() > start:
+            yield label, start, m.start()
+        if m.group(1) is None:
+            # not a valid LDR, e.g. a comment line starting with ##
+            label = None
+            start = m.start()
+        else:
+            label = m.group(1).upper()
+            start = m.end()
+    if label is not None or len(s) > start:
+        yield label, start, len(s)
+
+def getLDRValue(s, start, end):
+    """
+    Returns the value of an LDR yielded by tokenizeJCAMPDX.
+    The lines are stripped and joined by \\r\\n.
+
+    """
+    return "\r\n".join(line.strip() for line in s[start:end].splitlines())
+
 def loadJCAMPlinkBlock(s):
     res = {}
-    ldr = re.compile("##([\$\w\s/-]*)=(.*)$", re.IGNORECASE)
-    lines = s.splitlines()
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if line.startswith("##"):
-            # It is an Labeled Data Record (LDR), which stops at the next LDR!
-            m = ldr.match(line)
-            if m:
-                label = m.group(1).upper()
-                data = m.group(2).strip()
-                if label != "END":
-                    while not lines[i+1].startswith("##"):
-                        data += "\r\n" + lines[i+1].strip()
-                        i += 1
-                if label =="TITLE":
-                    res['Title'] = data
-                elif label == "BLOCKS":
-                    res['Blocks'] = int(data)
-                elif label == "$PAGES":
-                    res['Pages'] = int(data)
-                elif label == "SAMPLE DESCRIPTION":
-                    res["Sample Description"] = data
-                elif label == "END":
-                    break
-        i += 1
+    for label, start, end in tokenizeJCAMPDX(s):
+        if label == "END":
+            break
+        if label =="TITLE":
+            res['Title'] = getLDRValue(s, start, end)
+        elif label == "BLOCKS":
+            res['Blocks'] = int(getLDRValue(s, start, end))
+        elif label == "$PAGES":
+            res['Pages'] = int(getLDRValue(s, start, end))
+        elif label == "SAMPLE DESCRIPTION":
+            res["Sample Description"] = getLDRValue(s, start, end)
     return res
 
+def formatJCAMPValues(values):
+    """
+    Formats x or y values for ##XYDATA=(XY) as str(round(value, 6)) would, 
+    but for a whole array at once.
+
+    Returns
+    -------
+    list of String
+
+    """
+    if not isinstance(values, np.ndarray):
+        return [str(round(v, 6)) for v in values]
+    values = np.round(values, 6)
+    if values.dtype == np.float64 or values.dtype.kind in "iu":
+        # repr of the python numbers is the same as str of the numpy scalars
+        return list(map(repr, values.tolist()))
+    return [str(v) for v in values]
+
 def checkLength(s):
     if len(s) < 80:
         return s
@@ -618,3 +1149,251 @@ def checkLength(s):
             else:
                 r += s[78 * line: 78*line + 78] + "\r\n"
     return r.rstrip()
+
+# characters of a text file parsed at once by readFreeTextColumns
+freeTextChunkSize = 1 << 20
+# factor by which the arrays of the columns grow, when a chunk does not fit
+freeTextGrowth = 1.25
+
+def getFreeTextDelimiter(options):
+    # the delimiter as argument of str.split and np.loadtxt, None for any whitespace
+    delimiter = options.get("Column Delimiter", "")
+    if delimiter in ("", "any whitespace"):
+        return None
+    return delimiter
+
+# column delimiter and decimal separator tried by sniffFreeTextOptions, in the order of preference
+freeTextFormats = [(",", "."), (";", "."), (";", ","), ("any whitespace", "."), ("any whitespace", ",")]
+
+def sniffFreeTextOptions(head, commentChar="#"):
+    """
+    Returns free text settings (see Spectrum.openFreeText) for the file 
+    beginning with head, e.g. to import text files without the open dialog.
+    The column delimiter and the decimal separator are the ones, which 
+    split the most lines of head into the same number (at least two) of 
+    numbers.
+
+    Parameters
+    ----------
+    head : String
+        The beginning of the file, the last line may be incomplete.
+
+    Returns
+    -------
+    dict
+
+    """
+    lines = head.splitlines()[:-1] if "\n" in head else head.splitlines()
+    lines = [line for line in lines if line.strip() and not line.lstrip().startswith(commentChar)]
+    best = freeTextFormats[-2]
+    bestCount = 0
+    for delimiter, decimal in freeTextFormats:
+        counts = {}
+        for line in lines:
+            fields = splitFreeTextLine(line, getFreeTextDelimiter({"Column Delimiter": delimiter}))
+            try:
+                [float(field.replace(decimal, ".")) for field in fields]
+            except ValueError:
+                continue
+            if len(fields) >= 2:
+                counts[len(fields)] = counts.get(len(fields), 0) + 1
+        count = max(counts.values(), default=0)
+        if count > bestCount:
+            best = (delimiter, decimal)
+            bestCount = count
+    options = {}
+    options["Spectrum Type"] = "undefined"
+    options["File Encoding"] = "utf-8"
+    options["Comment Character"] = commentChar
+    options["Column Delimiter"], options["Decimal Separator"] = best
+    options["skip Rows"] = 0
+    return options
+
+def splitFreeTextLine(line, delimiter):
+    # the fields of a line without the empty fields of a trailing delimiter
+    fields = [field.strip() for field in line.strip().split(delimiter)]
+    while len(fields) > 1 and not fields[-1]:
+        fields.pop()
+    return fields
+
+def readFreeTextColumns(f, options, numColumns=2, progress=None):
+    """
+    Reads the first columns of a text file with numbers (e.g. CSV) in 
+    chunks of freeTextChunkSize characters. The numbers of a chunk are 
+    parsed by np.loadtxt at once; only a chunk with malformed lines is 
+    parsed line by line, to skip these lines.
+    The text lines before the first line with numbers are comments, the 
+    last of them is the header with the names of the columns.
+    Only one chunk of text is kept in memory, no list of all lines. The 
+    values are appended to one array per column, which grows in place, so 
+    there is no second copy of the values.
+
+    Parameters
+    ----------
+    f : file object
+        Opened for reading text.
+    options : dict
+        The free text settings: "Comment Character", "Column Delimiter" 
+        (a character or "any whitespace"), "Decimal Separator" and 
+        "skip Rows", see Spectrum.openFreeText.
+    numColumns : int or None, optional
+        Number of columns read, None for all columns of the first line with 
+        numbers. Empty lines are skipped, lines with less columns are 
+        malformed. The default is 2.
+    progress : function, optional
+        progress(done, points) is called after every chunk with the number 
+        of characters read and of lines with numbers parsed. Reading is 
+        cancelled if it returns False.
+
+    Returns
+    -------
+    columns : list of numpy arrays or None
+        The values, one contiguous array per column of the file. None if 
+        cancelled.
+    comments : list of String
+        The skipped rows and the comment lines.
+    malformed : list
+        (line number, line) of the lines with values which are not numbers 
+        or with less columns.
+    header : list of String
+        The names of the columns, empty if there is no header.
+
+    """
+    commentChar = options.get("Comment Character", "")
+    delimiter = getFreeTextDelimiter(options)
+    decimal = options.get("Decimal Separator", ".")
+    # the separator can be replaced in the whole chunk, if it is not the delimiter
+    replaceDecimal = decimal not in ("", ".") and decimal != delimiter
+    # comment lines and lines of whitespace, removed before np.loadtxt
+    skipPattern = re.compile(r"^[^\S\n]*(" + re.escape(commentChar) + r".*)?$" if commentChar else r"^[^\S\n]+$", re.MULTILINE)
+    comments = []
+    malformed = []
+    lineNumber = 0
+    done = 0
+    points = 0
+    for i in range(int(options.get("skip Rows", 0))):
+        line = f.readline()
+        if not line:
+            break
+        comments.append(line.strip())
+        lineNumber += 1
+        done += len(line)
+
+    def isNumbers(fields):
+        try:
+            [float(field.replace(decimal, ".") if replaceDecimal else field) for field in fields]
+        except ValueError:
+            return False
+        return True
+
+    # the comments and the header before the first line with numbers
+    header = []
+    headerLine = None
+    numComments = len(comments)
+    rest = ""
+    data = f.read(freeTextChunkSize)
+    done += len(data)
+    lines = data.split("\n")
+    # the last line may be incomplete, if the file is longer than the chunk
+    for i, line in enumerate(lines if len(data) < freeTextChunkSize else lines[:-1]):
+        if not line.strip():
+            continue
+        if commentChar and line.strip().startswith(commentChar):
+            comments.append(line.strip())
+            continue
+        if commentChar:
+            # e.g. 1,2 # note is the first line with numbers, not the header
+            line = line.split(commentChar, 1)[0]
+        fields = splitFreeTextLine(line, delimiter)
+        if len(fields) >= 2 and isNumbers(fields if numColumns is None else fields[:numColumns]):
+            if numColumns is None:
+                numColumns = len(fields)
+            rest = "\n".join(lines[i:])
+            lineNumber += i
+            break
+        if headerLine is not None:
+            comments.append(headerLine)
+        headerLine = line.strip()
+        header = [field.strip('"') for field in fields]
+    else:
+        # no numbers in the first chunk, it is parsed line by line below
+        rest = data
+        header = []
+        del comments[numComments:]
+    if numColumns is None:
+        numColumns = 2
+    columns = [np.empty(0) for i in range(numColumns)]
+
+    def appendValues(values):
+        # ndarray.resize reallocates the memory, large arrays are usually extended without copying them
+        if points + len(values) > len(columns[0]):
+            capacity = max(int(len(columns[0]) * freeTextGrowth), points + len(values))
+            for column in columns:
+                column.resize(capacity, refcheck=False)
+        for column, columnValues in zip(columns, values.T):
+            column[points:points + len(values)] = columnValues
+
+    def loadNumbers(numbers):
+        # all lines of a chunk at once, None if there are malformed lines
+        if not numbers or numbers.isspace():
+            return np.empty((0, numColumns))
+        try:
+            return np.loadtxt(io.StringIO(numbers), delimiter=delimiter, usecols=range(numColumns), ndmin=2, comments=commentChar or None, dtype=float)
+        except ValueError:
+            return None
+
+    def parseLines(text, firstLine):
+        # the slow way for chunks with malformed lines
+        rows = []
+        for i, line in enumerate(text.split("\n")):
+            if commentChar:
+                line = line.split(commentChar, 1)[0]
+            line = line.strip()
+            if not line:
+                continue
+            columns = line.split(delimiter)
+            if len(columns) < numColumns:
+                malformed.append((firstLine + i + 1, line))
+                continue
+            try:
+                if replaceDecimal:
+                    rows.append([float(value.replace(decimal, ".")) for value in columns[:numColumns]])
+                else:
+                    rows.append([float(value) for value in columns[:numColumns]])
+            except ValueError:
+                malformed.append((firstLine + i + 1, line))
+        return np.array(rows, dtype=float).reshape(-1, numColumns)
+
+    while True:
+        data = f.read(freeTextChunkSize)
+        done += len(data)
+        text = rest + data
+        if data:
+            # the last line may be incomplete, it is parsed with the next chunk
+            end = text.rfind("\n") + 1
+            text, rest = text[:end], text[end:]
+        if text:
+            numbers = text
+            # the regular expression is slower than np.loadtxt, so it is used only if necessary
+            cleaned = bool(commentChar) and commentChar in text
+            if cleaned:
+                comments.extend(match.group(1).strip() for match in skipPattern.finditer(text) if match.group(1))
+                numbers = skipPattern.sub("", text)
+            if replaceDecimal:
+                numbers = numbers.replace(decimal, ".")
+            values = loadNumbers(numbers)
+            if values is None and not cleaned:
+                # lines of whitespace
+                values = loadNumbers(skipPattern.sub("", numbers))
+            if values is None:
+                values = parseLines(text, lineNumber)
+            appendValues(values)
+            points += len(values)
+            lineNumber += text.count("\n")
+        if progress and progress(done, points) is False:
+            return None, comments, malformed, header
+        if not data:
+            break
+    for column in columns:
+        column.resize(points, refcheck=False)
+    return columns, comments, malformed, header
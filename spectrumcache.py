@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of decoded spectra.
+
+The spectra read from a file are stored in the cache directory, the x and y
+values as .npy files, all other attributes as a pickled blob. An entry is
+identified by the path of the source file and a tag (e.g. the position of a
+JCAMP-DX block or the reader options); it is only used while the size and
+modification time of the source file are unchanged. Opening a cached file
+again maps the arrays into memory instead of parsing the file.
+
+The cache directory ("Cache Directory"), its maximum size in MB
+("Cache Size") and whether the cache is used at all ("Use Cache") are read
+from the settings of pySpective. If the cache grows beyond its size, the
+least recently used entries are removed.
+"""
+
+import os
+import copy
+import shutil
+import pickle
+import hashlib
+import tempfile
+
+import numpy as np
+from PyQt6.QtCore import QSettings, QStandardPaths
+
+# default maximum size of the cache in MB
+defaultCacheSize = 1024
+
+# size of the cache directory in bytes, determined at the first store
+usedSize = None
+
+def getSettings():
+    return QSettings('TUBAF', 'pySpective')
+
+def isEnabled():
+    return getSettings().value("Use Cache", True, type=bool)
+
+def getCacheDir():
+    cacheDir = getSettings().value("Cache Directory")
+    if not cacheDir:
+        cacheDir = os.environ.get("XDG_CACHE_HOME") or QStandardPaths.writableLocation(QStandardPaths.StandardLocation.GenericCacheLocation)
+        cacheDir = os.path.join(cacheDir, "pySpective", "spectra")
+    return cacheDir
+
+def getCacheSize():
+    return int(getSettings().value("Cache Size", defaultCacheSize)) * 1024 * 1024
+
+def getEntryDir(fileName, tag=""):
+    key = hashlib.sha1((os.path.abspath(fileName) + "\0" + tag).encode("utf-8")).hexdigest()
+    return os.path.join(getCacheDir(), key)
+
+def getFileIdentity(fileName):
+    stat = os.stat(fileName)
+    return [os.path.abspath(fileName), stat.st_size, stat.st_mtime_ns]
+
+def load(fileName, tag=""):
+    """
+    Loads the cached spectra of a file.
+
+    Parameters
+    ----------
+    fileName : String
+        The source file of the spectra.
+    tag : String, optional
+        Identifies the entry together with the file name.
+
+    Returns
+    -------
+    list or None
+        The spectra, None if there is no valid entry. The x and y values
+        are memory mapped copy-on-write, so the cache is never changed.
+
+    """
+    if not isEnabled():
+        return None
+    entryDir = getEntryDir(fileName, tag)
+    blobName = os.path.join(entryDir, "spectra.pkl")
+    try:
+        with open(blobName, "rb") as f:
+            entry = pickle.load(f)
+        if entry["Source"] != getFileIdentity(fileName):
+            # the source file has been changed
+            shutil.rmtree(entryDir, ignore_errors=True)
+            return None
+        spectra = entry["Spectra"]
+        for i, s in enumerate(spectra):
+            s.x = np.load(os.path.join(entryDir, str(i) + "x.npy"), mmap_mode="c")
+            s.y = np.load(os.path.join(entryDir, str(i) + "y.npy"), mmap_mode="c")
+        os.utime(blobName) # the access time for the LRU order
+    except (OSError, EOFError, KeyError, ValueError, pickle.UnpicklingError, AttributeError):
+        return None
+    return spectra
+
+def store(fileName, spectra, tag=""):
+    """
+    Stores the spectra of a file in the cache and removes the least recently
+    used entries if the cache is too large.
+
+    Returns
+    -------
+    bool
+        True if the spectra are stored.
+
+    """
+    if not isEnabled():
+        return False
+    entryDir = getEntryDir(fileName, tag)
+    tempDir = None
+    try:
+        os.makedirs(getCacheDir(), exist_ok=True)
+        # the entry is written to a temporary directory first, so an entry is always complete
+        tempDir = tempfile.mkdtemp(dir=getCacheDir(), prefix=".")
+        entry = {"Source": getFileIdentity(fileName), "Spectra": []}
+        for i, s in enumerate(spectra):
+            np.save(os.path.join(tempDir, str(i) + "x.npy"), np.asarray(s.x))
+            np.save(os.path.join(tempDir, str(i) + "y.npy"), np.asarray(s.y))
+            s = copy.copy(s)
+            s.x = None
+            s.y = None
+            entry["Spectra"].append(s)
+        with open(os.path.join(tempDir, "spectra.pkl"), "wb") as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        shutil.rmtree(entryDir, ignore_errors=True)
+        os.replace(tempDir, entryDir)
+        size = sum(f.stat().st_size for f in os.scandir(entryDir))
+    except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+        print("Could not cache " + fileName + ": " + str(e))
+        if tempDir:
+            shutil.rmtree(tempDir, ignore_errors=True)
+        return False
+    global usedSize
+    if usedSize is None:
+        evict()
+    else:
+        usedSize += size
+        if usedSize > getCacheSize():
+            evict()
+    return True
+
+def evict(maxSize=None):
+    """
+    Removes the least recently used entries until the cache is smaller
+    than maxSize bytes (default: the "Cache Size" setting).
+    """
+    if maxSize is None:
+        maxSize = getCacheSize()
+    entries = []
+    total = 0
+    with os.scandir(getCacheDir()) as it:
+        for entry in it:
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                lastUsed = os.stat(os.path.join(entry.path, "spectra.pkl")).st_mtime
+            except OSError:
+                continue
+            entries.append((lastUsed, size, entry.path))
+            total += size
+    entries.sort()
+    for lastUsed, size, path in entries:
+        if total <= maxSize:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+    global usedSize
+    usedSize = total
+
+def clear():
+    global usedSize
+    shutil.rmtree(getCacheDir(), ignore_errors=True)
+    usedSize = 0
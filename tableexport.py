@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Export of pages and documents as text tables (CSV or TSV) for other programs.
+
+A wide table has one x column and one y column per spectrum. If the spectra
+do not share their x values, they are interpolated linearly to the x values
+of the spectrum with the most points; outside of its range a spectrum has
+empty cells. A long (tidy) table has one row per point: page, spectrum, x
+and y, with the own x values of every spectrum.
+
+The values are formatted block by block with NumPy, so large pages are
+exported without a Python loop over the single values.
+"""
+
+import numpy as np
+
+import spectivedocument
+
+# number of table rows formatted at once
+chunkSize = 4096
+
+def getDelimiter(fileName):
+    # tab for .tsv and .txt files, comma for all others
+    if fileName.lower().endswith((".tsv", ".txt")):
+        return "\t"
+    return ","
+
+def quoteField(text, delimiter):
+    # quotes a text field like the csv module does
+    if delimiter in text or '"' in text or "\n" in text or "\r" in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+def formatTable(table, delimiter=",", digits=10):
+    """
+    Formats a 2D numpy array as lines of text, NaN as empty cell.
+
+    Parameters
+    ----------
+    table : numpy array
+        Rows and columns of the table.
+    delimiter : String, optional
+        The column delimiter. The default is ",".
+    digits : int, optional
+        Number of significant digits. The default is 10.
+
+    Returns
+    -------
+    String
+
+    """
+    # one format operation for the whole block is much faster than formatting the values one by one
+    rows, columns = table.shape
+    line = delimiter.join(["%." + str(digits) + "g"] * columns) + "\n"
+    text = (line * rows) % tuple(table.ravel().tolist())
+    if np.isnan(table).any():
+        text = text.replace("nan", "")
+    return text
+
+def getCommonX(spectra):
+    """
+    Returns the x values of a wide table: the x values shared by all spectra
+    or, if they differ, the x values of the spectrum with the most points.
+    """
+    xs = [np.asarray(s.x, dtype=np.float64) for s in spectra]
+    if all(np.array_equal(x, xs[0]) for x in xs[1:]):
+        return xs[0]
+    return max(xs, key=len)
+
+def writeWideTable(f, spectra, labels, xLabel="x", delimiter=",", x=None, digits=10):
+    """
+    Writes spectra as wide table to an open text file.
+
+    Parameters
+    ----------
+    f : file object
+        Opened for writing text.
+    spectra : list
+        The spectra, one y column each.
+    labels : list of String
+        The column headers of the spectra.
+    xLabel : String, optional
+        The header of the x column. The default is "x".
+    delimiter : String, optional
+        The column delimiter. The default is ",".
+    x : numpy array, optional
+        The x values of the table. The default is None, see getCommonX.
+    digits : int, optional
+        Number of significant digits. The default is 10.
+
+    """
+    if x is None:
+        x = getCommonX(spectra)
+    x = np.asarray(x, dtype=np.float64)
+    # spectra with other x values are interpolated, np.interp needs increasing x values
+    sources = []
+    for s in spectra:
+        sx = np.asarray(s.x, dtype=np.float64)
+        sy = np.asarray(s.y, dtype=np.float64)
+        if np.array_equal(sx, x):
+            sources.append((None, sy))
+        else:
+            order = np.argsort(sx, kind="stable")
+            sources.append((sx[order], sy[order]))
+    f.write(delimiter.join(quoteField(label, delimiter) for label in [xLabel] + list(labels)) + "\n")
+    columns = len(spectra) + 1
+    for start in range(0, len(x), chunkSize):
+        xChunk = x[start:start + chunkSize]
+        table = np.empty((len(xChunk), columns))
+        table[:, 0] = xChunk
+        for i, (sx, sy) in enumerate(sources):
+            if sx is None:
+                table[:, i + 1] = sy[start:start + chunkSize]
+            else:
+                table[:, i + 1] = np.interp(xChunk, sx, sy, left=np.nan, right=np.nan)
+        f.write(formatTable(table, delimiter, digits))
+
+def writeLongTable(f, spectra, labels, pageLabels=None, delimiter=",", digits=10):
+    """
+    Writes spectra as long table (page, spectrum, x, y) to an open text
+    file. See writeWideTable for the parameters. The page column is only
+    written, if pageLabels (one for every spectrum) is given.
+    """
+    header = ["spectrum", "x", "y"]
+    if pageLabels is not None:
+        header.insert(0, "page")
+    f.write(delimiter.join(header) + "\n")
+    for i, s in enumerate(spectra):
+        prefix = quoteField(labels[i], delimiter) + delimiter
+        if pageLabels is not None:
+            prefix = quoteField(pageLabels[i], delimiter) + delimiter + prefix
+        x = np.asarray(s.x, dtype=np.float64)
+        y = np.asarray(s.y, dtype=np.float64)
+        for start in range(0, len(x), chunkSize):
+            lines = formatTable(np.column_stack((x[start:start + chunkSize], y[start:start + chunkSize])), delimiter, digits)
+            f.write(prefix + lines[:-1].replace("\n", "\n" + prefix) + "\n")
+
+def exportPage(page, fileName, layout="wide", delimiter=None, digits=10):
+    """
+    Exports the spectra of a page as table.
+
+    Parameters
+    ----------
+    page : spectivePage
+    fileName : String
+        The table file.
+    layout : String, optional
+        "wide" or "long". The default is "wide".
+    delimiter : String, optional
+        The column delimiter. The default is None, tab for .tsv and .txt
+        files, comma otherwise.
+    digits : int, optional
+        Number of significant digits. The default is 10.
+
+    Returns
+    -------
+    bool
+        True if the table is written.
+
+    """
+    return exportSpectra(fileName, [(page.figureData['PageTitle'], page, s) for s in page.spectra], layout, delimiter, digits, False)
+
+def exportDocument(document, fileName, layout="wide", delimiter=None, digits=10):
+    """
+    Exports the spectra of all pages of a document as one table. See
+    exportPage for the parameters.
+    """
+    # pages without title are named by their number
+    return exportSpectra(fileName, [(page.figureData['PageTitle'] or "Page " + str(i + 1), page, s) for i, page in enumerate(document.pages) for s in page.spectra], layout, delimiter, digits, True)
+
+def exportSpectra(fileName, spectra, layout, delimiter, digits, withPages):
+    # spectra: (page title, page, spectrum) for every spectrum of the table
+    if not spectra:
+        print("No spectra to export")
+        return False
+    if delimiter is None:
+        delimiter = getDelimiter(fileName)
+    pageLabels = [pageLabel for pageLabel, page, s in spectra]
+    xLabel = spectra[0][1].figureData['XLabel'] or "x"
+    spectra = [s for pageLabel, page, s in spectra]
+    labels = [s.title for s in spectra]
+    try:
+        with spectivedocument.atomicWrite(fileName) as f:
+            if layout == "long":
+                writeLongTable(f, spectra, labels, pageLabels if withPages else None, delimiter, digits)
+            else:
+                if withPages:
+                    labels = [pageLabel + ": " + label for pageLabel, label in zip(pageLabels, labels)]
+                writeWideTable(f, spectra, labels, xLabel, delimiter, digits=digits)
+    except OSError as e:
+        print("Could not export " + fileName + ": " + str(e))
+        return False
+    return True
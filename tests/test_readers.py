@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests of the reader registry (readers.py).
+"""
+
+import os
+import sys
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import readers
+
+def test_zip_archive_with_unreadable_member(tmp_path):
+    # members which are unknown or can not be read are skipped, the other members are opened
+    fileName = str(tmp_path / "measurements.zip")
+    with zipfile.ZipFile(fileName, "w") as archive:
+        archive.writestr("a.csv", "x,y\n1,2\n3,4\n")
+        archive.writestr("b.bin", bytes(range(256)) * 4)
+        archive.writestr("c.txt", "no numbers\nin this file\n")
+    res = readers.openZipArchive(fileName)
+    assert [member for member, spectra in res] == ["a.csv", "b.bin", "c.txt"]
+    spectra = dict(res)
+    assert len(spectra["a.csv"]) == 1
+    assert list(spectra["a.csv"][0].x) == [1, 3]
+    assert list(spectra["a.csv"][0].y) == [2, 4]
+    assert spectra["b.bin"] == []
+    assert spectra["c.txt"] == []
+
+def writeAMETEK(fileName, numFilters, trailingTab):
+    # calibration lines, five header lines and the counts of 20 channels of every filter
+    end = "\t\n" if trailingTab else "\n"
+    lines = ["Kal1\t" + "\t".join("0,%d" % (i + 1) for i in range(numFilters)) + end,
+             "Kal2\t" + "\t".join("0,0%d" % (i + 1) for i in range(numFilters)) + end]
+    lines += ["Header %d\t" % i + "\t".join("Filter %d" % (j + 1) for j in range(numFilters)) + end for i in range(5)]
+    lines += ["%d\t" % channel + "\t".join("%d" % (channel * (j + 1)) for j in range(numFilters)) + end for channel in range(1, 21)]
+    with open(fileName, "w") as f:
+        f.write("".join(lines))
+
+def test_ametek_with_one_and_three_filters(tmp_path):
+    for numFilters, trailingTab in ((1, True), (3, False)):
+        fileName = str(tmp_path / ("ametek%d.txt" % numFilters))
+        writeAMETEK(fileName, numFilters, trailingTab)
+        assert readers.detectFileType(fileName) == "AMETEK-XRF TXT-Export"
+        spectra = readers.openFile(fileName)
+        assert len(spectra) == numFilters
+        assert [sp.title for sp in spectra] == ["Spectrum with filter %d" % (j + 1) for j in range(numFilters)]
+        assert list(spectra[-1].y) == [channel * numFilters for channel in range(1, 21)]